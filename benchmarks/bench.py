@@ -0,0 +1,324 @@
+"""Benchmarki wydajności syntezy, odszumiania i analizy (offline).
+
+Przykład:
+    python -m benchmarks.bench --quick --save-baseline
+    python -m benchmarks.bench --quick
+
+Każdy przypadek mierzony jest jako przepustowość w próbkach na sekundę
+(najlepszy z --repeat pomiarów po jednym przebiegu rozgrzewającym).
+Wyniki zapisywane są jako JSON; porównanie z zapisaną linią bazową oznacza
+przypadki wolniejsze o więcej niż --tolerance jako regresje (kod wyjścia 1).
+Linia bazowa zależy od maszyny - należy ją tworzyć na tym samym sprzęcie.
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import scipy
+import scipy.signal as sig
+
+from core.physis import PhysicalModelOrgan, midi_to_freq
+from core.polyphony import OrganEngine
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Pełna macierz; --quick bierze tylko pierwszą wartość z każdej listy
+SAMPLE_RATES = [44100, 22050, 48000, 96000]
+DURATIONS = [1.0, 0.5, 5.0]
+WINDOW_SIZES = [4096, 1024, 2048, 8192]
+
+Case = collections.namedtuple('Case', 'name samples run')
+
+
+def synthetic_note(sample_rate, duration, freq=220.0, reverb_time=0.0, seed=0):
+    """Sygnał testowy: harmoniczne z obwiednią i opcjonalnym ogonem pogłosu.
+
+    Pogłos to splot z wykładniczo gasnącym szumem (czas zaniku reverb_time),
+    więc denoiser ma do usunięcia realistyczne rozmycie widma.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    dry = sum(np.sin(2 * np.pi * freq * k * t) / k for k in range(1, 9) if freq * k < sample_rate / 2)
+    dry = dry * np.minimum(t / 0.05, 1.0)
+    if reverb_time > 0:
+        ir_t = np.arange(int(reverb_time * sample_rate)) / sample_rate
+        impulse = rng.standard_normal(len(ir_t)) * np.exp(-6.9 * ir_t / reverb_time)
+        dry = sig.fftconvolve(dry, impulse)[:len(t)]
+    return dry / np.max(np.abs(dry))
+
+
+def synthesis_cases(sample_rates, durations):
+    cases = []
+    for sample_rate in sample_rates:
+        for duration in durations:
+            organ = PhysicalModelOrgan(sample_rate)
+            params = organ.params
+            freq = midi_to_freq(60)
+            n = int(duration * sample_rate)
+            tag = f"sr={sample_rate}/dur={duration}"
+            harmonic = organ.harmonic_gen.generate(freq, n, params)
+            noise = organ.noise_gen.generate(harmonic, n, params)
+
+            cases += [
+                Case(f"synthesis/render_note/{tag}", n,
+                     lambda o=organ, f=freq, d=duration: o.render_note(f, d)),
+                Case(f"synthesis/harmonic/{tag}", n,
+                     lambda o=organ, f=freq, n=n, p=params: o.harmonic_gen.generate(f, n, p)),
+                Case(f"synthesis/noise/{tag}", n,
+                     lambda o=organ, h=harmonic, n=n, p=params: o.noise_gen.generate(h, n, p)),
+                Case(f"synthesis/resonator/{tag}", n,
+                     lambda o=organ, h=harmonic, z=noise, n=n, p=params: o.resonator.process(h, z, p, n)),
+            ]
+
+        # Renderowanie wsadowe - próbki liczone dla wszystkich nut
+        freqs = [midi_to_freq(note) for note in range(36, 97, 6)]
+        duration = durations[0]
+        cases.append(Case(f"synthesis/render_notes/sr={sample_rate}/dur={duration}/notes={len(freqs)}",
+                          len(freqs) * int(duration * sample_rate),
+                          lambda o=organ, fs=freqs, d=duration: o.render_notes(fs, d)))
+
+        # Akord na kilku registrach przez OrganEngine - próbki szyny, więc
+        # przepustowość powyżej sample_rate oznacza szybciej niż w czasie rzeczywistym
+        blocks = int(duration * sample_rate) // 512
+        cases.append(Case(f"synthesis/polyphony/sr={sample_rate}/dur={duration}/chord=6x3",
+                          blocks * 512, lambda sr=sample_rate, b=blocks: _render_chord(sr, b)))
+    return cases
+
+
+def _render_chord(sample_rate, blocks, notes=(48, 52, 55, 60, 64, 67)):
+    """Akord C-dur (6 nut) na trzech registrach - 18 głosów; note-off w połowie"""
+    base = PhysicalModelOrgan(sample_rate).params
+    engine = OrganEngine(sample_rate, block_size=512)
+    engine.set_registration({
+        'principal': base,
+        'flute': dict(base, GAIN2=0.3, NGAIN=0.2),
+        'reed': dict(base, GAIN1=1.5, CLIP1=0.9),
+    })
+    for note in notes:
+        engine.note_on(note)
+    for block in range(blocks):
+        if block == blocks // 2:
+            engine.all_notes_off()
+        engine.render_block()
+
+
+def _import_denoiser():
+    try:
+        from tools.denoising import PipeDenoiser
+    except ImportError as e:
+        print(f"Pominięto benchmarki odszumiania: {e}")
+        return None
+    return PipeDenoiser
+
+
+def _write_note_set(root, sample_rate, duration, r_dirs=('R0', 'R1')):
+    """Zestaw plików w układzie A0/R*; zwraca (ścieżka A0, ścieżki R)"""
+    import soundfile as sf
+
+    name = f"060-c-{sample_rate}-{duration}.wav"
+    a0_path = os.path.join(root, 'A0', name)
+    os.makedirs(os.path.dirname(a0_path), exist_ok=True)
+    sf.write(a0_path, synthetic_note(sample_rate, duration), sample_rate)
+
+    r_paths = []
+    for seed, r_dir in enumerate(r_dirs, 1):
+        path = os.path.join(root, r_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sf.write(path, synthetic_note(sample_rate, duration, reverb_time=1.5, seed=seed), sample_rate)
+        r_paths.append(path)
+    return a0_path, r_paths
+
+
+def _process_note(denoiser, a0_path, r_paths, output_path):
+    if not denoiser.process_note(a0_path, r_paths, output_path):
+        raise RuntimeError(f"process_note nie powiodło się dla {a0_path}")
+
+
+def denoising_cases(sample_rates, durations, window_sizes, workdir):
+    PipeDenoiser = _import_denoiser()
+    if PipeDenoiser is None:
+        return []
+
+    cases = []
+    for sample_rate in sample_rates:
+        for duration in durations:
+            audio = synthetic_note(sample_rate, duration, reverb_time=1.5)
+            for window_size in window_sizes:
+                denoiser = PipeDenoiser()
+                denoiser.sr = sample_rate
+                denoiser.settings['window_size'] = window_size
+                cases.append(Case(
+                    f"denoising/remove_reverb/sr={sample_rate}/dur={duration}/win={window_size}",
+                    len(audio), lambda d=denoiser, a=audio: d.remove_reverb(a, d.settings['strength'])))
+
+            denoiser = PipeDenoiser()
+            a0_path, r_paths = _write_note_set(workdir, sample_rate, duration)
+            output_path = os.path.join(workdir, 'out', os.path.basename(a0_path))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            # Próbki A0 i wszystkich plików R, które process_note wczytuje i przetwarza
+            samples = int(duration * sample_rate) * (1 + len(r_paths))
+            cases.append(Case(
+                f"denoising/process_note/sr={sample_rate}/dur={duration}", samples,
+                lambda d=denoiser, a=a0_path, r=r_paths, o=output_path: _process_note(d, a, r, o)))
+    return cases
+
+
+def sample_cases(sample_dir, workdir, limit=3):
+    """process_note na prawdziwych próbkach (<sample_dir>/<registr>/A0, R0..R3)"""
+    PipeDenoiser = _import_denoiser()
+    if PipeDenoiser is None or not os.path.isdir(sample_dir):
+        return []
+    import soundfile as sf
+
+    cases = []
+    for stop in sorted(os.listdir(sample_dir)):
+        a0_dir = os.path.join(sample_dir, stop, 'A0')
+        if not os.path.isdir(a0_dir):
+            continue
+        for note_file in sorted(f for f in os.listdir(a0_dir) if f.endswith('.wav'))[:limit]:
+            a0_path = os.path.join(a0_dir, note_file)
+            r_paths = [os.path.join(sample_dir, stop, r_dir, note_file) for r_dir in ('R0', 'R1', 'R2', 'R3')]
+            r_paths = [path for path in r_paths if os.path.exists(path)]
+            samples = sum(sf.info(path).frames for path in [a0_path, *r_paths])
+            output_path = os.path.join(workdir, 'out', f"{stop}-{note_file}")
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            denoiser = PipeDenoiser()
+            cases.append(Case(
+                f"samples/process_note/{stop}/{note_file}", samples,
+                lambda d=denoiser, a=a0_path, r=r_paths, o=output_path: _process_note(d, a, r, o)))
+    return cases
+
+
+def analysis_cases(sample_rates, durations, window_sizes):
+    try:
+        from tools.analiza_dzwieku import analyze_signal
+    except ImportError as e:
+        print(f"Pominięto benchmarki analizy: {e}")
+        return []
+
+    cases = []
+    for sample_rate in sample_rates:
+        for duration in durations:
+            audio = synthetic_note(sample_rate, duration, reverb_time=0.5)
+            for window_size in window_sizes:
+                cases.append(Case(
+                    f"analysis/analyze_signal/sr={sample_rate}/dur={duration}/nperseg={window_size}",
+                    len(audio), lambda a=audio, fs=sample_rate, w=window_size: analyze_signal(a, fs, nperseg=w)))
+    return cases
+
+
+def measure(case, repeat):
+    """Najlepszy czas z repeat pomiarów (po jednym przebiegu rozgrzewającym)"""
+    case.run()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case.run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Zwraca listę (nazwa, zmiana) przypadków wolniejszych niż linia bazowa o > tolerance"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        change = result['samples_per_s'] / reference['samples_per_s'] - 1
+        if change < -tolerance:
+            regressions.append((name, change))
+    return regressions
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': machine_info(),
+        'results': results,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarki syntezy, odszumiania i analizy")
+    parser.add_argument('--quick', action='store_true', help="tylko podstawowe rozmiary (szybki przebieg)")
+    parser.add_argument('--filter', default='', help="uruchom tylko przypadki zawierające ten tekst")
+    parser.add_argument('--repeat', type=int, default=3, help="liczba pomiarów każdego przypadku")
+    parser.add_argument('--samples', default='sample', help="folder z prawdziwymi próbkami (A0, R0..R3)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="plik JSON linii bazowej")
+    parser.add_argument('--save-baseline', action='store_true', help="zapisz wyniki jako nową linię bazową")
+    parser.add_argument('--output', help="zapisz wyniki tego przebiegu do pliku JSON")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="dopuszczalny względny spadek przepustowości (domyślnie 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    pick = (lambda values: values[:1]) if args.quick else (lambda values: values)
+    sample_rates, durations, window_sizes = pick(SAMPLE_RATES), pick(DURATIONS), pick(WINDOW_SIZES)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        baseline = load_results(args.baseline)['results']
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = (synthesis_cases(sample_rates, durations)
+                 + denoising_cases(sample_rates, durations, window_sizes, workdir)
+                 + sample_cases(args.samples, workdir, limit=1 if args.quick else 3)
+                 + analysis_cases(sample_rates, durations, window_sizes))
+        cases = [case for case in cases if args.filter in case.name]
+
+        for case in cases:
+            seconds = measure(case, args.repeat)
+            rate = case.samples / seconds
+            results[case.name] = {'samples': case.samples, 'seconds': seconds, 'samples_per_s': rate}
+
+            line = f"{case.name:<70} {rate / 1e6:9.3f} MS/s"
+            reference = baseline.get(case.name)
+            if reference is not None:
+                line += f"  ({rate / reference['samples_per_s'] - 1:+.0%})"
+            print(line)
+
+    if args.output:
+        save_results(args.output, results)
+    if args.save_baseline:
+        save_results(args.baseline, results)
+        print(f"Zapisano linię bazową: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("Brak linii bazowej - uruchom z --save-baseline, aby ją utworzyć")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for name, change in regressions:
+        print(f"REGRESJA {name}: {change:+.0%}")
+    print(f"Regresje: {len(regressions)} / {len(results)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
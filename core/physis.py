@@ -1,16 +1,36 @@
+import collections
+import contextlib
+import copy
+import functools
+import json
+import math
+import threading
+import time
+import tracemalloc
 import numpy as np
 import scipy.signal as sig
 import scipy.io.wavfile as wav
 import os
 
 class PhysicalModelOrgan:
-    """Implementacja patentu US7442869B2 z uzupełnionymi elementami"""
-    def __init__(self, sample_rate=44100):
+    """Implementacja patentu US7442869B2 z uzupełnionymi elementami.
+    
+    dtype to typ próbek całej ścieżki (float64 lub float32 - o połowę mniej
+    pamięci przy renderowaniu wsadowym); rekurencje oscylatora i fazy LFO
+    liczone są zawsze w float64.
+    
+    Przypisanie organ.stats = RenderStats() włącza pomiar czasu (i opcjonalnie
+    alokacji) każdego etapu każdej nuty; przy stats = None pomiar nic nie kosztuje.
+    """
+    def __init__(self, sample_rate=44100, dtype=np.float64):
         self.sample_rate = sample_rate
-        self.harmonic_gen = HarmonicGenerator(sample_rate)
-        self.noise_gen = NoiseGenerator(sample_rate)
-        self.resonator = LinearResonator(sample_rate)
+        self.dtype = np.dtype(dtype)
+        self.harmonic_gen = HarmonicGenerator(sample_rate, self.dtype)
+        self.noise_gen = NoiseGenerator(sample_rate, self.dtype)
+        self.resonator = LinearResonator(sample_rate, dtype=self.dtype)
         self.params = self.default_params()
+        self.stats = None
+        self._buffers = {}
     
     def default_params(self):
         """Parametry zgodne z patentem z dodatkowymi ustawieniami"""
@@ -30,7 +50,10 @@ class PhysicalModelOrgan:
             
             # Obwiednie
             'attack_time': 0.1, 'decay_time': 0.05, 'sustain_level': 0.8,
-            'release_time': 0.3, 'initial_level': 0.0
+            'release_time': 0.3, 'initial_level': 0.0,
+            
+            # Losowość (szum, wahania wysokości) - None oznacza za każdym razem inne
+            'seed': 0
         }
     
     def render_note(self, freq, duration, params=None):
@@ -39,92 +62,400 @@ class PhysicalModelOrgan:
             params = self.params
         
         num_samples = int(duration * self.sample_rate)
+        note, stage = self._profile(freq, num_samples)
         
-        # Generacja składowych
-        harmonic = self.harmonic_gen.generate(freq, num_samples, params)
-        noise = self.noise_gen.generate(harmonic, num_samples, params)
-        output = self.resonator.process(harmonic, noise, params, num_samples)
+        # Generacja składowych - pośrednie sygnały w buforach używanych ponownie
+        shape = (num_samples,)
+        harmonic_rng, noise_rng = note_rngs(params, freq)
+        with stage(note, 'harmonic', num_samples):
+            harmonic = self.harmonic_gen.generate(freq, num_samples, params, rng=harmonic_rng,
+                                                  out=self._scratch('harmonic', shape))
+        with stage(note, 'noise', num_samples):
+            noise = self.noise_gen.generate(harmonic, num_samples, params, rng=noise_rng,
+                                            out=self._scratch('noise', shape))
+        with stage(note, 'resonator', num_samples):
+            output = self.resonator.process(harmonic, noise, params, num_samples,
+                                            self._resonator_delay(freq, params),
+                                            out=np.empty(shape, dtype=self.dtype))
         
         # Normalizacja i usunięcie składowej stałej
-        output = output - np.mean(output)
-        return output / np.max(np.abs(output))
+        with stage(note, 'normalize', num_samples):
+            return _normalize(output)
+    
+    def render_notes(self, freqs, duration, params=None):
+        """Renderuje wiele nut naraz jako tablicę (nuty × próbki).
+        
+        Stan wszystkich etapów ma dodatkową oś nut, więc każdy krok rekurencji
+        oscylatora przesuwa wszystkie nuty jedną operacją numpy; NOISE BOX
+        liczony jest odcinkami osobno dla każdej nuty.
+        Wiersz k odpowiada render_note(freqs[k], duration, params) (w float64
+        co do bitu, w float32 z dokładnością tego typu), z wyjątkiem trybu
+        SUSTAIN_LOOP, który w renderowaniu wsadowym jest pomijany.
+        """
+        if params is None:
+            params = self.params
+        
+        freqs = np.asarray(freqs, dtype=float)
+        num_samples = int(duration * self.sample_rate)
+        
+        shape = (len(freqs), num_samples)
+        total = shape[0] * shape[1]
+        note, stage = self._profile(freqs.tolist(), total)
+        
+        rngs = [note_rngs(params, freq) for freq in freqs]
+        with stage(note, 'harmonic', total):
+            harmonic = self.harmonic_gen.generate(freqs, num_samples, params, rng=[h for h, _ in rngs],
+                                                  out=self._scratch('harmonic', shape))
+        with stage(note, 'noise', total):
+            noise = self.noise_gen.generate(harmonic, num_samples, params, rng=[n for _, n in rngs],
+                                            out=self._scratch('noise', shape))
+        with stage(note, 'resonator', total):
+            output = np.empty(shape, dtype=self.dtype)
+            if params.get('RESONATOR_TUNED', False):
+                # Różne długości pętli - każda nuta przez rezonator osobno
+                for k, freq in enumerate(freqs):
+                    self.resonator.process(harmonic[k], noise[k], params, num_samples,
+                                           self.resonator.delay_for(freq), out=output[k])
+            else:
+                self.resonator.process(harmonic, noise, params, num_samples, out=output)
+        
+        # Normalizacja i usunięcie składowej stałej - osobno dla każdej nuty
+        with stage(note, 'normalize', total):
+            return _normalize(output)
+    
+    def _profile(self, freq, num_samples):
+        """(wpis nuty, funkcja etapu) - przy wyłączonym pomiarze pusty kontekst"""
+        if self.stats is None:
+            return None, _no_stage
+        return self.stats.begin_note(freq, num_samples), self.stats.stage
+    
+    def _scratch(self, name, shape):
+        """Bufor roboczy o danym kształcie, używany ponownie przez kolejne rendery"""
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=self.dtype)
+        return buffer
+    
+    def _resonator_delay(self, freq, params):
+        """Opóźnienie rezonatora: stałe lub (RESONATOR_TUNED) równe okresowi nuty"""
+        if params.get('RESONATOR_TUNED', False):
+            return self.resonator.delay_for(freq)
+        return None
+    
+    def render_stream(self, freq, params=None, block_size=512):
+        """Renderuje nutę strumieniowo, blokami po block_size próbek.
+        
+        Zwraca iterator NoteStream; wybrzmiewanie zaczyna się po wywołaniu
+        note_off(), a iteracja kończy się wraz z końcem obwiedni.
+        """
+        if params is None:
+            params = self.params
+        return NoteStream(self, freq, params, block_size)
+
+
+class NoteStream:
+    """Strumień bloków jednej nuty ze stanem wszystkich etapów syntezy.
+    
+    Zamiast normalizacji do globalnego szczytu (niemożliwej w czasie rzeczywistym)
+    składowa stała jest usuwana filtrem górnoprzepustowym, a poziom ustala
+    opcjonalny parametr OUTPUT_GAIN.
+    
+    Strumień ma własne generatory, więc kolejne render_stream/render_note
+    na tym samym obiekcie organów nie naruszają trwającej nuty.
+    """
+    def __init__(self, organ, freq, params, block_size):
+        self.block_size = block_size
+        self.gain = params.get('OUTPUT_GAIN', 1.0)
+        self.dc_blocker = FilterSection.butter(1, 20, 'highpass', organ.sample_rate, dtype=organ.dtype)
+        self.note, self.stage = organ._profile(freq, None)
+        
+        self.harmonic_gen = HarmonicGenerator(organ.sample_rate, organ.dtype)
+        self.noise_gen = NoiseGenerator(organ.sample_rate, organ.dtype)
+        self.resonator = LinearResonator(organ.sample_rate, dtype=organ.dtype)
+        
+        harmonic_rng, noise_rng = note_rngs(params, freq)
+        self.harmonic_gen.start(freq, params, rng=harmonic_rng)
+        self.noise_gen.start(params, rng=noise_rng)
+        self.resonator.start(params, organ._resonator_delay(freq, params))
+    
+    def note_off(self):
+        """Rozpoczyna segment wybrzmiewania od bieżącej próbki i bieżącego poziomu"""
+        self.harmonic_gen.note_off()
+    
+    @property
+    def finished(self):
+        return self.harmonic_gen.finished
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        
+        n, note, stage = self.block_size, self.note, self.stage
+        with stage(note, 'harmonic', n):
+            harmonic = self.harmonic_gen.process_block(n)
+        with stage(note, 'noise', n):
+            noise = self.noise_gen.process_block(harmonic)
+        with stage(note, 'resonator', n):
+            output = self.resonator.process_block(harmonic + noise)
+        with stage(note, 'output', n):
+            return self.gain * self.dc_blocker.process(output)
 
 
 class HarmonicGenerator:
     """Generator składowej harmonicznej z pełną implementacją"""
-    def __init__(self, sample_rate):
+    def __init__(self, sample_rate, dtype=np.float64):
         self.sample_rate = sample_rate
-        self.osc = HarmonicOscillator(sample_rate)
-        self.env_gen = EnvelopeGenerator(sample_rate)
+        self.dtype = np.dtype(dtype)
+        self.osc = HarmonicOscillator(sample_rate, self.dtype)
+        self.env_gen = EnvelopeGenerator(sample_rate, self.dtype)
         self.freq_modulator = FrequencyModulator(sample_rate)
-        self.lfo = LowFrequencyOscillator(sample_rate)
+        self.lfo = LowFrequencyOscillator(sample_rate, dtype=self.dtype)
+        self.looper = SustainLooper(sample_rate)
+        self.delay_length = 1024
+        self.block_size = 4096
         
-    def generate(self, freq, num_samples, params):
-        output = np.zeros(num_samples)
-        delay_line = np.zeros(1024)
-        delay_index = 0
+    def generate(self, freq, num_samples, params, rng=None, out=None):
+        """Cała składowa harmoniczna nuty (zapisywana do out, jeśli podano)"""
+        output = out if out is not None else np.empty(np.shape(freq) + (num_samples,), dtype=self.dtype)
+        self.start(freq, params, num_samples, rng)
         
-        for i in range(num_samples):
-            # Modulacja częstotliwości
-            mod_freq = self.freq_modulator.process(freq, self.osc.var1)
-            
-            # Generacja sygnałów LFO
-            lfo_amp, lfo_freq = self.lfo.process()
-            
-            # Generacja sinusoidy z modulacją
-            sin_wave = self.osc.process(mod_freq, params)
-            
-            # Generacja podwójnej częstotliwości
-            double_freq = 2 * sin_wave**2 - 1
-            
-            # Ścieżka 1
-            path1 = sin_wave * params['GAIN1']
-            path1 = np.clip(path1, -params['CLIP1'], params['CLIP1'])
-            
-            # Ścieżka 2
-            path2 = double_freq * params['GAIN2']
-            path2 = np.clip(path2, -params['CLIP2'], params['CLIP2'])
-            
-            # Obwiednie
-            env = self.env_gen.attack_sustain_release(i, num_samples, params)
-            path1 *= env
-            path2 *= env
-            
-            # Sumowanie i modulacja amplitudy
-            sum_node = path1 + path2
-            modulated = sum_node * (1 + params['MOD_AMPL'] * lfo_amp)
-            
-            # Linia opóźnienia
-            delayed = delay_line[delay_index]
-            filtered = params['CBYP'] * modulated + params['CDEL'] * delayed
-            
-            # Nieliniowa funkcja
-            nonlin_out = (filtered + params['X0']) - (filtered + params['X0'])**4 + params['Y0']
-            
-            # Filtr pasmowoprzepustowy
-            if i == 0:  # Inicjalizacja filtra tylko raz
-                self.bp_b, self.bp_a = sig.butter(2, [0.9*freq, 1.1*freq], 
-                                                 btype='bandpass', 
-                                                 fs=self.sample_rate)
-            filtered_bp = sig.lfilter(self.bp_b, self.bp_a, [nonlin_out])[0]
-            
-            # Sumator końcowy
-            output[i] = params['GAIND'] * nonlin_out + params['GAINF'] * filtered_bp
-            
-            # Aktualizacja linii opóźnienia
-            delay_line[delay_index] = modulated
-            delay_index = (delay_index + 1) % len(delay_line)
+        for start in range(0, num_samples, self.block_size):
+            stop = min(start + self.block_size, num_samples)
+            output[..., start:stop] = self.process_block(stop - start)
             
         return output
+    
+    def start(self, freq, params, total_samples=None, rng=None):
+        """Przygotowuje stan nowej nuty.
+        
+        Przy znanej długości (total_samples) wybrzmiewanie zaczyna się jak
+        w attack_sustain_release, w przeciwnym razie dopiero po note_off().
+        rng to numpy.random.Generator dla wahań wysokości (domyślnie z params['seed']).
+        
+        Tablica częstotliwości uruchamia tryb wsadowy: bloki mają kształt
+        (nuty × próbki), a rng jest listą generatorów, po jednym na nutę.
+        """
+        self.freq = freq
+        self.params = params
+        self.position = 0
+        self.release_samples = int(params['release_time'] * self.sample_rate)
+        self.release_pending = False
+        self.loop_edge = np.zeros(2)
+        self.loop_correction = np.empty(0)
+        self.loop_step = None
+        self.loop_state = None
+        self.batch = np.ndim(freq) > 0
+        # Pętla SUSTAIN_LOOP obserwuje wyjście dopiero po opadaniu obwiedni i linii opóźnienia
+        self.loop_start = (int(params['attack_time'] * self.sample_rate)
+                           + int(params['decay_time'] * self.sample_rate) + self.delay_length)
+        
+        self.lfo.reset()
+        if self.batch:
+            if rng is None:
+                rng = [note_rngs(params, f)[0] for f in freq]
+            self.oscs = [HarmonicOscillator(self.sample_rate, self.dtype) for _ in freq]
+            self.freq_modulators = [FrequencyModulator(self.sample_rate) for _ in freq]
+            for modulator, note_rng in zip(self.freq_modulators, rng):
+                modulator.reset(note_rng)
+            self.delay_line = np.zeros((len(freq), self.delay_length), dtype=self.dtype)
+        else:
+            self.osc.reset()
+            self.freq_modulator.reset(rng if rng is not None else default_rng(params))
+            self.looper.reset(self.freq_modulator.rng)
+            self.delay_line = np.zeros(self.delay_length, dtype=self.dtype)
+        
+        if total_samples is None:
+            self.release_start = None
+            self.envelope = None
+        else:
+            self.release_start = total_samples - self.release_samples
+            self.envelope = self.env_gen.attack_sustain_release_array(total_samples, params)
+        
+        # Filtr pasmowoprzepustowy - projekt raz na nutę, stan przenoszony między blokami
+        if self.batch:
+            self.bp = FilterSection.butter_bank(2, [[0.9*f, 1.1*f] for f in freq], 'bandpass',
+                                                self.sample_rate, dtype=self.dtype)
+        else:
+            self.bp = FilterSection.butter(2, [0.9*freq, 1.1*freq], 'bandpass', self.sample_rate,
+                                           dtype=self.dtype)
+    
+    def note_off(self):
+        if self.looper.playing:
+            # Pętla kończy się na granicy wariantu i stamtąd zaczyna się wybrzmiewanie
+            self.release_pending = True
+            return
+        if self.release_start is None or self.release_start > self.position:
+            self.release_start = self.position
+            self.envelope = None
+    
+    @property
+    def finished(self):
+        return (self.release_start is not None
+                and self.position >= self.release_start + self.release_samples)
+    
+    def process_block(self, n):
+        """Generuje kolejne n próbek nuty rozpoczętej przez start()"""
+        if self.batch or not self.params.get('SUSTAIN_LOOP', False):
+            return self._process_live(n)[0]
+        return self._process_looped(n)
+    
+    def _process_looped(self, n):
+        """Blok w trybie SUSTAIN_LOOP: w stanie ustalonym wyjście z pętli, poza nim na bieżąco.
+        
+        Pętla kończy się przed wybrzmiewaniem (lub po note_off) na granicy
+        wariantu przenikaniem w koniec nagrania. Ścieżka wraca wtedy do stanu
+        zapamiętanego na końcu nagrania, więc jest jego dalszym ciągiem.
+        Na wejściu w pętlę i wyjściu z niej pozostaje mały skok (różne wahania
+        wysokości wariantów; pętla nakłada bieżące LFO liniowo, a ścieżka przez
+        nieliniowość), który wygasa liniowo przez crossfade próbek.
+        """
+        looper = self.looper
+        if not looper.playing:
+            start = self.position
+            output, sin_wave, am = self._process_live(n)
+            output = self._join_loop(output)
+            self.loop_edge = np.concatenate((self.loop_edge, output))[-2:]
+            if start >= self.loop_start and looper.observe(output, sin_wave, am):
+                self.loop_state = self._state()
+                self._start_join()
+            return output
+        
+        limit = None
+        if self.release_pending:
+            limit = 0
+        elif self.release_start is not None:
+            limit = self.release_start - self.position
+        looped = looper.take(n, limit)
+        lfo_amp, _ = self.lfo.process_block(len(looped), freq=False)
+        output = self._join_loop(looper.offset + looped * (1 + self.params['MOD_AMPL'] * lfo_amp))
+        self.position += len(looped)
+        self.loop_edge = np.concatenate((self.loop_edge, output))[-2:]
+        if looper.playing:
+            return output.astype(self.dtype, copy=False)
+        
+        self._restore(self.loop_state)
+        if self.release_pending:
+            self.release_start = self.position
+            self.envelope = None
+            self.release_pending = False
+        self._start_join()
+        if len(looped) == n:
+            return output.astype(self.dtype, copy=False)
+        rest = self._join_loop(self._process_live(n - len(looped))[0])
+        return np.concatenate((output, rest)).astype(self.dtype, copy=False)
+    
+    def _start_join(self):
+        """Kolejna próbka ma być przedłużeniem dwóch ostatnich (loop_edge)"""
+        self.loop_correction = np.linspace(1, 0, self.looper.crossfade + 2)[1:-1]
+        self.loop_step = 2 * self.loop_edge[-1] - self.loop_edge[-2]
+    
+    def _join_loop(self, block):
+        """Wygasza skok na początku lub końcu pętli (po _start_join)"""
+        count = min(len(block), len(self.loop_correction))
+        if count:
+            if self.loop_step is not None:
+                self.loop_step, step = None, self.loop_step - block[0]
+                self.loop_correction = step * self.loop_correction
+            block[:count] += self.loop_correction[:count]
+            self.loop_correction = self.loop_correction[count:]
+        return block
+    
+    def _state(self):
+        """Stan ścieżki potrzebny do kontynuacji po pętli (LFO i obwiednia biegną dalej)"""
+        modulator = self.freq_modulator
+        return (copy.copy(self.osc), modulator.random_pitch, modulator.last_var1,
+                self.delay_line.copy(), self.bp.zi.copy())
+    
+    def _restore(self, state):
+        osc, self.freq_modulator.random_pitch, self.freq_modulator.last_var1, delay_line, zi = state
+        self.osc = copy.copy(osc)
+        self.delay_line = delay_line.copy()
+        self.bp.zi = zi.copy()
+    
+    def _process_live(self, n):
+        """Blok całej ścieżki; zwraca (wyjście, oscylator, czynnik modulacji amplitudy)"""
+        params = self.params
+        start = self.position
+        self.position += n
+        
+        # Oscylator z modulacją częstotliwości - jedyna rekurencja ścieżki
+        if self.batch:
+            sin_wave = HarmonicOscillator.process_batch(self.oscs, self.freq, n, params, self.freq_modulators)
+        else:
+            sin_wave = self.osc.process_block(self.freq, n, params, self.freq_modulator)
+        
+        # Generacja sygnałów LFO (wyjście częstotliwościowe nie jest używane)
+        lfo_amp, _ = self.lfo.process_block(n, freq=False)
+        am = 1 + params['MOD_AMPL'] * lfo_amp
+        
+        # Obwiednie
+        if self.envelope is not None:
+            env = self.envelope[start:start + n]
+        else:
+            env = self.env_gen.attack_sustain_release_segment(start, n, self.release_start, params)
+        
+        output, self.delay_line = self.shape_block(sin_wave, env, am, self.delay_line, self.bp.process, params)
+        return output, sin_wave, am
+    
+    @staticmethod
+    def shape_block(sin_wave, envelope, am, delay_line, bandpass, params):
+        """Ścieżka za oscylatorem: ścieżki CLIP, obwiednia, linia opóźnienia, x - x^4, filtr BP.
+        
+        Blok jednej nuty lub (nuty × próbki); wartości params mogą być
+        kolumnami (nuty × 1), osobnymi dla każdej nuty. bandpass to funkcja
+        filtra BP ze stanem. Zwraca (wyjście, linia opóźnienia po bloku).
+        """
+        n = sin_wave.shape[-1]
+        
+        # Generacja podwójnej częstotliwości
+        double_freq = 2 * sin_wave**2 - 1
+        
+        # Ścieżki 1 i 2
+        path1 = np.clip(sin_wave * params['GAIN1'], -params['CLIP1'], params['CLIP1'])
+        path2 = np.clip(double_freq * params['GAIN2'], -params['CLIP2'], params['CLIP2'])
+        
+        # Sumowanie, obwiednia i modulacja amplitudy
+        modulated = (path1 + path2) * envelope * am
+        
+        # Linia opóźnienia - sprzężenie w przód, więc blok może być dowolnie długi
+        history = np.concatenate((delay_line, modulated), axis=-1)
+        delayed = history[..., :n]
+        filtered = params['CBYP'] * modulated + params['CDEL'] * delayed
+        
+        # Nieliniowa funkcja
+        shifted = filtered + params['X0']
+        nonlin_out = shifted - shifted**4 + params['Y0']
+        
+        # Filtr pasmowoprzepustowy
+        filtered_bp = bandpass(nonlin_out)
+        
+        # Sumator końcowy
+        return params['GAIND'] * nonlin_out + params['GAINF'] * filtered_bp, history[..., n:]
 
 
 class HarmonicOscillator:
     """Oscylator harmoniczny z modulacją"""
-    def __init__(self, sample_rate):
+    # Krok numpy kosztuje ok. 10 wywołań na próbkę niezależnie od liczby nut,
+    # więc dla mniejszej liczby nut szybsze są pętle skalarne (process_block)
+    batch_min_notes = 40
+    
+    def __init__(self, sample_rate, dtype=np.float64):
         self.sample_rate = sample_rate
+        self.dtype = np.dtype(dtype)
+        self.reset()
+    
+    def reset(self):
         self.var1 = 1.0
         self.var2 = 0.0
         
+        # Stan trybu fazowego: początki okresów (w próbkach) i ich pulsacje
+        self.position = 0
+        self.cycle_starts = None
+        self.cycle_omegas = None
+        
     def process(self, freq, params):
         epsilon = params.get('epsilon', 1e-5)
         F = 2 * np.sin(np.pi * freq / self.sample_rate)
@@ -135,30 +466,350 @@ class HarmonicOscillator:
         self.var1 = np.clip(self.var1, -1, 1)
         
         return self.var1
+    
+    def process_block(self, base_freq, num_samples, params, modulator):
+        """Blok próbek oscylatora razem z modulacją z FrequencyModulator.
+        
+        Odpowiada wywołaniom modulator.process() i process() dla każdej próbki,
+        ale rekurencja działa na zmiennych lokalnych zamiast na obiektach numpy.
+        Przy params['OSC_MODE'] == 'phase' używany jest tryb fazowy (process_phase_block).
+        """
+        if params.get('OSC_MODE', 'recurrence') == 'phase':
+            return self.process_phase_block(base_freq, num_samples, modulator)
+        
+        epsilon = params.get('epsilon', 1e-5)
+        growth = 1 + epsilon
+        # Próbki zbierane jako float Pythona i rzutowane na dtype raz na blok
+        output = []
+        append = output.append
+        
+        var1, var2 = float(self.var1), float(self.var2)
+        last_var1 = modulator.last_var1
+        F2 = (2 * math.sin(math.pi * base_freq * modulator.random_pitch / self.sample_rate))**2
+        
+        for _ in range(num_samples):
+            if last_var1 < 0 and var1 >= 0:
+                modulator.random_pitch = modulator.draw_pitch()
+                F2 = (2 * math.sin(math.pi * base_freq * modulator.random_pitch / self.sample_rate))**2
+            last_var1 = var1
+            
+            var1 = var1 - F2 * var2
+            var2 = var2 * growth + var1
+            var1 = -1.0 if var1 < -1.0 else 1.0 if var1 > 1.0 else var1
+            append(var1)
+        
+        self.var1, self.var2 = var1, var2
+        modulator.last_var1 = last_var1
+        return np.array(output, dtype=self.dtype)
+    
+    @staticmethod
+    def process_batch(oscillators, base_freqs, num_samples, params, modulators):
+        """Blok (nuty × próbki) dla wielu oscylatorów naraz, każdy z własnym modulatorem.
+        
+        Rekurencja jest ta sama co w process_block, ale jeden krok przesuwa
+        wszystkie nuty operacjami na wektorach; wysokość losowana jest tylko
+        dla nut, które w danej próbce przechodzą przez zero. Poniżej
+        batch_min_notes nut każda liczona jest process_block (wynik identyczny).
+        epsilon może być wektorem (osobno dla każdej nuty).
+        """
+        if params.get('OSC_MODE', 'recurrence') == 'phase':
+            return np.stack([osc.process_phase_block(freq, num_samples, modulator)
+                             for osc, freq, modulator in zip(oscillators, base_freqs, modulators)])
+        if len(oscillators) < HarmonicOscillator.batch_min_notes:
+            epsilon = np.broadcast_to(params.get('epsilon', 1e-5), len(oscillators))
+            return np.stack([osc.process_block(freq, num_samples, {'epsilon': float(eps)}, modulator)
+                             for osc, freq, eps, modulator in zip(oscillators, base_freqs, epsilon, modulators)])
+        
+        epsilon = params.get('epsilon', 1e-5)
+        growth = 1 + epsilon
+        sample_rate = oscillators[0].sample_rate if oscillators else 1
+        dtype = oscillators[0].dtype if oscillators else np.float64
+        output = np.empty((num_samples, len(oscillators)), dtype=dtype)
+        
+        var1 = np.array([float(osc.var1) for osc in oscillators])
+        var2 = np.array([float(osc.var2) for osc in oscillators])
+        last_var1 = np.array([float(modulator.last_var1) for modulator in modulators])
+        F2 = np.array([(2 * math.sin(math.pi * freq * modulator.random_pitch / sample_rate))**2
+                       for freq, modulator in zip(base_freqs, modulators)])
+        
+        # Bufory robocze używane ponownie w każdej próbce
+        scaled = np.empty(len(oscillators))
+        was_negative = last_var1 < 0
+        is_negative = np.empty(len(oscillators), dtype=bool)
+        crossing = np.empty(len(oscillators), dtype=bool)
+        
+        for i in range(num_samples):
+            np.less(var1, 0, out=is_negative)
+            np.greater(was_negative, is_negative, out=crossing)
+            if np.count_nonzero(crossing):
+                for k in np.flatnonzero(crossing):
+                    modulator = modulators[k]
+                    modulator.random_pitch = modulator.draw_pitch()
+                    F2[k] = (2 * math.sin(math.pi * base_freqs[k] * modulator.random_pitch / sample_rate))**2
+            was_negative, is_negative = is_negative, was_negative
+            last_var1 = var1
+            
+            var1 = var1 - np.multiply(F2, var2, out=scaled)
+            np.multiply(var2, growth, out=var2)
+            np.add(var2, var1, out=var2)
+            np.maximum(var1, -1.0, out=var1)
+            np.minimum(var1, 1.0, out=var1)
+            output[i] = var1
+        
+        for k, (osc, modulator) in enumerate(zip(oscillators, modulators)):
+            osc.var1, osc.var2 = float(var1[k]), float(var2[k])
+            modulator.last_var1 = float(last_var1[k])
+        return output.T
+    
+    def process_phase_block(self, base_freq, num_samples, modulator):
+        """Tryb fazowy: cały blok z narastającej fazy, bez rekurencji po próbkach.
+        
+        Rekurencja daje w przybliżeniu CLIP(cos(ω(n + 1/2)) / cos(ω/2)), a nowa
+        losowa wysokość obowiązuje od przejścia VAR1 przez zero w górę. Tu okresy
+        mają długość 2π/ω_k z wysokości losowanych partiami, momenty przejść przez
+        zero to ich skumulowana suma, a każda próbka dostaje fazę swojego okresu.
+        
+        Tolerancja względem rekurencji (ε = 1e-5, 1 s przy 44.1 kHz):
+        bez wahań wysokości maks. |różnica| < 1e-2 do 1 kHz i < 3e-2 przy 3 kHz.
+        Z wahaniami obie metody zużywają tę samą sekwencję wysokości, ale zmiana
+        następuje tu w ułamkowym momencie przejścia, a nie w następnej próbce,
+        więc faza rozchodzi się losowo i różnica rośnie z czasem i częstotliwością
+        (maks. z 20 ziaren): 440 Hz - 0.04 przez całą sekundę; 1 kHz - 0.15;
+        2 kHz - 0.4; 3 kHz - 0.37 w pierwszych 0.25 s i ok. 1 po 1 s. Powyżej
+        ok. 1 kHz tryb fazowy daje więc inny (równie losowy) przebieg niż
+        rekurencja, a nie jej przybliżenie próbka w próbkę.
+        """
+        two_pi = 2 * np.pi
+        omega_scale = two_pi * base_freq / self.sample_rate
+        
+        if self.cycle_starts is None:
+            omega = omega_scale * modulator.random_pitch
+            self.cycle_starts = np.array([-0.5 - 0.25 * two_pi / omega])
+            self.cycle_omegas = np.array([omega])
+        
+        # Dolosowanie okresów, aż pokryją cały blok
+        last_sample = self.position + num_samples - 1
+        cycle_end = self.cycle_starts[-1] + two_pi / self.cycle_omegas[-1]
+        while cycle_end <= last_sample:
+            count = int((last_sample - cycle_end) * omega_scale * 1.02 / two_pi) + 2
+            omegas = omega_scale * modulator.draw_pitches(count)
+            ends = cycle_end + np.cumsum(two_pi / omegas)
+            self.cycle_starts = np.concatenate((self.cycle_starts, [cycle_end], ends[:-1]))
+            self.cycle_omegas = np.concatenate((self.cycle_omegas, omegas))
+            cycle_end = ends[-1]
+        
+        t = np.arange(self.position, self.position + num_samples, dtype=float)
+        cycle = np.searchsorted(self.cycle_starts, t, side='right') - 1
+        omega = self.cycle_omegas[cycle]
+        phase = omega * (t - self.cycle_starts[cycle]) - np.pi / 2
+        output = np.clip(np.cos(phase) / np.cos(omega / 2), -1.0, 1.0).astype(self.dtype, copy=False)
+        
+        # Zachowaj tylko bieżący i przyszłe okresy
+        if num_samples:
+            current = cycle[-1]
+            self.cycle_starts = self.cycle_starts[current:]
+            self.cycle_omegas = self.cycle_omegas[current:]
+            modulator.random_pitch = self.cycle_omegas[0] / omega_scale
+            self.var1 = output[-1]
+        self.position += num_samples
+        return output
+
+
+class SustainLooper:
+    """Pętla stanu ustalonego składowej harmonicznej (tryb params['SUSTAIN_LOOP']).
+    
+    Obserwowane jest wyjście całej ścieżki harmonicznej (po filtrze
+    pasmowym), a okresy wyznaczają przejścia oscylatora przez zero w górę.
+    Stan ustalony to chwila, w której średnia energia okresu w dwóch kolejnych
+    oknach po window_cycles okresów różni się o mniej niż tolerance. Wtedy
+    ostatnie okresy przed końcem bloku dzielone są na warianty po
+    cycles_per_variant okresów, ale nie krótsze niż min_variant_time (koszt
+    pętli zależy od liczby wariantów, a nie próbek). Warianty mają różne
+    wahania wysokości, a zaczynają i kończą się w tej samej fazie co koniec
+    bloku. Dalszy przebieg to losowo wybierane warianty łączone krótkim
+    przenikaniem.
+    
+    Próbki pętli przechowywane są bez modulacji amplitudy LFO (podzielone
+    przez czynnik 1 + MOD_AMPL * LFO z chwili nagrania), a take() zwraca je
+    w tej postaci - modulację bieżącym LFO nakłada wywołujący.
+    """
+    def __init__(self, sample_rate, window_cycles=8, tolerance=0.01, variants=8,
+                 cycles_per_variant=4, crossfade=32, max_capture_time=5.0, min_variant_time=0.05):
+        self.window_cycles = window_cycles
+        self.tolerance = tolerance
+        self.variants_count = variants
+        self.cycles_per_variant = cycles_per_variant
+        self.min_variant = int(min_variant_time * sample_rate)
+        self.max_crossfade = crossfade
+        self.max_capture = int(max_capture_time * sample_rate)
+        self.reset()
+    
+    def reset(self, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.history = []
+        self.captured = 0
+        self.capturing = True
+        self.variants = None
+        self.offset = 0.0
+        self.crossfade = 0
+        self.playing = False
+        self.leaving = False
+        self.current = np.empty(0)
+        self.current_pos = 0
+        self.tail = np.empty(0)
+    
+    def observe(self, block, osc_block, am):
+        """Dodaje blok wyjścia (z oscylatorem i czynnikiem modulacji amplitudy).
+        
+        Zwraca True, gdy pętla jest gotowa - następne próbki po tym bloku
+        pochodzą już z take(), a wywołujący zapamiętuje stan ścieżki na wypadek
+        powrotu do obliczeń na bieżąco po końcu pętli.
+        """
+        if not self.capturing:
+            return False
+        self.history.append((block.copy(), osc_block.copy(), np.broadcast_to(am, block.shape).copy()))
+        self.captured += len(block)
+        return self._analyze()
+    
+    def _analyze(self):
+        signal, osc, am = (np.concatenate(parts) for parts in zip(*self.history))
+        self.history = [(signal, osc, am)]
+        
+        crossings = np.flatnonzero((osc[:-1] < 0) & (osc[1:] >= 0)) + 1
+        W = self.window_cycles
+        C = self.cycles_per_variant
+        if len(crossings) > 1:
+            C = max(C, -(-self.min_variant * (len(crossings) - 1) // (crossings[-1] - crossings[0])))
+        looped = self.variants_count * C
+        if len(crossings) >= 2 * W + looped + 1:
+            energy = np.add.reduceat(signal**2, crossings[:-1])[:-1] / np.diff(crossings)[:-1]
+            energy = np.sqrt(energy)
+            windows = np.convolve(energy, np.ones(W) / W, mode='valid')
+            change = np.abs(windows[W:] - windows[:-W]) / windows[:-W]
+            steady = np.flatnonzero(change < self.tolerance)
+            if len(steady) and len(crossings) - (steady[0] + 2 * W) > looped:
+                self._build_variants(signal, am, crossings[-(looped + 1):], C)
+                return True
+        
+        if self.captured > self.max_capture:
+            # Brak stanu ustalonego - ścieżka pracuje dalej bez pętli
+            self.capturing = False
+            self.history = []
+        return False
+    
+    def _build_variants(self, signal, am, crossings, C):
+        # Granice wariantów przesunięte tak, by ostatni kończył się z końcem bloku
+        bounds = crossings[::C] + (len(signal) - crossings[-1])
+        self.crossfade = int(min(self.max_crossfade, np.diff(crossings).min() // 2, bounds[0]))
+        
+        self.offset = np.mean(signal[bounds[0]:])
+        flat = (signal - self.offset) / am
+        self.variants = [flat[start - self.crossfade:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.capturing = False
+        self.history = []
+        
+        self.playing = True
+    
+    def _variant(self):
+        return self.variants[self.rng.integers(len(self.variants))]
+    
+    def take(self, num_samples, limit=None):
+        """Kolejne próbki pętli (bez modulacji amplitudy), najwyżej num_samples.
+        
+        Nowy wariant zaczynany jest tylko wtedy, gdy razem z ogonem mieści się
+        w limit próbek od bieżącego miejsca (None - bez ograniczenia). Inaczej
+        pętla kończy się na granicy wariantów, w fazie końca nagrania:
+        playing = False, a zwrócona tablica jest krótsza niż num_samples.
+        """
+        output = np.empty(num_samples)
+        filled = 0
+        xf = self.crossfade
+        fade = np.linspace(0, 1, xf + 2)[1:-1]
+        while filled < num_samples:
+            if self.current_pos >= len(self.current):
+                variant = self._variant()
+                if self.leaving or (limit is not None and filled + len(variant) > limit):
+                    # Ogon przechodzi w koniec nagrania - dalej ścieżka na bieżąco od stanu z tej chwili
+                    if not self.leaving and len(self.tail):
+                        self.tail = self.tail * (1 - fade) + self.variants[-1][len(self.variants[-1]) - xf:] * fade
+                    self.leaving = True
+                    count = min(len(self.tail), num_samples - filled)
+                    output[filled:filled + count] = self.tail[:count]
+                    filled += count
+                    self.tail = self.tail[count:]
+                    if not len(self.tail):
+                        self.playing = False
+                        break
+                    continue
+                body = variant[xf:]
+                # Pierwszy wariant bez przenikania - koniec nagrania jest w fazie jego początku
+                blended = self.tail * (1 - fade) + variant[:xf] * fade if len(self.tail) else np.empty(0)
+                self.tail = body[len(body) - xf:]
+                self.current = np.concatenate((blended, body[:len(body) - xf]))
+                self.current_pos = 0
+            count = min(num_samples - filled, len(self.current) - self.current_pos)
+            output[filled:filled + count] = self.current[self.current_pos:self.current_pos + count]
+            filled += count
+            self.current_pos += count
+        return output[:filled]
 
 
 class FrequencyModulator:
     """Modulator częstotliwości zgodnie z Fig. 5-6"""
-    def __init__(self, sample_rate):
+    def __init__(self, sample_rate, jitter_batch=256):
         self.sample_rate = sample_rate
+        self.jitter_batch = jitter_batch
+        self.reset()
+    
+    def reset(self, rng=None):
         self.random_pitch = 1.0
         self.last_var1 = 0
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self._pitches = np.empty(0)
+        self._pitch_index = 0
         
     def process(self, base_freq, current_var1):
         if self.last_var1 < 0 and current_var1 >= 0:
-            self.random_pitch = np.random.uniform(0.98, 1.02)  # ±2% wariacji
+            self.random_pitch = self.draw_pitch()
         self.last_var1 = current_var1
         return base_freq * self.random_pitch
+    
+    def draw_pitches(self, count):
+        """count kolejnych wysokości z tej samej sekwencji co draw_pitch()"""
+        parts = []
+        while count > 0:
+            if self._pitch_index >= len(self._pitches):
+                self._pitches = self.rng.uniform(0.98, 1.02, self.jitter_batch)  # ±2% wariacji
+                self._pitch_index = 0
+            part = self._pitches[self._pitch_index:self._pitch_index + count]
+            self._pitch_index += len(part)
+            count -= len(part)
+            parts.append(part)
+        return np.concatenate(parts) if parts else np.empty(0)
+    
+    def draw_pitch(self):
+        """Kolejna losowa wysokość; wartości losowane są partiami z self.rng"""
+        if self._pitch_index >= len(self._pitches):
+            self._pitches = self.rng.uniform(0.98, 1.02, self.jitter_batch)  # ±2% wariacji
+            self._pitch_index = 0
+        pitch = self._pitches[self._pitch_index]
+        self._pitch_index += 1
+        return pitch
 
 
 class LowFrequencyOscillator:
     """LFO dla modulacji amplitudy i częstotliwości"""
-    def __init__(self, sample_rate, freq=0.5, ampl=0.1, offset=0.0):
+    def __init__(self, sample_rate, freq=0.5, ampl=0.1, offset=0.0, table_size=1024, dtype=np.float64):
         self.sample_rate = sample_rate
+        self.dtype = np.dtype(dtype)
         self.phase = 0
         self.freq = freq
         self.ampl = ampl
         self.offset = offset
+        self.table_size = table_size
+    
+    def reset(self):
+        self.phase = 0
         
     def process(self):
         self.phase += 2 * np.pi * self.freq / self.sample_rate
@@ -176,155 +827,564 @@ class LowFrequencyOscillator:
         output_freq = parabola
         
         return output_amp, output_freq
+    
+    def process_block(self, num_samples, amp=True, freq=True):
+        """Wektorowy odpowiednik num_samples wywołań process().
+        
+        Kształty fal odczytywane są z tablicy (interpolacja liniowa), a faza
+        przenoszona między blokami. Wyjście wyłączone flagą amp/freq nie jest
+        liczone i zwracane jest jako None.
+        """
+        size = self.table_size
+        step = size * self.freq / self.sample_rate
+        position = (self.phase * size / (2 * np.pi) + step * np.arange(1, num_samples + 1)) % size
+        if num_samples:
+            self.phase = position[-1] * 2 * np.pi / size
+        
+        index = position.astype(np.intp)
+        frac = position - index
+        
+        triangle, parabola = _lfo_tables(size)
+        output_amp = output_freq = None
+        if amp:
+            output_amp = self.offset + self.ampl * (triangle[index] + frac * (triangle[index + 1] - triangle[index]))
+            output_amp = output_amp.astype(self.dtype, copy=False)
+        if freq:
+            output_freq = parabola[index] + frac * (parabola[index + 1] - parabola[index])
+            output_freq = output_freq.astype(self.dtype, copy=False)
+        
+        return output_amp, output_freq
 
 
 class NoiseGenerator:
-    """Generator szumu z pełną implementacją Fig. 10-12"""
-    def __init__(self, sample_rate):
+    """Generator szumu z pełną implementacją Fig. 10-12.
+    
+    Przy params['NOISE_DECIMATION'] = M > 1 ścieżka szumu (filtr 2 kHz,
+    NOISE BOX, limitator) pracuje z częstotliwością fs/M: sygnał RATE jest
+    decymowany, a wynik interpolowany polifazowo z powrotem do fs przed
+    rezonatorem. Czas opóźnienia NOISE BOX i nachylenie limitatora (na sekundę)
+    pozostają te same; M dzielące box_delay (2, 4, 5) zachowuje je dokładnie.
+    
+    Widmo szumu przy M = 4 odbiega o mniej niż 1 dB do ok. 2.5 kHz, powyżej
+    ok. 0.8 nowego Nyquista szum jest wycinany. Koszt nie maleje - decymator
+    i interpolator pracują z pełną częstotliwością, a NOISE BOX i tak liczy
+    odcinki pełnej szybkości limitatora jednym krokiem.
+    
+    Przebieg w czasie nie jest ten sam: filtry FIR decymatora i interpolatora
+    (po M·32 współczynników, liniowa faza) opóźniają szum łącznie o M·32 - 1
+    próbek względem składowej harmonicznej (127 próbek, ok. 2.9 ms przy M = 4
+    i 44.1 kHz). Opóźnienie nie jest kompensowane - wymagałoby sygnału
+    harmonicznego z wyprzedzeniem.
+    """
+    def __init__(self, sample_rate, dtype=np.float64):
         self.sample_rate = sample_rate
+        self.dtype = np.dtype(dtype)
         self.rate_limiter = RateLimiter()
-        self.env_gen = EnvelopeGenerator(sample_rate)
+        self.env_gen = EnvelopeGenerator(sample_rate, self.dtype)
+        self.block_size = 4096
+        self.box_delay = 100
+        # Najdłuższy odcinek pełnej szybkości limitatora liczony jednym krokiem
+        self.box_window = 2048
         
-    def generate(self, harmonic_signal, num_samples, params):
-        rate_signal = self._generate_rate_signal(harmonic_signal, params)
+    def generate(self, harmonic_signal, num_samples, params, rng=None, out=None):
+        """Cały szum nuty dla gotowej składowej harmonicznej (zapisywany do out, jeśli podano)"""
+        shape = harmonic_signal.shape[:-1] + (num_samples,)
+        output = out if out is not None else np.empty(shape, dtype=self.dtype)
+        num_notes = len(harmonic_signal) if harmonic_signal.ndim > 1 else None
+        self.start(params, rng, num_notes)
         
-        # Inicjalizacja NOISE BOX
-        delay_lines = [np.zeros(100) for _ in range(4)]
-        delay_indices = [0, 0, 0, 0]
-        prev_limiter_out = 0.0
+        for start in range(0, num_samples, self.block_size):
+            stop = min(start + self.block_size, num_samples)
+            output[..., start:stop] = self.process_block(harmonic_signal[..., start:stop])
+            
+        return output
+    
+    def start(self, params, rng=None, num_notes=None):
+        """Przygotowuje stan NOISE BOX dla nowej nuty (rng domyślnie z params['seed']).
         
-        output = np.zeros(num_samples)
+        Przy num_notes stan dotyczy tylu nut naraz (bloki nuty × próbki),
+        a rng jest listą generatorów, po jednym na nutę.
+        """
+        self.params = params
+        self.position = 0
+        self.num_notes = num_notes
+        if num_notes is not None:
+            self.rng = rng if rng is not None else [default_rng(params) for _ in range(num_notes)]
+        else:
+            self.rng = rng if rng is not None else default_rng(params)
         
-        for i in range(num_samples):
-            # Generacja białego szumu
-            white_noise = np.random.uniform(-1, 1)
-            
-            # Filtracja dolnoprzepustowa
-            if i == 0:
-                self.lp_b, self.lp_a = sig.butter(2, 2000, 'lowpass', fs=self.sample_rate)
-            filtered_noise = sig.lfilter(self.lp_b, self.lp_a, [white_noise])[0]
-            
-            # Przetwarzanie przez NOISE BOX
-            node1 = filtered_noise + params['NBFBK'] * delay_lines[3][delay_indices[3]]
-            
-            delay_lines[0][delay_indices[0]] = node1
-            delayed1 = delay_lines[0][delay_indices[0]]
-            
-            scaled = params['NCGAIN'] * delayed1
-            
-            node2 = scaled + delay_lines[1][delay_indices[1]]
-            delay_lines[1][delay_indices[1]] = node2
-            delayed2 = delay_lines[1][delay_indices[1]]
-            
-            delay_lines[2][delay_indices[2]] = delayed2
-            delayed3 = delay_lines[2][delay_indices[2]]
-            
-            node3 = delayed2 + delayed3
-            
-            # Limitator szybkości
-            limited = self.rate_limiter.process(node3, rate_signal[i], prev_limiter_out)
-            prev_limiter_out = limited
-            
-            delay_lines[3][delay_indices[3]] = limited
-            delayed4 = delay_lines[3][delay_indices[3]]
+        # Częstotliwość wewnętrzna ścieżki szumu
+        self.decimation = int(params.get('NOISE_DECIMATION', 1))
+        internal_rate = self.sample_rate / self.decimation
+        if 2000 >= 0.4 * internal_rate:
+            raise ValueError(f"NOISE_DECIMATION={self.decimation} za duże dla filtru 2 kHz "
+                             f"przy {self.sample_rate} Hz")
+        if self.decimation > 1:
+            self.decimator = PolyphaseDecimator(self.decimation, dtype=self.dtype, channels=num_notes)
+            self.interpolator = PolyphaseInterpolator(self.decimation, dtype=self.dtype, channels=num_notes)
+        self.internal_delay = max(1, round(self.box_delay / self.decimation))
+        
+        # Inicjalizacja NOISE BOX - ostatnie internal_delay próbek obu pętli opóźnienia
+        D = self.internal_delay
+        shape = (D,) if num_notes is None else (num_notes, D)
+        self.loop_history = np.zeros(shape, dtype=self.dtype)
+        self.limiter_history = np.zeros(shape, dtype=self.dtype)
+        
+        self.lp = FilterSection.butter(2, 2000, 'lowpass', internal_rate,
+                                       channels=num_notes, dtype=self.dtype)
+        self.rate_hp = FilterSection.butter(1, 100, 'highpass', self.sample_rate,
+                                            channels=num_notes, dtype=self.dtype)
+    
+    def reset_note(self, k, rng):
+        """Zeruje stan nuty k (wiersza bloków) przed nową nutą z generatorem rng"""
+        self.rng[k] = rng
+        self.loop_history[k] = 0.0
+        self.limiter_history[k] = 0.0
+        self.lp.zi[:, k] = 0.0
+        self.rate_hp.zi[:, k] = 0.0
+        if self.decimation > 1:
+            self.decimator.history[k] = 0.0
+            self.interpolator.history[k] = 0.0
+    
+    def process_block(self, harmonic_block):
+        """Generuje blok szumu odpowiadający kolejnemu blokowi składowej harmonicznej"""
+        start = self.position
+        self.position += harmonic_block.shape[-1]
+        return self.process_notes(harmonic_block, None, self.params, start)
+    
+    def process_notes(self, harmonic_block, rows, params, start):
+        """Blok szumu dla wybranych nut (wierszy stanu).
+        
+        rows to numery wierszy stanu odpowiadające wierszom bloku (None - wszystkie),
+        params['RATE_GAIN'] itd. - wartości skalarne lub kolumny (nuty × 1),
+        start - numer pierwszej próbki bloku (skalar lub kolumna). Przy M > 1
+        i wybranych wierszach długość bloku musi być wielokrotnością M
+        (wspólna faza decymatora).
+        """
+        num_samples = harmonic_block.shape[-1]
+        rate_signal = self._rate_block(harmonic_block, start, params, rows)
+        envelope = self.env_gen.noise_envelope_segment(start, num_samples, params)
+        
+        # Przejście na częstotliwość wewnętrzną: limit na próbkę rośnie M razy,
+        # żeby nachylenie na sekundę się nie zmieniło
+        M = self.decimation
+        if M > 1:
+            # Listki boczne FIR dają małe ujemne wartości, a limit musi być >= 0
+            rate_signal = np.maximum(self.decimator.process(rate_signal, rows) * M, 0)
+        internal_samples = rate_signal.shape[-1]
+        
+        # Generacja białego szumu i filtracja dolnoprzepustowa całym blokiem
+        if self.num_notes is not None:
+            rngs = self.rng if rows is None else [self.rng[k] for k in rows]
+            white_noise = np.stack([rng.uniform(-1, 1, internal_samples) for rng in rngs])
+        else:
+            white_noise = self.rng.uniform(-1, 1, internal_samples)
+        if M > 1:
+            # Ta sama gęstość widmowa mocy przy M razy węższym paśmie
+            white_noise = white_noise / math.sqrt(M)
+        white_noise = white_noise.astype(self.dtype, copy=False)
+        filtered_noise = self.lp.process(white_noise, rows)
+        
+        # NOISE BOX (Fig. 11). Linie 0 i 2 są zapisywane i czytane w tej samej
+        # próbce, więc nie opóźniają; pozostają dwie pętle o opóźnieniu D:
+        #   node2[n] = NCGAIN·(x[n] + NBFBK·limited[n-D]) + node2[n-D]
+        #   limited[n] = RATE_LIMIT(2·node2[n])
+        D = self.internal_delay
+        loop_history, limiter_history = self.loop_history, self.limiter_history
+        if rows is not None:
+            loop_history, limiter_history = loop_history[rows], limiter_history[rows]
+        empty = np.empty(rate_signal.shape, dtype=self.dtype)
+        loop = np.concatenate((loop_history, empty), axis=-1)
+        limited = np.concatenate((limiter_history, empty), axis=-1)
+        
+        if rate_signal.ndim == 1:
+            self._noise_box(filtered_noise, rate_signal, loop, limited, params['NCGAIN'], params['NBFBK'])
+        else:
+            gains = np.broadcast_to(params['NCGAIN'], (len(rate_signal), 1))
+            feedbacks = np.broadcast_to(params['NBFBK'], (len(rate_signal), 1))
+            for k in range(len(rate_signal)):
+                self._noise_box(filtered_noise[k], rate_signal[k], loop[k], limited[k],
+                                float(gains[k, 0]), float(feedbacks[k, 0]))
+        
+        if rows is None:
+            self.loop_history = loop[..., -D:]
+            self.limiter_history = limited[..., -D:]
+        else:
+            self.loop_history[rows] = loop[:, -D:]
+            self.limiter_history[rows] = limited[:, -D:]
+        
+        noise = limited[..., D:]
+        if M > 1:
+            noise = self.interpolator.process(noise, num_samples, rows)
+        
+        # Obwiednia szumu
+        return params['NGAIN'] * noise * envelope
+    
+    def _noise_box(self, noise, rate, loop, limited, gain, feedback):
+        """NOISE BOX jednej nuty; loop i limited zaczynają się od D próbek historii.
+        
+        Limitator prawie cały czas narasta lub opada z pełną szybkością, a jego
+        wyjście nie zależy wtedy od wejścia: limited to skumulowana suma
+        ±rate (liczona po kolei, jak w rekurencji). Dla takiego odcinka obie
+        pętle liczone są naraz - node2 jako sumy skumulowane wzdłuż kolumn
+        tablicy (wiersze po D próbek) - a odcinek kończy się na pierwszej
+        próbce, w której wejście limitatora przestaje wymagać ograniczenia.
+        Wynik jest równy rekurencji próbka po próbce. Po krótkim odcinku
+        (poniżej D próbek) oraz gdy limitator podąża za wejściem, następne
+        D próbek liczy pętla fragmentami (każdy fragment D próbek zależy
+        tylko od poprzednich).
+        """
+        D = self.internal_delay
+        num_samples = len(rate)
+        i = 0
+        run = D
+        while i < num_samples:
+            now = slice(D + i, D + i + 1)
+            loop[now] = gain * (noise[i:i + 1] + feedback * limited[i:i + 1]) + loop[i:i + 1]
+            prev = limited[D + i - 1]
+            diff = 2 * loop[D + i] - prev
+            if run < D or -rate[i] <= diff <= rate[i]:
+                # Fragment (najwyżej D próbek) z limitatorem próbka po próbce
+                stop = min(i + D, num_samples)
+                now, past = slice(D + i, D + stop), slice(i, stop)
+                loop[now] = gain * (noise[past] + feedback * limited[past]) + loop[past]
+                limited[now] = self.rate_limiter.process_block(2 * loop[now], rate[past], limited[D + i - 1])
+                i = stop
+                run = D
+                continue
             
-            # Aktualizacja indeksów
-            for j in range(4):
-                delay_indices[j] = (delay_indices[j] + 1) % len(delay_lines[j])
+            # Odcinek pełnej szybkości od próbki i (najwyżej box_window próbek)
+            stop = min(i + self.box_window, num_samples)
+            step = rate[i:stop] if diff > 0 else -rate[i:stop]
+            ramp = np.cumsum(np.concatenate(([prev], step)))
+            limited[D + i:D + stop] = ramp[1:]
             
-            # Obwiednia szumu
-            envelope = self.env_gen.noise_envelope(i, num_samples, params)
-            output[i] = params['NGAIN'] * limited * envelope
+            # node2 z opóźnieniem D: kolumny to próbki odległe o D
+            length = stop - i
+            rows = np.zeros((-(-length // D) + 1, D), dtype=self.dtype)
+            rows[0] = loop[i:i + D]
+            rows[1:].flat[:length] = gain * (noise[i:stop] + feedback * limited[i:stop])
+            np.cumsum(rows, axis=0, out=rows)
+            loop[D + i:D + stop] = rows[1:].flat[:length]
             
-        return output
+            # Koniec odcinka: pierwsza próbka bez ograniczenia w tym kierunku
+            excess = 2 * loop[D + i + 1:D + stop] - ramp[1:-1]
+            going = (excess > rate[i + 1:stop]) if diff > 0 else (-excess > rate[i + 1:stop])
+            run = 1 + (len(going) if going.all() else int(np.argmin(going)))
+            i += run
     
-    def _generate_rate_signal(self, harmonic, params):
-        """Generuje sygnał RATE zgodnie z Fig. 10"""
+    def _rate_block(self, harmonic, start, params, rows=None):
+        """Generuje blok sygnału RATE zgodnie z Fig. 10"""
         rate = params['RATE_GAIN'] * harmonic
         rate = np.clip(rate, -1, 1)
         
         # Filtr górnoprzepustowy
-        b, a = sig.butter(1, 100, 'highpass', fs=self.sample_rate)
-        rate = sig.lfilter(b, a, rate)
+        rate = self.rate_hp.process(rate, rows)
         
         # Obcięcie ujemnych wartości
         rate = np.maximum(rate, 0)
         
-        # Obwiednia
-        attack_samples = int(params['NOISE_ATTACK'] * self.sample_rate)
-        envelope = np.ones(len(rate))
-        envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
+        # Obwiednia - liniowe narastanie 0..1 przez attack_samples próbek
+        attack_samples = np.asarray(params['NOISE_ATTACK'] * self.sample_rate).astype(int)
+        if np.any(start < attack_samples):
+            index = start + np.arange(rate.shape[-1])
+            envelope = np.where(index < attack_samples, index / np.maximum(attack_samples - 1, 1), 1.0)
+            rate = rate * envelope.astype(self.dtype, copy=False)
+        
+        return rate
+
+
+class PolyphaseDecimator:
+    """Decymacja M-krotna z filtrem antyaliasingowym FIR, stan przenoszony między blokami.
+    
+    Splot liczony jest tylko dla zachowywanych próbek (co M-ta), więc koszt
+    to taps_per_phase·M mnożeń na próbkę wyjściową. Bloki mogą mieć dowolną
+    długość; działa wzdłuż ostatniej osi.
+    
+    Przy channels stan obejmuje tyle kanałów, a process(block, rows) filtruje
+    tylko wybrane (faza jest wspólna, więc bloki muszą mieć wtedy długość
+    będącą wielokrotnością M).
+    """
+    def __init__(self, factor, taps_per_phase=32, dtype=np.float64, channels=None):
+        self.factor = factor
+        self.taps = np.array(_polyphase_fir(factor, taps_per_phase)[::-1], dtype=dtype)
+        self.history = None
+        if channels is not None:
+            self.history = np.zeros((channels, len(self.taps) - 1), dtype=dtype)
+        self.phase = 0
+    
+    def process(self, block, rows=None):
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (len(self.taps) - 1,), dtype=self.taps.dtype)
+        history = self.history if rows is None else self.history[rows]
+        signal = np.concatenate((history, block), axis=-1)
+        windows = np.lib.stride_tricks.sliding_window_view(signal, len(self.taps), axis=-1)
+        output = windows[..., self.phase::self.factor, :] @ self.taps
         
-        return rate * envelope
+        self.phase = (self.phase - block.shape[-1]) % self.factor
+        if rows is None:
+            self.history = signal[..., block.shape[-1]:]
+        else:
+            self.history[rows] = signal[:, block.shape[-1]:]
+        return output
+
+
+class PolyphaseInterpolator:
+    """Interpolacja M-krotna filtrem FIR rozłożonym na M podfiltrów (fazy).
+    
+    Każda próbka wejściowa daje M próbek wyjściowych bez mnożenia przez
+    wstawione zera. process() zwraca dokładnie num_samples próbek, a nadmiar
+    przechowuje do następnego wywołania.
+    
+    Przy channels stan obejmuje tyle kanałów, a process(block, num_samples, rows)
+    filtruje tylko wybrane; num_samples musi być wtedy równe M·długość bloku
+    (bez nadmiaru).
+    """
+    def __init__(self, factor, taps_per_phase=32, dtype=np.float64, channels=None):
+        self.factor = factor
+        self.taps_per_phase = taps_per_phase
+        taps = _polyphase_fir(factor, taps_per_phase) * factor
+        # Wiersz w (od najstarszej próbki okna) to współczynniki wszystkich faz
+        self.bank = np.array(taps.reshape(taps_per_phase, factor)[::-1], dtype=dtype)
+        self.history = None
+        self.pending = None
+        if channels is not None:
+            self.history = np.zeros((channels, taps_per_phase - 1), dtype=dtype)
+            self.pending = np.zeros((channels, 0), dtype=dtype)
+    
+    def process(self, block, num_samples, rows=None):
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (self.taps_per_phase - 1,), dtype=self.bank.dtype)
+            self.pending = np.zeros(block.shape[:-1] + (0,), dtype=self.bank.dtype)
+        history, pending = self.history, self.pending
+        if rows is not None:
+            history, pending = history[rows], pending[rows]
+        signal = np.concatenate((history, block), axis=-1)
+        windows = np.lib.stride_tricks.sliding_window_view(signal, self.taps_per_phase, axis=-1)
+        phases = windows @ self.bank
+        output = np.concatenate((pending, phases.reshape(block.shape[:-1] + (-1,))), axis=-1)
+        
+        if rows is None:
+            self.history = signal[..., block.shape[-1]:]
+            self.pending = output[..., num_samples:]
+        else:
+            self.history[rows] = signal[:, block.shape[-1]:]
+        return output[..., :num_samples]
 
 
 class RateLimiter:
     """Limitator szybkości zgodnie z Fig. 12"""
+    # Poniżej tylu nut pętla skalarna na nutę jest szybsza niż krok numpy dla wszystkich
+    batch_min_rows = 12
+    
     def process(self, input_val, rate_limit, prev_out):
         diff = input_val - prev_out
         diff_clipped = np.clip(diff, -rate_limit, rate_limit)
         return prev_out + diff_clipped
+    
+    def process_block(self, input_block, rate_block, prev_out):
+        """Blok próbek limitatora; rekurencja na zmiennych lokalnych zamiast numpy.
+        
+        Dla bloków (nuty × próbki) prev_out to wektor ostatnich wyjść nut,
+        a każdy krok rekurencji obejmuje wszystkie nuty naraz (poniżej
+        batch_min_rows nut - pętla skalarna dla każdej nuty).
+        """
+        if input_block.ndim > 1 and len(input_block) < self.batch_min_rows:
+            return np.stack([self.process_block(row, rate, prev)
+                             for row, rate, prev in zip(input_block, rate_block, prev_out)])
+        if input_block.ndim > 1:
+            output = np.empty(input_block.shape[::-1], dtype=input_block.dtype)
+            rate_block = np.ascontiguousarray(rate_block.T)
+            negative_rate = -rate_block
+            prev_out = np.array(prev_out, dtype=input_block.dtype)
+            diff = np.empty(len(prev_out), dtype=input_block.dtype)
+            for i, input_val in enumerate(input_block.T):
+                np.subtract(input_val, prev_out, out=diff)
+                np.maximum(diff, negative_rate[i], out=diff)
+                np.minimum(diff, rate_block[i], out=diff)
+                prev_out = np.add(prev_out, diff, out=output[i])
+            return output.T
+        
+        # Wyrażenie listowe z porównaniami zamiast min/max i zapisu do tablicy
+        # w każdej próbce; wynik (float64) rzutowany na typ bloku raz na blok
+        prev_out = float(prev_out)
+        output = [prev_out := prev_out + (diff if -rate_limit <= (diff := input_val - prev_out) <= rate_limit
+                                          else rate_limit if diff > 0 else -rate_limit)
+                  for input_val, rate_limit in zip(input_block.tolist(), rate_block.tolist())]
+        return np.array(output, dtype=input_block.dtype)
 
 
 class LinearResonator:
     """Rezonator liniowy z pełną implementacją Fig. 15"""
-    def __init__(self, sample_rate, buffer_size=2048):
+    def __init__(self, sample_rate, buffer_size=2048, dtype=np.float64):
         self.sample_rate = sample_rate
-        self.delay_line = np.zeros(buffer_size)
-        self.delay_index = 0
-        self.filter_state = np.zeros(2)
-        self.apf_state = np.zeros(2)
+        self.buffer_size = buffer_size
+        self.dtype = np.dtype(dtype)
+        self.block_size = 4096
+        # Do tej długości pętla liczona jest jako jeden filtr wymierny (lfilter);
+        # dłuższa - fragmentami długości opóźnienia (koszt lfilter rośnie z opóźnieniem)
+        self.transfer_max_delay = 256
+        
+    def process(self, harmonic_signal, noise_signal, params, num_samples, delay_length=None, out=None):
+        """Rezonans całej nuty; out (jeśli podano) przyjmuje najpierw sumę wejść, potem wynik"""
+        # Blok wejścia jest w pełni odczytany, zanim w jego miejsce trafi wyjście
+        combined_input = np.add(harmonic_signal, noise_signal, out=out)
+        output = combined_input if out is not None else np.empty(combined_input.shape, dtype=self.dtype)
+        self.start(params, delay_length, len(combined_input) if combined_input.ndim > 1 else None)
+        
+        for start in range(0, num_samples, self.block_size):
+            stop = min(start + self.block_size, num_samples)
+            output[..., start:stop] = self.process_block(combined_input[..., start:stop])
+            
+        return output
+    
+    def delay_for(self, freq):
+        """Długość linii opóźnienia dostrojona do okresu dźwięku"""
+        return max(1, int(round(self.sample_rate / freq)))
+    
+    def start(self, params, delay_length=None, num_notes=None):
+        """Zeruje pętlę rezonatora dla nowej nuty (domyślnie opóźnienie buffer_size).
         
-    def process(self, harmonic_signal, noise_signal, params, num_samples):
-        output = np.zeros(num_samples)
-        combined_input = harmonic_signal + noise_signal
+        Przy num_notes pętla obsługuje tyle nut naraz (bloki nuty × próbki).
+        """
+        self.params = params
+        self.position = 0
+        self.delay_length = delay_length or self.buffer_size
+        notes = () if num_notes is None else (num_notes,)
+        self.delay_line = np.zeros(notes + (self.delay_length,), dtype=self.dtype)
+        self.apf_state = np.zeros(notes + (1,), dtype=self.dtype)
         
         # Inicjalizacja filtrów
-        self.lp_b, self.lp_a = sig.butter(2, 4000, 'lowpass', fs=self.sample_rate)
-        self.hp_b, self.hp_a = sig.butter(2, 50, 'highpass', fs=self.sample_rate)
+        self.lp = FilterSection.butter(2, 4000, 'lowpass', self.sample_rate,
+                                       channels=num_notes, dtype=self.dtype)
+        self.hp = FilterSection.butter(2, 50, 'highpass', self.sample_rate,
+                                       channels=num_notes, dtype=self.dtype)
+        self.apf_b = np.array([0.7, 1.0], dtype=self.dtype)
+        self.apf_a = np.array([1.0, 0.7], dtype=self.dtype)
         
-        for i in range(num_samples):
-            # Pobierz opóźnioną wartość
-            delay_output = self.delay_line[self.delay_index]
-            
-            # Filtr dolnoprzepustowy
-            lp_filtered = sig.lfilter(self.lp_b, self.lp_a, [delay_output])[0]
-            
-            # Filtr górnoprzepustowy
-            hp_filtered = sig.lfilter(self.hp_b, self.hp_a, [lp_filtered])[0]
-            
-            # Obwiednia sprzężenia zwrotnego
-            if i < params['RESONATOR_ATTACK'] * self.sample_rate:
-                fb_gain = params['FBK'] * 1.2  # Wzmocnione sprzężenie podczas ataku
-            else:
-                fb_gain = params['FBK']
-            
-            # Filtr wszechprzepustowy
-            apf_output = 0.7 * hp_filtered + self.apf_state[0]
-            self.apf_state[0] = hp_filtered - 0.7 * apf_output
+        self.transfer = None
+        if self.delay_length <= self.transfer_max_delay:
+            self._start_transfer(notes)
+    
+    def reset_note(self, k):
+        """Zeruje pętlę nuty k (wiersza bloków) przed nową nutą"""
+        self.delay_line[k] = 0.0
+        self.apf_state[k] = 0.0
+        self.lp.zi[:, k] = 0.0
+        self.hp.zi[:, k] = 0.0
+    
+    def _start_transfer(self, notes):
+        """Pętla jako filtr wymierny: Y/X = z^-L A / (A - c z^-L B).
+        
+        B/A to kaskada LP -> HP -> APF, c = TFBK * FBK. Wzmocnione sprzężenie
+        ataku (c_att = 1.2 c) nie jest przełączane zmianą współczynników -
+        różnica (c_att - c) * w, gdzie w = B/A y, jest dodawana do wejścia
+        filtru, co daje wynik równy pętli próbka po próbce. Podczas ataku w
+        pochodzi z drugiego filtru o wzmocnieniu c_att (dokładnego do końca ataku).
+        """
+        params = self.params
+        L = self.delay_length
+        lp_b, lp_a = sig.sos2tf(self.lp.sos.astype(float))
+        hp_b, hp_a = sig.sos2tf(self.hp.sos.astype(float))
+        loop_b = np.convolve(np.convolve(lp_b, hp_b), [0.7, 1.0])
+        loop_a = np.convolve(np.convolve(lp_a, hp_a), [1.0, 0.7])
+        
+        delayed_b = np.concatenate((np.zeros(L), loop_b))
+        numerator = np.concatenate((np.zeros(L), loop_a))
+        denominator = np.concatenate((loop_a, np.zeros(L)))
+        gain = params['TFBK'] * params['FBK']
+        attack_gain = params['TFBK'] * params['FBK'] * 1.2
+        
+        state = notes + (len(numerator) - 1,)
+        self.transfer = {
+            'b': numerator,
+            'a': denominator - gain * delayed_b,
+            'zi': np.zeros(state),
+            'attack_a': denominator - attack_gain * delayed_b,
+            'attack_zi': np.zeros(state),
+            'loop_b': loop_b,
+            'loop_a': loop_a,
+            'loop_zi': np.zeros(notes + (len(loop_a) - 1,)),
+            'attack_delta': attack_gain - gain,
+            'attack_end': int(np.ceil(params['RESONATOR_ATTACK'] * self.sample_rate)),
+        }
+    
+    def _process_transfer(self, combined_input):
+        t = self.transfer
+        x = combined_input.astype(float)
+        attack_left = t['attack_end'] - self.position
+        if attack_left > 0:
+            attack_y, t['attack_zi'] = sig.lfilter(t['b'], t['attack_a'], x, zi=t['attack_zi'])
+            w, t['loop_zi'] = sig.lfilter(t['loop_b'], t['loop_a'], attack_y, zi=t['loop_zi'])
+            x[..., :attack_left] += t['attack_delta'] * w[..., :attack_left]
+        output, t['zi'] = sig.lfilter(t['b'], t['a'], x, zi=t['zi'])
+        self.position += combined_input.shape[-1]
+        return output.astype(self.dtype, copy=False)
+    
+    def process_block(self, combined_input):
+        """Przepuszcza blok pobudzenia (harmoniczne + szum) przez pętlę rezonatora.
+        
+        Krótka pętla (delay_length <= transfer_max_delay, np. dostrojona do
+        wysokich nut) to jeden filtr wymierny. W dłuższej wejście wraca na
+        wyjście linii dopiero po delay_length próbkach, więc fragmenty tej
+        długości liczone są wektorowo ze znanej historii.
+        """
+        if self.transfer is not None:
+            return self._process_transfer(combined_input)
+        
+        output = self.process_notes(combined_input, None, self.params, self.position)
+        self.position += combined_input.shape[-1]
+        return output
+    
+    def process_notes(self, combined_input, rows, params, start):
+        """Pętla fragmentami długości opóźnienia dla wybranych nut (wierszy stanu).
+        
+        rows, params i start jak w NoiseGenerator.process_notes; filtr
+        wymierny krótkiej pętli nie jest tu używany.
+        """
+        num_samples = combined_input.shape[-1]
+        output = np.empty(combined_input.shape, dtype=self.dtype)
+        attack_samples = params['RESONATOR_ATTACK'] * self.sample_rate
+        delay_line, apf_state = self.delay_line, self.apf_state
+        if rows is not None:
+            delay_line, apf_state = delay_line[rows], apf_state[rows]
+        
+        for chunk_start in range(0, num_samples, self.delay_length):
+            chunk_stop = min(chunk_start + self.delay_length, num_samples)
+            n = chunk_stop - chunk_start
             
-            # Sprzężenie zwrotne
-            feedback = params['TFBK'] * apf_output * fb_gain
+            # Wyjście linii opóźnienia
+            delay_output = delay_line[..., :n]
             
-            # Sumator wejściowy
-            input_sum = combined_input[i] + feedback
+            # Filtry dolno- i górnoprzepustowy
+            hp_filtered = self.hp.process(self.lp.process(delay_output, rows), rows)
             
-            # Linia opóźnienia
-            self.delay_line[self.delay_index] = input_sum
+            # Obwiednia sprzężenia zwrotnego - wzmocnione sprzężenie podczas ataku
+            index = start + np.arange(chunk_start, chunk_stop)
+            fb_gain = np.where(index < attack_samples, params['FBK'] * 1.2, params['FBK']).astype(self.dtype)
             
-            # Wyjście
-            output[i] = delay_output
+            # Filtr wszechprzepustowy H(z) = (0.7 + z^-1) / (1 + 0.7 z^-1)
+            apf_output, apf_state = sig.lfilter(self.apf_b, self.apf_a, hp_filtered, zi=apf_state)
             
-            # Aktualizacja indeksu
-            self.delay_index = (self.delay_index + 1) % len(self.delay_line)
+            # Sprzężenie zwrotne i sumator wejściowy
+            input_sum = combined_input[..., chunk_start:chunk_stop] + params['TFBK'] * apf_output * fb_gain
             
+            # Wyjście i aktualizacja linii opóźnienia
+            output[..., chunk_start:chunk_stop] = delay_output
+            delay_line = np.concatenate((delay_line[..., n:], input_sum), axis=-1)
+        
+        if rows is None:
+            self.delay_line, self.apf_state = delay_line, apf_state
+        else:
+            self.delay_line[rows], self.apf_state[rows] = delay_line, apf_state
         return output
 
 
 class EnvelopeGenerator:
     """Generator obwiedni z pełną implementacją Fig. 7, 13-14"""
-    def __init__(self, sample_rate):
+    def __init__(self, sample_rate, dtype=np.float64):
         self.sample_rate = sample_rate
+        self.dtype = np.dtype(dtype)
         
     def attack_sustain_release(self, sample_index, total_samples, params):
         """Obwiednia ADSR dla składowej harmonicznej"""
@@ -355,6 +1415,445 @@ class EnvelopeGenerator:
         if sample_index < attack_time * self.sample_rate:
             return sample_index / (attack_time * self.sample_rate)
         return 1.0
+    
+    def attack_sustain_release_array(self, total_samples, params):
+        """Cała obwiednia harmoniczna jako tablica (tylko do odczytu, z envelope_cache)"""
+        return _attack_sustain_release_array(
+            params['attack_time'], params['decay_time'], params['sustain_level'],
+            params['release_time'], params['initial_level'],
+            total_samples, self.sample_rate, self.dtype)
+    
+    def attack_sustain_release_segment(self, start, num_samples, release_start, params):
+        """Fragment obwiedni harmonicznej [start, start + num_samples).
+        
+        release_start to próbka note-off (None - nuta nadal trzymana). Note-off
+        w trakcie ataku lub opadania rozpoczyna wybrzmiewanie od bieżącego
+        poziomu obwiedni. Po zakończeniu wybrzmiewania obwiednia pozostaje równa zeru.
+        """
+        attack_end = int(params['attack_time'] * self.sample_rate)
+        decay_end = attack_end + int(params['decay_time'] * self.sample_rate)
+        release_samples = int(params['release_time'] * self.sample_rate)
+        release_level = None
+        if release_start is not None:
+            release_level = _attack_decay_level(release_start, attack_end, decay_end,
+                                                params['sustain_level'], params['initial_level'])
+        return _attack_sustain_release_segment(
+            start, num_samples, attack_end, decay_end, release_start, release_samples,
+            params['sustain_level'], params['initial_level'], release_level).astype(self.dtype, copy=False)
+    
+    def noise_envelope_segment(self, start, num_samples, params):
+        """Fragment obwiedni szumu [start, start + num_samples).
+        
+        start i params['NOISE_ATTACK'] mogą być kolumnami (nuty × 1) - wynik
+        ma wtedy wiersz na nutę.
+        """
+        attack_samples = params['NOISE_ATTACK'] * self.sample_rate
+        if np.all(attack_samples <= start):
+            return np.ones(num_samples, dtype=self.dtype)
+        return _noise_envelope_segment(start, num_samples, attack_samples).astype(self.dtype, copy=False)
+
+
+@functools.lru_cache(maxsize=None)
+def _polyphase_fir(factor, taps_per_phase):
+    """Dolnoprzepustowy FIR dla zmiany częstotliwości o factor (pasmo do 0.8 nowego Nyquista)"""
+    taps = sig.firwin(factor * taps_per_phase, 0.8 / factor, window=('kaiser', 8.0))
+    taps.setflags(write=False)
+    return taps
+
+
+@functools.lru_cache(maxsize=None)
+def _lfo_tables(size):
+    """Tablice trójkąta i paraboli LFO dla fazy 0..2π (z dodatkowym punktem końcowym)"""
+    phase = np.linspace(0, 2 * np.pi, size + 1)
+    triangle = 2 * np.abs(phase / np.pi - 1) - 1
+    parabola = np.where(phase < np.pi,
+                        2 * (phase/np.pi)**2 - 1,
+                        1 - 2 * ((phase-np.pi)/np.pi)**2)
+    triangle.setflags(write=False)
+    parabola.setflags(write=False)
+    return triangle, parabola
+
+
+def _attack_sustain_release_segment(start, num_samples, attack_end, decay_end, release_start,
+                                    release_samples, sustain_level, initial_level, release_level=None):
+    stop = start + num_samples
+    if release_start is None:
+        release_start = stop
+    
+    if release_level is None:
+        # Segmenty są ciągłe, a wcześniejszy ma pierwszeństwo (jak w wersji skalarnej)
+        release_level = sustain_level
+        b1 = min(max(attack_end, start), stop)
+        b2 = min(max(decay_end, b1), stop)
+        b3 = min(max(release_start, b2), stop)
+    else:
+        # Note-off przerywa atak lub opadanie - wybrzmiewanie od poziomu release_level
+        b3 = min(max(release_start, start), stop)
+        b1 = min(max(attack_end, start), b3)
+        b2 = min(max(decay_end, b1), b3)
+    b1, b2, b3 = b1 - start, b2 - start, b3 - start
+    
+    index = np.arange(start, stop, dtype=float)
+    envelope = np.empty(num_samples)
+    envelope[:b1] = initial_level + (1.0 - initial_level) * (index[:b1] / attack_end)
+    envelope[b1:b2] = 1.0 - (1.0 - sustain_level) * ((index[b1:b2] - attack_end) / (decay_end - attack_end))
+    envelope[b2:b3] = sustain_level
+    if release_samples > 0:
+        envelope[b3:] = release_level * np.maximum(1 - (index[b3:] - release_start) / release_samples, 0.0)
+    else:
+        envelope[b3:] = 0.0
+    return envelope
+
+
+def _attack_decay_level(index, attack_end, decay_end, sustain_level, initial_level):
+    """Poziom obwiedni przed wybrzmiewaniem w próbce index"""
+    if index < attack_end:
+        return initial_level + (1.0 - initial_level) * (index / attack_end)
+    if index < decay_end:
+        return 1.0 - (1.0 - sustain_level) * ((index - attack_end) / (decay_end - attack_end))
+    return sustain_level
+
+
+def _noise_envelope_segment(start, num_samples, attack_samples):
+    index = start + np.arange(num_samples)
+    if np.all(attack_samples > 0):
+        return np.minimum(index / attack_samples, 1.0)
+    # Nuty bez narastania (attack_samples = 0) mają obwiednię 1
+    attacking = attack_samples > 0
+    return np.where(attacking, np.minimum(index / np.where(attacking, attack_samples, 1), 1.0), 1.0)
+
+
+def _attack_sustain_release_array(attack_time, decay_time, sustain_level, release_time,
+                                  initial_level, total_samples, sample_rate, dtype=np.float64):
+    key = (attack_time, decay_time, sustain_level, release_time, initial_level,
+           total_samples, sample_rate, np.dtype(dtype).str)
+    envelope = envelope_cache.get(key)
+    if envelope is not None:
+        return envelope
+    
+    attack_end = int(attack_time * sample_rate)
+    decay_end = attack_end + int(decay_time * sample_rate)
+    release_samples = int(release_time * sample_rate)
+    envelope = _attack_sustain_release_segment(
+        0, total_samples, attack_end, decay_end, total_samples - release_samples,
+        release_samples, sustain_level, initial_level).astype(dtype, copy=False)
+    envelope.setflags(write=False)
+    envelope_cache.put(key, envelope)
+    return envelope
+
+
+class EnvelopeCache:
+    """Cache LRU gotowych obwiedni ograniczony łączną liczbą bajtów.
+    
+    Obwiednia ma długość całej nuty (20 s float64 to ~7 MB), więc limit
+    liczby wpisów nie ogranicza pamięci - liczy się suma nbytes.
+    """
+    def __init__(self, max_bytes=64 * 1024**2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._envelopes = collections.OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            envelope = self._envelopes.get(key)
+            if envelope is not None:
+                self._envelopes.move_to_end(key)
+            return envelope
+    
+    def put(self, key, envelope):
+        """Zapamiętuje obwiednię; większa niż max_bytes nie jest zapamiętywana"""
+        if envelope.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._envelopes.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._envelopes[key] = envelope
+            self.nbytes += envelope.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._envelopes.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+    
+    def clear(self):
+        with self._lock:
+            self._envelopes.clear()
+            self.nbytes = 0
+    
+    def __len__(self):
+        return len(self._envelopes)
+
+
+envelope_cache = EnvelopeCache()
+
+
+
+class FilterSection:
+    """Filtr IIR w postaci kaskady sekcji bikwadratowych (SOS) ze stanem.
+    
+    Stan (zi) jest przenoszony między wywołaniami, więc sygnał można
+    podawać blokami dowolnej długości.
+    
+    Przy channels filtr przetwarza bloki (kanały × próbki) tym samym projektem;
+    sos o kształcie (kanały, sekcje, 6) to osobny projekt dla każdego kanału.
+    Współczynniki i stan mają typ dtype, więc float32 filtruje w float32.
+    """
+    def __init__(self, sos, channels=None, dtype=np.float64):
+        sos = np.array(sos, dtype=dtype)
+        if sos.ndim == 3:
+            self.sos = sos
+            self.zi = np.zeros((sos.shape[0], sos.shape[1], 2), dtype=dtype)
+            return
+        self.sos = np.atleast_2d(sos)
+        if channels is None:
+            self.zi = np.zeros((self.sos.shape[0], 2), dtype=dtype)
+        else:
+            self.zi = np.zeros((self.sos.shape[0], channels, 2), dtype=dtype)
+    
+    @classmethod
+    def butter(cls, order, cutoff, btype, fs, channels=None, dtype=np.float64):
+        """Filtr Butterwortha w postaci SOS, projekt pobierany z filter_design_cache"""
+        return cls(filter_design_cache.butter(order, cutoff, btype, fs), channels, dtype)
+    
+    @classmethod
+    def butter_bank(cls, order, cutoffs, btype, fs, dtype=np.float64):
+        """Zestaw filtrów Butterwortha, po jednym na kanał (cutoffs[k] dla kanału k)"""
+        designs = [filter_design_cache.butter(order, cutoff, btype, fs) for cutoff in cutoffs]
+        return cls(np.stack(designs), dtype=dtype)
+    
+    def reset(self):
+        self.zi[:] = 0.0
+    
+    def process(self, block, rows=None):
+        """Filtruje blok próbek, kontynuując od stanu poprzedniego wywołania.
+        
+        rows (przy channels) to numery kanałów odpowiadające wierszom bloku;
+        stan pozostałych kanałów się nie zmienia.
+        """
+        if self.sos.ndim == 3:
+            output = np.empty(block.shape, dtype=self.sos.dtype)
+            for k, channel in enumerate(range(len(self.sos)) if rows is None else rows):
+                output[k], self.zi[channel] = sig.sosfilt(self.sos[channel], block[k], zi=self.zi[channel])
+            return output
+        if rows is None:
+            output, self.zi = sig.sosfilt(self.sos, block, axis=-1, zi=self.zi)
+            return output
+        output, self.zi[:, rows] = sig.sosfilt(self.sos, block, axis=-1, zi=self.zi[:, rows])
+        return output
+
+
+
+class FilterDesignCache:
+    """Ograniczony (LRU) cache projektów filtrów wspólny dla całego procesu.
+    
+    Projekt zależy tylko od (order, cutoff, btype, fs), więc kolejne nuty,
+    głosy i instancje generatorów korzystają z tych samych współczynników.
+    Zawartość można zapisać na dysk (save) i wczytać w kolejnym procesie (load).
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._designs = collections.OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(order, cutoff, btype, fs):
+        cutoff = tuple(float(c) for c in np.atleast_1d(cutoff))
+        return (int(order), cutoff, btype, float(fs))
+    
+    def butter(self, order, cutoff, btype, fs):
+        """Zwraca współczynniki SOS filtra Butterwortha (tablica tylko do odczytu)"""
+        key = self._key(order, cutoff, btype, fs)
+        with self._lock:
+            sos = self._designs.get(key)
+            if sos is not None:
+                self._designs.move_to_end(key)
+                self.hits += 1
+                return sos
+        
+        cutoff = key[1][0] if len(key[1]) == 1 else list(key[1])
+        sos = sig.butter(order, cutoff, btype=btype, fs=fs, output='sos')
+        sos.setflags(write=False)
+        
+        with self._lock:
+            self.misses += 1
+            self._store(key, sos)
+        return sos
+    
+    def _store(self, key, sos):
+        self._designs[key] = sos
+        self._designs.move_to_end(key)
+        while len(self._designs) > self.maxsize:
+            self._designs.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._designs.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def __len__(self):
+        return len(self._designs)
+    
+    def save(self, path):
+        """Zapisuje projekty do pliku .npz (klucze jako JSON, bez pickle)"""
+        with self._lock:
+            designs = [(key, sos.copy()) for key, sos in self._designs.items()]
+        keys = json.dumps([[order, list(cutoff), btype, fs] for (order, cutoff, btype, fs), _ in designs])
+        arrays = {f'sos{k}': sos for k, (_, sos) in enumerate(designs)}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=np.array(keys), **arrays)
+        os.replace(tmp_path, path)
+    
+    def load(self, path):
+        """Dołącza projekty zapisane przez save(); brak pliku nie jest błędem"""
+        if not os.path.exists(path):
+            return 0
+        with np.load(path, allow_pickle=False) as data:
+            keys = json.loads(str(data['keys']))
+            designs = [((order, tuple(cutoff), btype, fs), data[f'sos{k}'])
+                       for k, (order, cutoff, btype, fs) in enumerate(keys)]
+        with self._lock:
+            for key, sos in designs:
+                sos = np.asarray(sos, dtype=float)
+                sos.setflags(write=False)
+                self._store(key, sos)
+        return len(designs)
+
+
+filter_design_cache = FilterDesignCache()
+
+
+class RenderStats:
+    """Statystyki etapów renderowania (czas, próbki, alokacje) dla wielu nut.
+    
+    Każda nuta to wpis z jej częstotliwością i etapami; wywołania tego samego
+    etapu (np. kolejne bloki strumienia) są sumowane. Statystyki z wielu
+    procesów łączy merge(), a summary() agreguje etapy całej partii.
+    Przy track_allocations pamięć mierzona jest przez tracemalloc (wolniej):
+    alloc_peak to szczyt ponad stan sprzed etapu, alloc_net - przyrost netto.
+    """
+    def __init__(self, track_allocations=False):
+        self.track_allocations = track_allocations
+        self.notes = []
+        self._started_tracing = False
+        if track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+    
+    def begin_note(self, freq, samples=None):
+        note = {'freq': freq, 'samples': samples, 'stages': {}}
+        self.notes.append(note)
+        return note
+    
+    @contextlib.contextmanager
+    def stage(self, note, name, samples):
+        """Mierzy blok kodu jako etap name nuty note"""
+        if self.track_allocations:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = note['stages'].setdefault(name, {'seconds': 0.0, 'samples': 0, 'calls': 0})
+            entry['seconds'] += elapsed
+            entry['samples'] += samples
+            entry['calls'] += 1
+            if self.track_allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                entry['alloc_peak'] = max(entry.get('alloc_peak', 0), peak - before)
+                entry['alloc_net'] = entry.get('alloc_net', 0) + current - before
+    
+    def merge(self, other):
+        """Dołącza nuty z innych statystyk (np. z procesu roboczego)"""
+        self.notes.extend(other.notes)
+        return self
+    
+    def summary(self):
+        """Etapy zsumowane po wszystkich nutach, z przepustowością i udziałem w czasie"""
+        stages = {}
+        for note in self.notes:
+            for name, entry in note['stages'].items():
+                total = stages.setdefault(name, {'seconds': 0.0, 'samples': 0, 'calls': 0, 'notes': 0})
+                total['seconds'] += entry['seconds']
+                total['samples'] += entry['samples']
+                total['calls'] += entry['calls']
+                total['notes'] += 1
+                if 'alloc_peak' in entry:
+                    total['alloc_peak'] = max(total.get('alloc_peak', 0), entry['alloc_peak'])
+                    total['alloc_net'] = total.get('alloc_net', 0) + entry['alloc_net']
+        
+        overall = sum(total['seconds'] for total in stages.values())
+        for total in stages.values():
+            total['samples_per_s'] = total['samples'] / total['seconds'] if total['seconds'] else None
+            total['share'] = total['seconds'] / overall if overall else None
+        return stages
+    
+    def to_dict(self):
+        return {'notes': self.notes, 'stages': self.summary()}
+    
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.notes = list(data['notes'])
+        return stats
+    
+    def to_json(self, path=None):
+        """Eksport do JSON - zwraca tekst lub zapisuje go do pliku path"""
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is None:
+            return text
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    
+    def close(self):
+        """Zatrzymuje tracemalloc, jeśli uruchomiły go te statystyki"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+_NO_STAGE = contextlib.nullcontext()
+
+
+def _no_stage(note, name, samples):
+    return _NO_STAGE
+
+
+def _normalize(output):
+    """Usuwa składową stałą i normalizuje do szczytu 1 (w miejscu, wzdłuż ostatniej osi)"""
+    output -= np.mean(output, axis=-1, keepdims=True)
+    peak = np.maximum(np.max(output, axis=-1, keepdims=True), -np.min(output, axis=-1, keepdims=True))
+    output /= peak
+    return output
+
+
+def default_rng(params):
+    """Generator losowy z ziarna params['seed'] (brak ziarna - losowe)"""
+    return np.random.default_rng(params.get('seed'))
+
+
+def note_rngs(params, freq):
+    """Niezależne generatory (harmoniczny, szumowy) nuty o danej częstotliwości.
+    
+    Ziarno łączy params['seed'] z wysokością, więc kolejne klawisze mają różny,
+    ale powtarzalny szum, a wynik nie zależy od kolejności przetwarzania bloków.
+    """
+    seed = params.get('seed')
+    if seed is None:
+        sequence = np.random.SeedSequence()
+    else:
+        sequence = np.random.SeedSequence([seed, int(round(freq * 1000))])
+    return [np.random.default_rng(child) for child in sequence.spawn(2)]
+
+
+def midi_to_freq(note, a4=440.0):
+    """Częstotliwość równomiernie temperowana dla numeru nuty MIDI"""
+    return a4 * 2.0 ** ((note - 69) / 12.0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,302 @@
+import collections
+import math
+
+import numpy as np
+
+from .physis import (EnvelopeGenerator, FilterSection, FrequencyModulator, HarmonicGenerator,
+                     HarmonicOscillator, LinearResonator, LowFrequencyOscillator, NoiseGenerator,
+                     filter_design_cache, midi_to_freq, note_rngs)
+
+# Parametry liczbowe głosu trzymane w tablicy banku (wiersz - parametr, kolumna - głos)
+BANK_PARAMS = ('GAIN1', 'CLIP1', 'GAIN2', 'CLIP2', 'MOD_AMPL', 'CBYP', 'CDEL', 'X0', 'Y0',
+               'GAIND', 'GAINF', 'RATE_GAIN', 'NOISE_ATTACK', 'NBFBK', 'NCGAIN', 'NGAIN',
+               'FBK', 'TFBK', 'RESONATOR_ATTACK', 'OUTPUT_GAIN', 'epsilon')
+OPTIONAL_PARAMS = {'OUTPUT_GAIN': 1.0, 'epsilon': 1e-5}
+
+# Szczyt pojedynczego głosu przy domyślnych parametrach (strumień nie jest normalizowany).
+# Zmierzony jako max |render_stream| dla MIDI 36-96, 2 s na nutę: 38.6 (mediana 29.8),
+# zaokrąglony w górę. Zmiana parametrów domyślnych wymaga ponownego pomiaru.
+VOICE_PEAK = 40.0
+
+
+class Voice:
+    """Pojedynczy głos puli - wiersz index w stanie VoiceBank.
+
+    Obiekty rekurencji (oscylator, modulator) i rezonator strojony tworzone
+    są raz, przy budowie puli; nowa nuta tylko zeruje ich stan.
+    """
+    __slots__ = ('index', 'key', 'params', 'freq', 'position', 'release_start', 'release_samples',
+                 'decimation', 'osc', 'modulator', 'resonator')
+
+    def __init__(self, index, sample_rate, dtype=np.float64):
+        self.index = index
+        self.key = None
+        self.params = None
+        self.osc = HarmonicOscillator(sample_rate, dtype)
+        self.modulator = FrequencyModulator(sample_rate)
+        self.resonator = LinearResonator(sample_rate, dtype=dtype)
+
+    def note_off(self):
+        """Rozpoczyna wybrzmiewanie od bieżącej próbki i bieżącego poziomu obwiedni"""
+        if self.release_start is None:
+            self.release_start = self.position
+
+    @property
+    def finished(self):
+        return (self.release_start is not None
+                and self.position >= self.release_start + self.release_samples)
+
+
+class VoiceBank:
+    """Stan syntezy wszystkich głosów puli (wiersz na głos).
+
+    render() zbiera wiersze aktywnych głosów i liczy je razem ścieżkami
+    wsadowymi generatorów: HarmonicOscillator.process_batch,
+    HarmonicGenerator.shape_block, NoiseGenerator.process_notes
+    i LinearResonator.process_notes - filtry o wspólnym projekcie to jedno
+    wywołanie sosfilt dla wszystkich głosów. Każdy głos ma własne parametry
+    (kolumna values), pozycję i obwiednię.
+
+    Wynik głosu odpowiada NoteStream tej samej nuty, z dwoma wyjątkami:
+    LFO modulacji amplitudy jest wspólne dla banku (jak tremolo całego
+    instrumentu), a tryb SUSTAIN_LOOP jest pomijany (jak w render_notes).
+    """
+    def __init__(self, sample_rate, num_voices, block_size, dtype=np.float64):
+        self.sample_rate = sample_rate
+        self.num_voices = num_voices
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype)
+        self.env_gen = EnvelopeGenerator(sample_rate, self.dtype)
+        self.lfo = LowFrequencyOscillator(sample_rate, dtype=self.dtype)
+        self.values = np.zeros((len(BANK_PARAMS), num_voices))
+
+        # Składowa harmoniczna: linia opóźnienia i filtr BP (osobny projekt na głos)
+        self.harmonic_delay = np.zeros((num_voices, 1024), dtype=self.dtype)
+        self.bp = FilterSection(np.zeros((num_voices, 2, 6)), dtype=self.dtype)
+
+        # Szum: generator na każde używane NOISE_DECIMATION, tworzony w miarę potrzeby
+        self.noise_gens = {}
+
+        # Rezonator o stałym opóźnieniu (głosy strojone mają własny LinearResonator)
+        self.resonator = LinearResonator(sample_rate, dtype=self.dtype)
+        self.resonator.start({}, num_notes=num_voices)
+
+        self.dc_blocker = FilterSection.butter(1, 20, 'highpass', sample_rate, channels=num_voices,
+                                               dtype=self.dtype)
+
+    def start(self, voice, freq, params):
+        """Zeruje stan głosu i przypisuje mu nową nutę"""
+        decimation = int(params.get('NOISE_DECIMATION', 1))
+        if self.block_size % decimation:
+            raise ValueError(f"block_size={self.block_size} musi być wielokrotnością "
+                             f"NOISE_DECIMATION={decimation}")
+        noise_gen = self._noise_gen(decimation, params)
+
+        i = voice.index
+        voice.params = params
+        voice.freq = freq
+        voice.position = 0
+        voice.release_start = None
+        voice.release_samples = int(params['release_time'] * self.sample_rate)
+        voice.decimation = decimation
+        self.values[:, i] = [params.get(name, OPTIONAL_PARAMS[name]) if name in OPTIONAL_PARAMS
+                             else params[name] for name in BANK_PARAMS]
+
+        harmonic_rng, noise_rng = note_rngs(params, freq)
+        voice.osc.reset()
+        voice.modulator.reset(harmonic_rng)
+        self.harmonic_delay[i] = 0.0
+        self.bp.sos[i] = filter_design_cache.butter(2, [0.9*freq, 1.1*freq], 'bandpass', self.sample_rate)
+        self.bp.zi[i] = 0.0
+
+        noise_gen.reset_note(i, noise_rng)
+
+        if params.get('RESONATOR_TUNED', False):
+            voice.resonator.start(params, voice.resonator.delay_for(freq))
+        self.resonator.reset_note(i)
+        self.dc_blocker.zi[:, i] = 0.0
+
+    def _noise_gen(self, decimation, params):
+        """Generator szumu (wiersz na głos) dla danego NOISE_DECIMATION"""
+        noise_gen = self.noise_gens.get(decimation)
+        if noise_gen is None:
+            noise_gen = NoiseGenerator(self.sample_rate, self.dtype)
+            # ValueError dla zbyt dużego M pochodzi z NoiseGenerator.start
+            noise_gen.start({'NOISE_DECIMATION': decimation}, rng=[None] * self.num_voices,
+                            num_notes=self.num_voices)
+            self.noise_gens[decimation] = noise_gen
+        return noise_gen
+
+    def render(self, voices, n):
+        """Blok (głosy × n próbek) dla listy aktywnych głosów"""
+        rows = np.array([voice.index for voice in voices])
+        values = dict(zip(BANK_PARAMS, self.values[:, rows, np.newaxis]))
+        start = np.array([voice.position for voice in voices])[:, np.newaxis]
+
+        harmonic = self._harmonic(voices, rows, values, n)
+        noise = np.empty(harmonic.shape, dtype=self.dtype)
+        for decimation, selected in _groups(voices, lambda voice: voice.decimation):
+            noise[selected] = self.noise_gens[decimation].process_notes(
+                harmonic[selected], rows[selected], _select(values, selected), start[selected])
+
+        combined = harmonic + noise
+        output = np.empty(combined.shape, dtype=self.dtype)
+        for tuned, selected in _groups(voices, lambda voice: bool(voice.params.get('RESONATOR_TUNED', False))):
+            if tuned:
+                for k in selected:
+                    output[k] = voices[k].resonator.process_block(combined[k])
+            else:
+                output[selected] = self.resonator.process_notes(
+                    combined[selected], rows[selected], _select(values, selected), start[selected])
+
+        for voice in voices:
+            voice.position += n
+        return values['OUTPUT_GAIN'] * self.dc_blocker.process(output, rows)
+
+    def _harmonic(self, voices, rows, values, n):
+        """Składowa harmoniczna jak HarmonicGenerator.process_block, dla wszystkich głosów"""
+        sin_wave = np.empty((len(voices), n), dtype=self.dtype)
+        for mode, selected in _groups(voices, lambda voice: voice.params.get('OSC_MODE', 'recurrence')):
+            params = {'OSC_MODE': mode, 'epsilon': values['epsilon'][selected, 0]}
+            sin_wave[selected] = HarmonicOscillator.process_batch(
+                [voices[k].osc for k in selected], [voices[k].freq for k in selected], n, params,
+                [voices[k].modulator for k in selected])
+
+        lfo_amp, _ = self.lfo.process_block(n, freq=False)
+        envelope = np.stack([self.env_gen.attack_sustain_release_segment(
+            voice.position, n, voice.release_start, voice.params) for voice in voices])
+
+        output, self.harmonic_delay[rows] = HarmonicGenerator.shape_block(
+            sin_wave, envelope, 1 + values['MOD_AMPL'] * lfo_amp, self.harmonic_delay[rows],
+            lambda block: self.bp.process(block, rows), values)
+        return output
+
+
+def _select(values, selected):
+    """Kolumny parametrów tylko dla wybranych wierszy bloku"""
+    return {name: value[selected] for name, value in values.items()}
+
+
+def _groups(voices, key):
+    """[(wartość klucza, indeksy głosów)] - zwykle jedna grupa dla całej rejestracji"""
+    groups = collections.defaultdict(list)
+    for k, voice in enumerate(voices):
+        groups[key(voice)].append(k)
+    return [(value, np.array(selected)) for value, selected in groups.items()]
+
+
+class VoicePool:
+    """Pula głosów z przydziałem i kradzieżą w czasie O(1).
+
+    Wolne głosy trzymane są na stosie, aktywne w dwóch kolejkach
+    (trzymane / wybrzmiewające) uporządkowanych od najstarszego.
+    Kradzież zabiera najpierw najstarszy wybrzmiewający głos.
+    """
+    def __init__(self, num_voices, sample_rate, dtype=np.float64):
+        self.voices = [Voice(i, sample_rate, dtype) for i in range(num_voices)]
+        self.free = list(reversed(range(num_voices)))
+        self.held = collections.OrderedDict()
+        self.releasing = collections.OrderedDict()
+        self.by_key = {}
+
+    def __len__(self):
+        return len(self.held) + len(self.releasing)
+
+    def allocate(self, key):
+        """Zwraca głos dla klucza, w razie potrzeby kradnąc najstarszy"""
+        if key in self.by_key:
+            self.release(self.by_key[key])
+
+        if self.free:
+            voice = self.voices[self.free.pop()]
+        else:
+            queue = self.releasing if self.releasing else self.held
+            index, _ = queue.popitem(last=False)
+            voice = self.voices[index]
+            if self.by_key.get(voice.key) is voice:
+                del self.by_key[voice.key]
+
+        voice.key = key
+        self.held[voice.index] = None
+        self.by_key[key] = voice
+        return voice
+
+    def release(self, voice):
+        """Przenosi głos do kolejki wybrzmiewających (note-off)"""
+        if voice.index in self.held:
+            del self.held[voice.index]
+            self.releasing[voice.index] = None
+            voice.note_off()
+        if self.by_key.get(voice.key) is voice:
+            del self.by_key[voice.key]
+
+    def free_voice(self, voice):
+        self.held.pop(voice.index, None)
+        self.releasing.pop(voice.index, None)
+        if self.by_key.get(voice.key) is voice:
+            del self.by_key[voice.key]
+        voice.params = None
+        voice.key = None
+        self.free.append(voice.index)
+
+    def active(self):
+        return [self.voices[i] for i in (*self.held, *self.releasing)]
+
+
+class OrganEngine:
+    """Silnik polifoniczny miksujący wiele piszczałek blokami.
+
+    Rejestracja to słownik nazwa głosu organowego -> parametry modelu;
+    note_on() uruchamia po jednym głosie puli dla każdego włączonego registru.
+    Wszystkie aktywne głosy liczone są razem przez VoiceBank.
+
+    Głosy nie są normalizowane (szczyt pojedynczego to ok. VOICE_PEAK), więc
+    szyna jest skalowana przez gain - domyślnie 1 / (VOICE_PEAK·√num_voices),
+    co daje ok. 0.2 dla jednego głosu i zapas dla pełnych akordów.
+    Poziom registru względem innych ustala parametr OUTPUT_GAIN.
+    """
+    def __init__(self, sample_rate=44100, num_voices=32, block_size=512, dtype=np.float64, gain=None):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.gain = gain if gain is not None else 1 / (VOICE_PEAK * math.sqrt(num_voices))
+        self.pool = VoicePool(num_voices, sample_rate, dtype)
+        self.bank = VoiceBank(sample_rate, num_voices, block_size, dtype)
+        self.registration = {}
+        self.bus = np.zeros(block_size, dtype=dtype)
+
+    def set_registration(self, stops):
+        self.registration = dict(stops)
+
+    def note_on(self, note):
+        freq = midi_to_freq(note)
+        for stop, params in self.registration.items():
+            voice = self.pool.allocate((stop, note))
+            self.bank.start(voice, freq, params)
+
+    def note_off(self, note):
+        for stop in self.registration:
+            voice = self.pool.by_key.get((stop, note))
+            if voice is not None:
+                self.pool.release(voice)
+
+    def all_notes_off(self):
+        for voice in self.pool.active():
+            self.pool.release(voice)
+
+    def render_block(self):
+        """Miksuje kolejny blok wszystkich aktywnych głosów.
+
+        Zwracany bufor szyny jest używany ponownie - ważny do następnego wywołania.
+        """
+        bus = self.bus
+        voices = self.pool.active()
+        if not voices:
+            bus[:] = 0.0
+            return bus
+
+        np.sum(self.bank.render(voices, self.block_size), axis=0, out=bus)
+        bus *= self.gain
+        for voice in voices:
+            if voice.finished:
+                self.pool.free_voice(voice)
+        return bus
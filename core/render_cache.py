@@ -0,0 +1,157 @@
+"""Adresowany treścią cache renderów na dysku.
+
+Klucz to skrót SHA-256 wszystkich wejść render_note (parametry, częstotliwość,
+długość, częstotliwość próbkowania, ziarno), więc powtórny render tej samej nuty
+kosztuje jedno mapowanie pliku zamiast pełnej syntezy.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Zmiana silnika syntezy zmieniającą wynik musi zwiększyć tę wersję
+RENDER_CACHE_VERSION = 3
+
+
+class RenderCache:
+    """Cache tablic float32 (.npy, mmap) z usuwaniem najdawniej używanych (LRU).
+
+    Ostatnie użycie zapisywane jest w czasie modyfikacji pliku, więc stan LRU
+    jest współdzielony przez wszystkie procesy korzystające z tego samego katalogu.
+
+    Rozmiar katalogu jest szacowany (ostatnie skanowanie + własne zapisy);
+    pełne skanowanie następuje dopiero, gdy szacunek przekroczy max_bytes
+    albo od ostatniego skanowania zapisano max_bytes / 8 (zapisy innych procesów).
+    Wpis może zniknąć w dowolnej chwili (usunięty przez inny proces),
+    więc brak pliku nigdy nie jest błędem.
+    """
+    def __init__(self, cache_dir, max_bytes=2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._scanned_bytes = None
+        self._written_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(params, freq, duration, sample_rate, seed=None, dtype='float64'):
+        description = {
+            'version': RENDER_CACHE_VERSION,
+            'dtype': str(dtype),
+            'params': params,
+            'freq': float(freq),
+            'duration': float(duration),
+            'sample_rate': int(sample_rate),
+            'seed': seed,
+        }
+        encoded = json.dumps(description, sort_keys=True, default=float)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+
+    def get(self, key):
+        """Zwraca zmapowaną tablicę (tylko do odczytu) lub None"""
+        path = self._path(key)
+        try:
+            audio = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # Usunięty po otwarciu - zmapowana tablica pozostaje ważna
+        return audio
+
+    def put(self, key, audio):
+        """Zapisuje wpis jako float32 i zwraca go zmapowanego; bez pliku - kopię z pamięci"""
+        audio = np.array(audio, dtype=np.float32)
+        if audio.nbytes > self.max_bytes:
+            audio.setflags(write=False)
+            return audio
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Zapis atomowy - równoległe procesy nigdy nie widzą niepełnego pliku
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, audio)
+        os.replace(tmp_path, path)
+
+        self._written_bytes += os.path.getsize(path)
+        if self._needs_eviction():
+            self.evict()
+        try:
+            return np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            # Wpis usunięty przez inny proces między zapisem a odczytem
+            audio.setflags(write=False)
+            return audio
+
+    def render_note(self, organ, freq, duration, params=None):
+        """render_note z odczytem z cache; przy braku wpisu renderuje i zapisuje.
+
+        Zawsze zwraca tablicę float32 tylko do odczytu (zwykle zmapowaną),
+        także przy braku wpisu i niezależnie od organ.dtype - wynik nie zależy
+        od stanu cache. Kopię w innym typie daje audio.astype(...).
+        """
+        if params is None:
+            params = organ.params
+        key = self.key(params, freq, duration, organ.sample_rate, params.get('seed'), organ.dtype)
+
+        audio = self.get(key)
+        if audio is not None:
+            self.hits += 1
+            return audio
+
+        self.misses += 1
+        return self.put(key, organ.render_note(freq, duration, params))
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.npy'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _needs_eviction(self):
+        if self._scanned_bytes is None:
+            return True
+        return (self._scanned_bytes + self._written_bytes > self.max_bytes
+                or self._written_bytes > self.max_bytes // 8)
+
+    def evict(self):
+        """Usuwa najdawniej używane wpisy, aż cache zmieści się w max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._scanned_bytes = total
+        self._written_bytes = 0
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._scanned_bytes = 0
+        self._written_bytes = 0
@@ -0,0 +1,151 @@
+"""Wsadowe renderowanie całego registru (po jednym pliku WAV na klawisz).
+
+Przykład:
+    python -m core.render_rank --stop "Principal 8" --low 36 --high 96 --preset principal.json
+
+Pliki trafiają do <output>/<stop>/A0/<nr MIDI>-<nazwa>.wav, tak jak w zestawach
+próbek (np. sample/HW Principal 8). Istniejące pliki są pomijane, więc przerwane
+lub częściowo nieudane renderowanie można wznowić tym samym poleceniem.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import scipy.io.wavfile as wav
+
+from .physis import PhysicalModelOrgan, RenderStats, midi_to_freq
+from .render_cache import RenderCache
+
+NOTE_NAMES = ['c', 'c#', 'd', 'd#', 'e', 'f', 'f#', 'g', 'g#', 'a', 'a#', 'b']
+
+# Silnik procesu roboczego - tworzony raz przez _init_worker i używany dla wszystkich nut
+_organ = None
+_params = None
+_cache = None
+
+
+def parse_note(text):
+    """Numer MIDI z liczby ('36') lub nazwy nuty ('C2', 'f#3'; C4 = 60)"""
+    if text.isdigit():
+        return int(text)
+    match = re.fullmatch(r'([a-gA-G]#?)(-?\d+)', text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Nieprawidłowa nuta: {text}")
+    name, octave = match.groups()
+    return NOTE_NAMES.index(name.lower()) + 12 * (int(octave) + 1)
+
+
+def note_filename(note):
+    return f"{note:03d}-{NOTE_NAMES[note % 12]}.wav"
+
+
+def load_preset(path, sample_rate):
+    """Parametry domyślne nadpisane wartościami z pliku JSON"""
+    params = PhysicalModelOrgan(sample_rate).default_params()
+    if path:
+        with open(path, encoding='utf-8') as f:
+            params.update(json.load(f))
+    return params
+
+
+def _init_worker(sample_rate, params, cache_dir=None, dtype='float64'):
+    global _organ, _params, _cache
+    _organ = PhysicalModelOrgan(sample_rate, dtype)
+    _params = params
+    _cache = RenderCache(cache_dir) if cache_dir else None
+
+
+def _render_to_file(note, duration, output_path, profile=False):
+    start = time.perf_counter()
+    _organ.stats = RenderStats() if profile else None
+    if _cache is not None:
+        audio = _cache.render_note(_organ, midi_to_freq(note), duration, params=_params)
+    else:
+        audio = _organ.render_note(midi_to_freq(note), duration, params=_params)
+
+    # Zapis atomowy - przerwany zapis nie zostawi pliku, który wznowienie uznałoby za gotowy
+    tmp_path = output_path + '.part'
+    with open(tmp_path, 'wb') as f:
+        wav.write(f, _organ.sample_rate, (audio * 32767).astype(np.int16))
+    os.replace(tmp_path, output_path)
+    stats = _organ.stats.to_dict() if profile else None
+    return time.perf_counter() - start, stats
+
+
+def render_rank(notes, duration, params, output_dir, sample_rate=44100, jobs=None,
+                cache_dir=None, dtype='float64', stats=None, log=print):
+    """Renderuje nuty równolegle; zwraca listę (nuta, błąd) dla nieudanych.
+
+    Przekazany obiekt RenderStats zbiera statystyki etapów ze wszystkich procesów.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pending = []
+    for note in notes:
+        path = os.path.join(output_dir, note_filename(note))
+        if os.path.exists(path):
+            log(f"Pominięto (istnieje): {os.path.basename(path)}")
+        else:
+            pending.append((note, path))
+
+    failures = []
+    if not pending:
+        return failures
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(sample_rate, params, cache_dir, dtype)) as executor:
+        futures = {executor.submit(_render_to_file, note, duration, path, stats is not None): (note, path)
+                   for note, path in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            note, path = futures[future]
+            try:
+                elapsed, note_stats = future.result()
+                if note_stats is not None:
+                    stats.merge(RenderStats.from_dict(note_stats))
+                log(f"[{done}/{len(pending)}] {os.path.basename(path)} ({elapsed:.1f} s)")
+            except Exception as e:
+                failures.append((note, e))
+                log(f"[{done}/{len(pending)}] Błąd {os.path.basename(path)}: {e}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Renderowanie całego registru do plików WAV")
+    parser.add_argument('--stop', default='Physis', help="nazwa registru (folder wyjściowy)")
+    parser.add_argument('--low', type=parse_note, default=36, help="najniższa nuta (MIDI lub np. C2)")
+    parser.add_argument('--high', type=parse_note, default=96, help="najwyższa nuta (MIDI lub np. C7)")
+    parser.add_argument('--duration', type=float, default=3.0, help="długość nuty w sekundach")
+    parser.add_argument('--preset', help="plik JSON z parametrami nadpisującymi domyślne")
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--output', default='output', help="folder wyjściowy")
+    parser.add_argument('--jobs', type=int, default=None, help="liczba procesów (domyślnie liczba rdzeni)")
+    parser.add_argument('--cache', help="katalog cache renderów (core.render_cache)")
+    parser.add_argument('--dtype', choices=['float32', 'float64'], default='float64',
+                        help="typ próbek syntezy (float32 - połowa pamięci)")
+    parser.add_argument('--profile', help="zapisz statystyki etapów syntezy do pliku JSON")
+    args = parser.parse_args(argv)
+
+    params = load_preset(args.preset, args.sample_rate)
+    output_dir = os.path.join(args.output, args.stop, 'A0')
+    notes = range(args.low, args.high + 1)
+
+    stats = RenderStats() if args.profile else None
+    start = time.perf_counter()
+    failures = render_rank(notes, args.duration, params, output_dir,
+                           sample_rate=args.sample_rate, jobs=args.jobs, cache_dir=args.cache,
+                           dtype=args.dtype, stats=stats)
+    print(f"Zakończono w {time.perf_counter() - start:.1f} s, błędy: {len(failures)}")
+    
+    if stats is not None:
+        for name, total in stats.summary().items():
+            print(f"  {name:<10} {total['seconds']:8.2f} s  {total['share']:6.1%}")
+        stats.to_json(args.profile)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
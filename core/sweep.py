@@ -0,0 +1,217 @@
+"""Przyrostowe renderowanie dla przeszukiwania parametrów (sweep).
+
+Ścieżka render_note jest grafem etapów (harmonic -> noise -> resonator ->
+output). Każdy etap deklaruje klucze parametrów, od których zależy, więc jego
+wynik można zapamiętać pod kluczem złożonym z tych wartości i kluczy etapów
+wejściowych. Zmiana np. tylko FBK/TFBK przelicza wyłącznie rezonator
+i normalizację, a składowe harmoniczna i szumowa pochodzą z cache.
+
+Przykład:
+    params = [dict(base, FBK=fbk) for fbk in np.linspace(0.5, 0.95, 10)]
+    results = sweep(params, 261.63, 3.0, jobs=4)
+"""
+import collections
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .physis import PhysicalModelOrgan, _normalize, note_rngs
+
+Stage = collections.namedtuple('Stage', 'name params inputs run')
+
+
+def _run_harmonic(organ, freq, num_samples, params):
+    harmonic_rng, _ = note_rngs(params, freq)
+    return organ.harmonic_gen.generate(freq, num_samples, params, rng=harmonic_rng)
+
+
+def _run_noise(organ, freq, num_samples, params, harmonic):
+    _, noise_rng = note_rngs(params, freq)
+    return organ.noise_gen.generate(harmonic, num_samples, params, rng=noise_rng)
+
+
+def _run_resonator(organ, freq, num_samples, params, harmonic, noise):
+    return organ.resonator.process(harmonic, noise, params, num_samples,
+                                   organ._resonator_delay(freq, params),
+                                   out=np.empty(num_samples, dtype=organ.dtype))
+
+
+def _run_output(organ, freq, num_samples, params, resonated):
+    return _normalize(resonated.copy())
+
+
+# Kolejność topologiczna; parametry spoza wszystkich list (nieznane) traktowane
+# są jak parametry pierwszego etapu, więc ich zmiana unieważnia cały render
+STAGES = [
+    Stage('harmonic',
+          ('CLIP1', 'CLIP2', 'GAIN1', 'GAIN2', 'GAIND', 'GAINF', 'CDEL', 'CBYP', 'X0', 'Y0',
+           'MOD_AMPL', 'attack_time', 'decay_time', 'sustain_level', 'release_time',
+           'initial_level', 'seed', 'epsilon', 'OSC_MODE', 'SUSTAIN_LOOP'),
+          (), _run_harmonic),
+    Stage('noise',
+          ('NGAIN', 'NBFBK', 'NCGAIN', 'RATE_GAIN', 'NOISE_ATTACK', 'NOISE_DECIMATION', 'seed'),
+          ('harmonic',), _run_noise),
+    Stage('resonator',
+          ('FBK', 'TFBK', 'RESONATOR_ATTACK', 'RESONATOR_TUNED'),
+          ('harmonic', 'noise'), _run_resonator),
+    Stage('output', (), ('resonator',), _run_output),
+]
+
+# Parametry nieużywane przez render_note (tylko strumienie)
+_IGNORED_PARAMS = {'OUTPUT_GAIN'}
+
+
+class IncrementalRenderer:
+    """render_note z zapamiętywaniem wyników pośrednich etapów (LRU w pamięci).
+
+    Zwracane tablice są współdzielone z cache i tylko do odczytu.
+    """
+    def __init__(self, sample_rate=44100, dtype=np.float64, max_bytes=512 * 1024**2, stages=STAGES):
+        self.organ = PhysicalModelOrgan(sample_rate, dtype)
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_bytes = max_bytes
+        self.cache = collections.OrderedDict()
+        self.cache_bytes = 0
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+
+        declared = set(_IGNORED_PARAMS)
+        for stage in stages:
+            declared.update(stage.params)
+        self._declared = declared
+        self._first = stages[0].name
+
+    def stage_keys(self, freq, duration, params):
+        """Klucze cache wszystkich etapów dla danej nuty i parametrów"""
+        note = (float(freq), float(duration), self.organ.sample_rate, self.organ.dtype.str)
+        undeclared = tuple(sorted((k, _freeze(v)) for k, v in params.items() if k not in self._declared))
+
+        keys = {}
+        for name, stage in self.stages.items():
+            values = tuple((k, _freeze(params.get(k))) for k in stage.params)
+            if name == self._first:
+                values += undeclared
+            keys[name] = (name, note, values, tuple(keys[i] for i in stage.inputs))
+        return keys
+
+    def render_note(self, freq, duration, params=None):
+        if params is None:
+            params = self.organ.params
+        num_samples = int(duration * self.organ.sample_rate)
+        keys = self.stage_keys(freq, duration, params)
+        return self._evaluate(list(self.stages)[-1], keys, freq, num_samples, params)
+
+    def _evaluate(self, name, keys, freq, num_samples, params):
+        key = keys[name]
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+            self.hits[name] += 1
+            return result
+
+        stage = self.stages[name]
+        inputs = [self._evaluate(i, keys, freq, num_samples, params) for i in stage.inputs]
+        result = stage.run(self.organ, freq, num_samples, params, *inputs)
+        result.setflags(write=False)
+        self.misses[name] += 1
+        self._store(key, result)
+        return result
+
+    def _store(self, key, result):
+        self.cache[key] = result
+        self.cache_bytes += result.nbytes
+        while self.cache_bytes > self.max_bytes and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.cache_bytes -= evicted.nbytes
+
+    def clear(self):
+        self.cache.clear()
+        self.cache_bytes = 0
+
+
+def _freeze(value):
+    """Wartość parametru jako hashowalny element klucza"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+# Renderer procesu roboczego - tworzony raz przez _init_worker
+_renderer = None
+
+
+def _init_worker(sample_rate, dtype, max_bytes):
+    global _renderer
+    _renderer = IncrementalRenderer(sample_rate, dtype, max_bytes)
+
+
+def _render_group(items, freq, duration):
+    _renderer.hits.clear()
+    _renderer.misses.clear()
+    results = [(index, np.array(_renderer.render_note(freq, duration, params))) for index, params in items]
+    return results, dict(_renderer.misses)
+
+
+def _plan(param_sets, freq, duration, sample_rate, dtype, jobs):
+    """Dzieli zestawy parametrów na zadania tak, by wspólne etapy liczyć raz.
+
+    Zestawy o tej samej składowej harmonicznej trafiają do jednego zadania
+    (posortowane wg klucza szumu, więc sąsiednie dzielą też szum). Gdy takich
+    grup jest mniej niż procesów, grupy są dzielone na kawałki - każdy kawałek
+    przelicza wspólne etapy raz, ale procesy nie stoją bezczynnie.
+    """
+    keys = IncrementalRenderer(sample_rate, dtype, max_bytes=0)
+    groups = collections.defaultdict(list)
+    for index, params in enumerate(param_sets):
+        stage_keys = keys.stage_keys(freq, duration, params)
+        groups[stage_keys['harmonic']].append((repr(stage_keys['noise']), index, params))
+
+    chunks = max(1, math.ceil(jobs / len(groups))) if groups else 1
+    tasks = []
+    for items in groups.values():
+        items.sort(key=lambda item: (item[0], item[1]))
+        items = [(index, params) for _, index, params in items]
+        size = math.ceil(len(items) / min(chunks, len(items)))
+        tasks += [items[i:i + size] for i in range(0, len(items), size)]
+    return tasks
+
+
+def sweep(param_sets, freq, duration, sample_rate=44100, jobs=None, dtype=np.float64,
+          max_bytes=512 * 1024**2, log=None):
+    """Renderuje jedną nutę dla wielu zestawów parametrów równolegle.
+
+    Zwraca listę tablic w kolejności param_sets. Każdy proces ma własny
+    IncrementalRenderer, a zadania grupowane są tak, by zestawy różniące się
+    tylko parametrami dalszych etapów korzystały z tych samych wyników.
+    jobs=1 liczy wszystko w bieżącym procesie.
+    """
+    param_sets = list(param_sets)
+    jobs = jobs or os.cpu_count() or 1
+    tasks = _plan(param_sets, freq, duration, sample_rate, dtype, jobs)
+
+    results = [None] * len(param_sets)
+    computed = collections.Counter()
+    if jobs == 1:
+        _init_worker(sample_rate, dtype, max_bytes)
+        outcomes = [_render_group(items, freq, duration) for items in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(sample_rate, dtype, max_bytes)) as executor:
+            outcomes = list(executor.map(_render_group, tasks,
+                                         [freq] * len(tasks), [duration] * len(tasks)))
+
+    for task_results, misses in outcomes:
+        computed.update(misses)
+        for index, audio in task_results:
+            results[index] = audio
+
+    if log is not None:
+        counts = ', '.join(f"{name} {computed[name]}" for name in (stage.name for stage in STAGES))
+        log(f"Zestawów: {len(param_sets)}, zadań: {len(tasks)}, przeliczone etapy: {counts}")
+    return results
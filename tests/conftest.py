@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Testy importują core/ i tools/ jak skrypty uruchamiane z katalogu repozytorium
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from tools.denoising import PipeDenoiser, find_notes
+
+SR = 44100
+
+
+def _tone(duration, freq, decay, seed):
+    t = np.arange(int(duration * SR)) / SR
+    rng = np.random.default_rng(seed)
+    audio = sum(np.sin(2 * np.pi * freq * k * t) / k for k in range(1, 6)) * np.exp(-decay * t)
+    return 0.5 * audio / np.max(np.abs(audio)) + 0.01 * rng.standard_normal(len(t))
+
+
+@pytest.fixture
+def note_dir(tmp_path):
+    """Jedna nuta w układzie A0/R0/R1 (wybrzmienia o różnych długościach)"""
+    for name, duration, decay in (('A0', 1.0, 0.5), ('R0', 0.6, 4.0), ('R1', 0.45, 6.0)):
+        os.makedirs(tmp_path / name)
+        sf.write(tmp_path / name / '060-c.wav', _tone(duration, 261.6, decay, len(name) + int(duration * 10)),
+                 SR, subtype='DOUBLE')
+    return tmp_path
+
+
+@pytest.mark.parametrize('block_size', [512, 3000, 4097, 65536])
+def test_stream_note_matches_denoise_note(note_dir, tmp_path, block_size):
+    note = find_notes(note_dir)[0]
+    denoiser = PipeDenoiser({'hp_filter': True})
+    denoiser.denoise_note(note['a0'], note['r'], tmp_path / 'ref.wav')
+    denoiser.stream_note(note['a0'], note['r'], tmp_path / 'stream.wav', block_size=block_size)
+    
+    reference, _ = sf.read(tmp_path / 'ref.wav')
+    streamed, _ = sf.read(tmp_path / 'stream.wav')
+    assert len(streamed) == len(reference)
+    # Wyjście to PCM 16-bit - różnica zaokrąglenia co najwyżej 1 LSB
+    np.testing.assert_allclose(streamed, reference, rtol=0, atol=1.5 / 32768)
+
+
+def _remove_reverb_reference(audio, strength, window_size):
+    """Pętla po ramkach z np.percentile (bez filtru górnoprzepustowego)"""
+    hop_size = window_size // 4
+    window = np.hanning(window_size)
+    clean_audio = np.zeros(len(audio))
+    weight = np.zeros(len(audio))
+    for i in range(0, len(audio) - window_size, hop_size):
+        spectrum = np.fft.rfft(audio[i:i+window_size] * window)
+        magnitude = np.abs(spectrum)
+        threshold = np.percentile(magnitude, 40 * (1 - strength))
+        mask = np.where(magnitude > threshold, 1, np.power(magnitude / (threshold + 1e-10), 0.3))
+        clean_audio[i:i+window_size] += np.fft.irfft(spectrum * mask, n=window_size) * window
+        weight[i:i+window_size] += window
+    weight[weight < 1e-10] = 1.0
+    clean_audio /= weight
+    return clean_audio / np.max(np.abs(clean_audio))
+
+
+@pytest.mark.parametrize('window_size, frame_batch', [(4096, 256), (2048, 7), (1024, 1)])
+def test_remove_reverb_matches_frame_loop(window_size, frame_batch):
+    audio = _tone(1.0, 261.6, 2.0, 0)
+    denoiser = PipeDenoiser({'hp_filter': False, 'window_size': window_size})
+    denoiser.frame_batch = frame_batch
+    np.testing.assert_allclose(denoiser.remove_reverb(audio, 0.6),
+                               _remove_reverb_reference(audio, 0.6, window_size), rtol=0, atol=1e-12)
@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+import scipy.signal as sig
+
+from core.physis import (FilterDesignCache, FrequencyModulator, HarmonicGenerator, HarmonicOscillator,
+                         LinearResonator, NoiseGenerator, PhysicalModelOrgan, RateLimiter)
+
+SR = 44100
+
+
+@pytest.fixture
+def params():
+    return PhysicalModelOrgan().default_params()
+
+
+def _harmonic(freq, num_samples, params, block_size):
+    generator = HarmonicGenerator(SR)
+    generator.block_size = block_size
+    return generator.generate(freq, num_samples, params)
+
+
+def test_oscillator_block_matches_per_sample(params):
+    """process_block to te same kroki co modulator.process() i process() dla każdej próbki"""
+    reference_osc, reference_mod = HarmonicOscillator(SR), FrequencyModulator(SR)
+    reference_mod.reset(np.random.default_rng(3))
+    reference = []
+    for _ in range(5000):
+        freq = reference_mod.process(440.0, reference_osc.var1)
+        reference.append(reference_osc.process(freq, params))
+
+    osc, modulator = HarmonicOscillator(SR), FrequencyModulator(SR)
+    modulator.reset(np.random.default_rng(3))
+    block = np.concatenate([osc.process_block(440.0, n, params, modulator) for n in (1, 999, 4000)])
+    # F liczone math.sin zamiast np.sin - różnica ostatniego bitu
+    np.testing.assert_allclose(block, reference, rtol=0, atol=1e-12)
+
+
+def test_oscillator_batch_matches_process_block(params, monkeypatch):
+    monkeypatch.setattr(HarmonicOscillator, 'batch_min_notes', 1)
+    freqs = [55.0, 440.0, 3000.0]
+
+    oscs = [HarmonicOscillator(SR) for _ in freqs]
+    modulators = [FrequencyModulator(SR) for _ in freqs]
+    for k, modulator in enumerate(modulators):
+        modulator.reset(np.random.default_rng(k))
+    batch = HarmonicOscillator.process_batch(oscs, freqs, 3000, params, modulators)
+
+    for k, freq in enumerate(freqs):
+        modulator = FrequencyModulator(SR)
+        modulator.reset(np.random.default_rng(k))
+        np.testing.assert_array_equal(batch[k], HarmonicOscillator(SR).process_block(freq, 3000, params, modulator))
+
+
+class _FixedPitch:
+    """Generator wysokości bez wahań (zawsze 1.0)"""
+    def uniform(self, low, high, size):
+        return np.ones(size)
+
+
+@pytest.mark.parametrize('freq, tolerance', [(440.0, 1e-2), (1000.0, 1e-2), (3000.0, 3e-2)])
+def test_phase_mode_matches_recurrence_without_jitter(freq, tolerance):
+    """Tolerancja z docstringu process_phase_block (bez wahań wysokości, 1 s)"""
+    outputs = []
+    for mode in ('recurrence', 'phase'):
+        modulator = FrequencyModulator(SR)
+        modulator.reset(_FixedPitch())
+        outputs.append(HarmonicOscillator(SR).process_block(freq, SR, {'OSC_MODE': mode}, modulator))
+    assert np.max(np.abs(outputs[1] - outputs[0])) < tolerance
+
+
+@pytest.mark.parametrize('block_size', [1, 333, 1024])
+def test_harmonic_block_size_does_not_change_output(params, block_size):
+    reference = _harmonic(440.0, 8000, params, 4096)
+    # Faza LFO przenoszona między blokami - różnica ostatniego bitu
+    np.testing.assert_allclose(_harmonic(440.0, 8000, params, block_size), reference, rtol=0, atol=1e-12)
+
+
+def _noise_box_reference(noise, rate, params, delay):
+    """NOISE BOX (Fig. 11) próbka po próbce z RateLimiter.process"""
+    limiter = RateLimiter()
+    loop = np.zeros(delay + len(rate))
+    limited = np.zeros(delay + len(rate))
+    for n in range(len(rate)):
+        loop[delay + n] = params['NCGAIN'] * (noise[n] + params['NBFBK'] * limited[n]) + loop[n]
+        limited[delay + n] = limiter.process(2 * loop[delay + n], rate[n], limited[delay + n - 1])
+    return limited[delay:]
+
+
+@pytest.mark.parametrize('decimation, rate_gain', [(1, 1.2), (4, 1.2), (1, 40.0)])
+def test_noise_box_matches_per_sample(params, decimation, rate_gain):
+    params = dict(params, NOISE_DECIMATION=decimation, RATE_GAIN=rate_gain)
+    generator = NoiseGenerator(SR)
+    generator.start(params)
+    rate = generator._rate_block(_harmonic(440.0, 8000, params, 4096), 0, params)
+    noise = generator.lp.process(np.random.default_rng(1).uniform(-1, 1, len(rate)))
+
+    D = generator.internal_delay
+    loop = np.zeros(D + len(rate))
+    limited = np.zeros(D + len(rate))
+    generator._noise_box(noise, rate, loop, limited, params['NCGAIN'], params['NBFBK'])
+    np.testing.assert_array_equal(limited[D:], _noise_box_reference(noise, rate, params, D))
+
+
+@pytest.mark.parametrize('block_size', [100, 1000, 4097])
+def test_noise_block_size_does_not_change_output(params, block_size):
+    harmonic = _harmonic(440.0, 10000, params, 4096)
+    reference = NoiseGenerator(SR).generate(harmonic, 10000, params)
+    generator = NoiseGenerator(SR)
+    generator.block_size = block_size
+    np.testing.assert_array_equal(generator.generate(harmonic, 10000, params), reference)
+
+
+def _resonator_reference(combined_input, params, delay):
+    """Pętla rezonatora (Fig. 15) próbka po próbce"""
+    lp = sig.butter(2, 4000, 'lowpass', fs=SR, output='sos')
+    hp = sig.butter(2, 50, 'highpass', fs=SR, output='sos')
+    lp_zi, hp_zi, apf_zi = np.zeros((1, 2)), np.zeros((1, 2)), np.zeros(1)
+    attack_samples = params['RESONATOR_ATTACK'] * SR
+    line = np.zeros(delay)
+    output = np.empty(len(combined_input))
+    for n, x in enumerate(combined_input):
+        output[n] = line[n % delay]
+        filtered, lp_zi = sig.sosfilt(lp, output[n:n + 1], zi=lp_zi)
+        filtered, hp_zi = sig.sosfilt(hp, filtered, zi=hp_zi)
+        apf_output, apf_zi = sig.lfilter([0.7, 1.0], [1.0, 0.7], filtered, zi=apf_zi)
+        fb_gain = params['FBK'] * 1.2 if n < attack_samples else params['FBK']
+        line[n % delay] = x + params['TFBK'] * apf_output[0] * fb_gain
+    return output
+
+
+@pytest.mark.parametrize('delay, transfer', [(100, True), (100, False), (2048, False)])
+def test_resonator_matches_per_sample(params, delay, transfer):
+    combined_input = np.random.default_rng(2).uniform(-1, 1, 6000)
+    resonator = LinearResonator(SR)
+    resonator.block_size = 1500
+    if not transfer:
+        resonator.transfer_max_delay = 0
+    output = resonator.process(combined_input, np.zeros(6000), params, 6000, delay)
+
+    assert (resonator.transfer is not None) == transfer
+    reference = _resonator_reference(combined_input, params, delay)
+    # Filtr wymierny zmienia kolejność działań - zgodność do zaokrągleń
+    np.testing.assert_allclose(output, reference, rtol=0, atol=1e-9 * np.max(np.abs(reference)))
+
+
+@pytest.mark.parametrize('batch_min_notes', [1, 40])
+@pytest.mark.parametrize('tuned', [False, True])
+def test_render_notes_matches_render_note(params, monkeypatch, batch_min_notes, tuned):
+    monkeypatch.setattr(HarmonicOscillator, 'batch_min_notes', batch_min_notes)
+    params = dict(params, RESONATOR_TUNED=tuned)
+    freqs = [110.0, 440.0, 1500.0]
+    organ = PhysicalModelOrgan()
+    batch = organ.render_notes(freqs, 0.3, params)
+    for k, freq in enumerate(freqs):
+        np.testing.assert_array_equal(batch[k], organ.render_note(freq, 0.3, params))
+
+
+def test_filter_design_cache_round_trip(tmp_path):
+    cache = FilterDesignCache()
+    designs = [cache.butter(2, [396.0, 484.0], 'bandpass', SR), cache.butter(1, 20, 'highpass', SR)]
+    path = str(tmp_path / 'designs.npz')
+    cache.save(path)
+
+    loaded = FilterDesignCache()
+    assert loaded.load(path) == 2
+    np.testing.assert_array_equal(loaded.butter(2, [396.0, 484.0], 'bandpass', SR), designs[0])
+    np.testing.assert_array_equal(loaded.butter(1, 20, 'highpass', SR), designs[1])
+    assert loaded.hits == 2 and loaded.misses == 0
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from core.physis import PhysicalModelOrgan, midi_to_freq
+from core.polyphony import VOICE_PEAK, OrganEngine
+
+
+@pytest.mark.parametrize('extra', [{}, {'NOISE_DECIMATION': 4}, {'RESONATOR_TUNED': True}])
+def test_engine_matches_note_streams(extra):
+    """Głosy uruchomione w pierwszym bloku (wspólna faza LFO) to suma NoteStream"""
+    organ = PhysicalModelOrgan()
+    params = dict(organ.params, **extra)
+    engine = OrganEngine(num_voices=4, block_size=512)
+    engine.set_registration({'principal': params})
+    notes = (57, 64, 76)
+    streams = []
+    for note in notes:
+        engine.note_on(note)
+        streams.append(organ.render_stream(midi_to_freq(note), params, 512))
+
+    for block in range(50):
+        if block == 20:
+            engine.note_off(57)
+            streams[0].note_off()
+        reference = sum(next(stream, np.zeros(512)) for stream in streams) * engine.gain
+        np.testing.assert_allclose(engine.render_block(), reference, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('note', [36, 48, 60, 84])
+def test_voice_peak_bounds_single_voice(note):
+    """VOICE_PEAK (podstawa domyślnego gain) ogranicza szczyt głosu przy domyślnych parametrach"""
+    organ = PhysicalModelOrgan()
+    stream = organ.render_stream(midi_to_freq(note), organ.params, 4096)
+    peak = max(np.max(np.abs(next(stream))) for _ in range(22))
+    assert peak <= VOICE_PEAK
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from core.physis import PhysicalModelOrgan
+from core.render_cache import RenderCache
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_render_note_dtype_does_not_depend_on_cache_state(tmp_path, dtype):
+    organ = PhysicalModelOrgan(dtype=dtype)
+    cache = RenderCache(str(tmp_path))
+    miss = cache.render_note(organ, 440.0, 0.1)
+    hit = cache.render_note(organ, 440.0, 0.1)
+
+    assert (cache.misses, cache.hits) == (1, 1)
+    for audio in (miss, hit):
+        assert audio.dtype == np.float32
+        assert not audio.flags.writeable
+    np.testing.assert_array_equal(hit, miss)
+
+
+def test_put_without_file_does_not_freeze_caller_array(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=16)
+    audio = np.zeros(100, dtype=np.float32)
+    stored = cache.put(RenderCache.key({}, 440.0, 0.1, 44100), audio)
+
+    assert stored.dtype == np.float32 and not stored.flags.writeable
+    assert audio.flags.writeable
@@ -1,13 +1,59 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import scipy.signal as signal
 import scipy.io.wavfile as wavfile
-import tkinter as tk
-from tkinter import filedialog, scrolledtext
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+try:
+    from tools.resampling import resample
+except ImportError:  # uruchomienie jako skrypt: python tools/analiza_dzwieku.py
+    from resampling import resample
+
+
+def detect_fundamental_frequency(data, fs):
+    freqs, psd = signal.periodogram(data, fs)
+    fundamental_idx = np.argmax(psd[1:]) + 1  # pomijamy DC
+    return freqs[fundamental_idx]
+
+
+def detect_harmonics(fundamental_freq, fft_data, freqs, threshold):
+    harmonics = []
+    for n in range(1, 21):
+        target_freq = fundamental_freq * n
+        idx = np.argmin(np.abs(freqs - target_freq))
+        if idx < len(fft_data) and fft_data[idx] > threshold * np.max(fft_data):
+            harmonics.append((n, freqs[idx], fft_data[idx]))
+    return harmonics
+
+
+def analyze_signal(data, fs, threshold=0.05, nperseg=1024, target_fs=None):
+    """Wszystkie obliczenia wykresów (bez GUI): widmo, spektrogram, f0 i harmoniczne.
+
+    Z target_fs sygnał jest najpierw przepróbkowany (polifazowo), żeby próbki
+    o różnych częstotliwościach dawały porównywalne siatki częstotliwości.
+    """
+    if target_fs is not None and target_fs != fs:
+        data = resample(data, fs, target_fs)
+        fs = target_fs
+    fft_data = np.abs(np.fft.rfft(data))
+    freqs = np.fft.rfftfreq(len(data), 1/fs)
+    f_spect, t_spect, Sxx = signal.spectrogram(data, fs=fs, nperseg=nperseg)
+    f0 = detect_fundamental_frequency(data, fs)
+    harmonics = detect_harmonics(f0, fft_data, freqs, threshold)
+    return {
+        'fft_data': fft_data, 'freqs': freqs,
+        'f_spect': f_spect, 't_spect': t_spect, 'Sxx': Sxx,
+        'f0': f0, 'harmonics': harmonics,
+    }
+
 
 class AudioAnalyzerApp:
+    # tkinter i matplotlib importowane dopiero przez okno, żeby obliczenia
+    # (analyze_signal itd.) działały bez nich, np. w benchmarkach
     def __init__(self, master):
+        import tkinter as tk
+        from tkinter import scrolledtext
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
         self.master = master
         master.title("Audio Analysis Tool")
 
@@ -38,6 +84,8 @@ class AudioAnalyzerApp:
         self.data = None
 
     def load_file(self):
+        from tkinter import filedialog
+
         file_path = filedialog.askopenfilename(filetypes=[("WAV files", "*.wav")])
         if not file_path:
             return
@@ -48,28 +96,22 @@ class AudioAnalyzerApp:
         self.update_plots()
 
     def detect_fundamental_frequency(self, data):
-        freqs, psd = signal.periodogram(data, self.fs)
-        fundamental_idx = np.argmax(psd[1:]) + 1  # pomijamy DC
-        return freqs[fundamental_idx]
+        return detect_fundamental_frequency(data, self.fs)
 
     def detect_harmonics(self, fundamental_freq, fft_data, freqs, threshold):
-        harmonics = []
-        for n in range(1, 21):
-            target_freq = fundamental_freq * n
-            idx = np.argmin(np.abs(freqs - target_freq))
-            if idx < len(fft_data) and fft_data[idx] > threshold * np.max(fft_data):
-                harmonics.append((n, freqs[idx], fft_data[idx]))
-        return harmonics
+        return detect_harmonics(fundamental_freq, fft_data, freqs, threshold)
 
     def update_plots(self, event=None):
+        import tkinter as tk
+
         if self.data is None:
             return
 
         n_samples = len(self.data)
         time = np.arange(n_samples) / self.fs
-        fft_data = np.abs(np.fft.rfft(self.data))
-        freqs = np.fft.rfftfreq(n_samples, 1/self.fs)
-        f_spect, t_spect, Sxx = signal.spectrogram(self.data, fs=self.fs, nperseg=1024)
+        analysis = analyze_signal(self.data, self.fs, self.threshold_scale.get())
+        fft_data, freqs = analysis['fft_data'], analysis['freqs']
+        f_spect, t_spect, Sxx = analysis['f_spect'], analysis['t_spect'], analysis['Sxx']
 
         # Czyścimy wykresy
         for ax in self.axs:
@@ -91,9 +133,7 @@ class AudioAnalyzerApp:
         self.axs[1].grid(True)
 
         # Detekcja f0 i harmonicznych
-        f0 = self.detect_fundamental_frequency(self.data)
-        threshold = self.threshold_scale.get()
-        harmonics = self.detect_harmonics(f0, fft_data, freqs, threshold)
+        f0, harmonics = analysis['f0'], analysis['harmonics']
         for n, freq, amp in harmonics:
             self.axs[1].axvline(x=freq, color='red', linestyle='--', alpha=0.6)
 
@@ -115,7 +155,13 @@ class AudioAnalyzerApp:
         # Odświeżenie canvas
         self.canvas.draw_idle()
 
-if __name__ == "__main__":
+def main():
+    import tkinter as tk
+
     root = tk.Tk()
-    app = AudioAnalyzerApp(root)
+    AudioAnalyzerApp(root)
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
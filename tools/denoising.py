@@ -1,15 +1,31 @@
+import argparse
+import hashlib
+import json
 import os
-import tkinter as tk
-from tkinter import filedialog, ttk, simpledialog
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 from scipy import signal, fft
 import soundfile as sf
-from threading import Thread
-import queue
 from scipy.signal import butter, filtfilt
 
+try:
+    from tools.resampling import resample
+except ImportError:  # uruchomienie jako skrypt: python tools/denoising.py
+    from resampling import resample
+
+R_DIRS = ("R0", "R1", "R2", "R3")
+
+# Zmiana przetwarzania zmieniająca wyniki pośrednie lub końcowe musi zwiększyć tę wersję
+MANIFEST_VERSION = 2
+
 class PipeDenoiser:
-    def __init__(self):
+    # Liczba ramek maskowanych naraz w remove_reverb
+    frame_batch = 256
+    
+    def __init__(self, settings=None):
         self.sr = 44100
         self.settings = {
             'strength': 0.75,
@@ -20,6 +36,8 @@ class PipeDenoiser:
             'generate_synthetic_r': False,
             'synthetic_r_from_sustain': False
         }
+        if settings:
+            self.settings.update(settings)
         
     def normalize(self, audio):
         peak = np.max(np.abs(audio))
@@ -47,46 +65,76 @@ class PipeDenoiser:
         
         return audio
         
-    def remove_reverb(self, audio, strength=0.75):
+    def remove_reverb(self, audio, strength=0.75, sr=None):
         window_size = self.settings['window_size']
         hop_size = window_size // 4
         window = signal.windows.hann(window_size)
         
+        # Ramki jako widok (ramki x próbki), transformowane paczkami po frame_batch
+        # ramek - pamięć pośrednia nie rośnie z długością nagrania
+        num_frames = len(range(0, len(audio) - window_size, hop_size))
+        frames = np.lib.stride_tricks.sliding_window_view(audio, window_size)[::hop_size] if num_frames > 0 else None
         clean_audio = np.zeros(len(audio))
         weight = np.zeros(len(audio))
-        
-        for i in range(0, len(audio) - window_size, hop_size):
-            frame = audio[i:i+window_size] * window
-            
-            spectrum = fft.rfft(frame)
-            magnitude = np.abs(spectrum)
-            phase = np.angle(spectrum)
-            
-            threshold = np.percentile(magnitude, 40 * (1 - strength))
-            mask = np.where(magnitude > threshold, 1, np.power(magnitude / (threshold + 1e-10), 0.3))
-            
-            clean_magnitude = magnitude * mask
-            clean_spectrum = clean_magnitude * np.exp(1j * phase)
-            clean_frame = np.real(fft.irfft(clean_spectrum))
-            
-            clean_audio[i:i+window_size] += clean_frame * window
-            weight[i:i+window_size] += window
+        for first in range(0, num_frames, self.frame_batch):
+            clean_frames = self.denoise_frames(frames[first:min(first + self.frame_batch, num_frames)], window, strength)
+            start = first * hop_size
+            length = min((len(clean_frames) - 1) * hop_size + window_size, len(audio) - start)
+            clean_audio[start:start+length] += self.overlap_add(clean_frames, hop_size, length)
+            weight[start:start+length] += self.overlap_add(np.broadcast_to(window, clean_frames.shape), hop_size, length)
         
         weight[weight < 1e-10] = 1.0
         clean_audio /= weight
+        del weight
         
         if self.settings['hp_filter']:
-            b, a = butter(4, 40/(self.sr/2), 'highpass')
+            sr = sr or self.sr
+            b, a = butter(4, 40/(sr/2), 'highpass')
             clean_audio = filtfilt(b, a, clean_audio)
         
         return self.normalize(clean_audio)
     
-    def generate_synthetic_r(self, length_samples):
+    def denoise_frames(self, frames, window, strength):
+        """Maskowanie widmowe ramek (ramki x próbki); zwraca ramki pomnożone przez okno"""
+        spectrum = fft.rfft(frames * window, axis=-1)
+        magnitude = np.abs(spectrum)
+        
+        # Próg = percentyl (interpolacja liniowa) każdego wiersza; np.partition
+        # wybiera dwa sąsiednie elementy zamiast sortować całe widmo
+        position = 0.4 * (1 - strength) * (magnitude.shape[-1] - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, magnitude.shape[-1] - 1)
+        selected = np.partition(magnitude, (lower, upper), axis=-1)
+        fraction = position - lower
+        threshold = selected[:, lower:lower+1] + fraction * (selected[:, upper:upper+1] - selected[:, lower:lower+1])
+        
+        mask = np.where(magnitude > threshold, 1, np.power(magnitude / (threshold + 1e-10), 0.3))
+        return fft.irfft(spectrum * mask, n=frames.shape[-1], axis=-1) * window
+    
+    @staticmethod
+    def overlap_add(frames, hop_size, length):
+        """Suma ramek przesuniętych o hop_size; pętla tylko po krotności nakładania"""
+        num_frames, window_size = frames.shape
+        overlap = -(-window_size // hop_size)
+        padded = np.zeros((num_frames, overlap * hop_size))
+        padded[:, :window_size] = frames
+        
+        output = np.zeros((num_frames + overlap - 1, hop_size))
+        for j in range(overlap):
+            output[j:j+num_frames] += padded[:, j*hop_size:(j+1)*hop_size]
+        output = output.reshape(-1)
+        
+        if len(output) < length:
+            output = np.pad(output, (0, length - len(output)))
+        return output[:length]
+    
+    def generate_synthetic_r(self, length_samples, sr=None):
+        sr = sr or self.sr
         white_noise = np.random.randn(length_samples)
-        b, a = butter(2, 4000 / (self.sr / 2), btype='low')
+        b, a = butter(2, 4000 / (sr / 2), btype='low')
         pink_like_noise = filtfilt(b, a, white_noise)
         pink_like_noise = self.normalize(pink_like_noise)
-        fade_len = int(self.sr * 0.5)
+        fade_len = int(sr * 0.5)
         if fade_len > length_samples:
             fade_len = length_samples
         fade = np.linspace(1, 0, fade_len)
@@ -112,39 +160,75 @@ class PipeDenoiser:
 
     def process_note(self, a0_path, r_paths, output_path, progress_queue=None):
         try:
-            a0_audio, sr = sf.read(a0_path)
-            if a0_audio.ndim > 1:
-                a0_audio = np.mean(a0_audio, axis=1)
-            self.sr = sr
+            self.denoise_note(a0_path, r_paths, output_path)
+            if progress_queue:
+                progress_queue.put(('success', os.path.basename(output_path)))
+            return True
+
+        except Exception as e:
+            if progress_queue:
+                progress_queue.put(('error', f"{os.path.basename(a0_path)}: {str(e)}"))
+            return False
 
-            a0_audio = self.normalize(a0_audio)
-            fade_len = int(0.05 * sr)
-            a0_audio = self.apply_fade(a0_audio, fade_len)
+    def denoise_note(self, a0_path, r_paths, output_path, cache=None):
+        """Przetwarza jedną nutę (A0 + pliki R); zwraca liczbę wczytanych próbek.
+        
+        Nie zmienia stanu obiektu (częstotliwość próbkowania jest lokalna),
+        więc jeden denoiser może obsługiwać wiele nut równocześnie.
+        Z cache (IntermediateCache) odszumione pliki R i ich uśrednienie są
+        zapamiętywane, więc np. zmiana samego crossfade nie liczy STFT od nowa.
+        """
+        a0_audio, sr = sf.read(a0_path)
+        if a0_audio.ndim > 1:
+            a0_audio = np.mean(a0_audio, axis=1)
+        samples = len(a0_audio)
 
-            r_audios = []
-            for r_path in r_paths:
-                if os.path.exists(r_path):
+        a0_audio = self.normalize(a0_audio)
+        fade_len = int(0.05 * sr)
+        a0_audio = self.apply_fade(a0_audio, fade_len)
+
+        r_audios = []
+        r_keys = []
+        for r_path in r_paths:
+            if os.path.exists(r_path):
+                key = None
+                if cache is not None:
+                    key = cache.key('r', cache.file_hash(r_path), sr, self.settings['strength'],
+                                    self.settings['window_size'], self.settings['hp_filter'])
+                    r_keys.append(key)
+                r_audio = cache.get(key) if cache is not None else None
+                if r_audio is None:
                     r_audio, r_sr = sf.read(r_path)
+                    samples += len(r_audio)
                     if r_audio.ndim > 1:
                         r_audio = np.mean(r_audio, axis=1)
                     if r_sr != sr:
-                        r_audio = signal.resample(r_audio, int(len(r_audio) * sr / r_sr))
+                        r_audio = resample(r_audio, r_sr, sr)
                     
-                    r_audio = self.remove_reverb(r_audio, self.settings['strength'])
-                    r_audio = self.apply_fade(r_audio, fade_len)
-                    r_audios.append(self.normalize(r_audio))
-            
-            avg_r = np.zeros(0)
+                    r_audio = self.remove_reverb(r_audio, self.settings['strength'], sr)
+                    if cache is not None:
+                        r_audio = cache.put(key, r_audio)
+                else:
+                    # Wynik z cache - plik R liczy się do przepustowości jak wczytany
+                    samples += sf.info(r_path).frames
+                r_audio = self.apply_fade(np.array(r_audio), fade_len)
+                r_audios.append(self.normalize(r_audio))
+        
+        avg_r = np.zeros(0)
 
-            # Jeśli włączona opcja generowania syntetycznego R z fazy Sustain
-            if self.settings.get('synthetic_r_from_sustain', False):
-                avg_r = self.generate_r_from_sustain(a0_audio, sr, length_sec=0.5)
-            # W przeciwnym wypadku jeśli nie ma plików R lub wybrana opcja generowania syntetycznego R (szum)
-            elif self.settings.get('generate_synthetic_r', False) or not r_audios:
-                length = int(0.5 * sr)
-                avg_r = self.generate_synthetic_r(length)
-            else:
-                max_len = max(len(r) for r in r_audios) if r_audios else 0
+        # Jeśli włączona opcja generowania syntetycznego R z fazy Sustain
+        if self.settings.get('synthetic_r_from_sustain', False):
+            avg_r = self.generate_r_from_sustain(a0_audio, sr, length_sec=0.5)
+        # W przeciwnym wypadku jeśli nie ma plików R lub wybrana opcja generowania syntetycznego R (szum)
+        elif self.settings.get('generate_synthetic_r', False) or not r_audios:
+            length = int(0.5 * sr)
+            avg_r = self.generate_synthetic_r(length, sr)
+        else:
+            key = cache.key('avg', r_keys, self.settings['extra_strength']) if cache is not None else None
+            avg_r = cache.get(key) if cache is not None else None
+            if avg_r is None:
+                avg_r = np.zeros(0)
+                max_len = max(len(r) for r in r_audios)
                 if max_len > 0:
                     avg_r = np.zeros(max_len)
                     for r in r_audios:
@@ -153,327 +237,568 @@ class PipeDenoiser:
                     avg_r /= len(r_audios)
                     avg_r = self.normalize(avg_r)
                     extra_strength = min(self.settings['strength'] + self.settings['extra_strength'], 0.95)
-                    avg_r = self.remove_reverb(avg_r, extra_strength)
+                    avg_r = self.remove_reverb(avg_r, extra_strength, sr)
+                    if cache is not None:
+                        avg_r = cache.put(key, avg_r)
+        
+        if len(avg_r) > 0:
+            crossfade = min(int(self.settings['crossfade'] * sr), len(a0_audio)//3, len(avg_r)//3)
+            if crossfade > 0:
+                fade_out = np.linspace(1, 0, crossfade)
+                fade_in = np.linspace(0, 1, crossfade)
+                transition = a0_audio[-crossfade:] * fade_out + avg_r[:crossfade] * fade_in
+                combined = np.concatenate([
+                    a0_audio[:-crossfade],
+                    transition,
+                    avg_r[crossfade:]
+                ])
+            else:
+                combined = np.concatenate([a0_audio, avg_r])
+        else:
+            combined = a0_audio
+
+        combined = self.apply_fade(combined, int(0.1 * sr))
+        sf.write(output_path, combined, sr)
+        return samples
+
+    def stream_note(self, a0_path, r_paths, output_path, block_size=65536):
+        """Strumieniowa wersja denoise_note o stałym zużyciu pamięci.
+        
+        Pliki czytane są blokami (sf.blocks), STFT przenosi stan nakładania
+        między blokami, a wyniki pośrednie trafiają do plików tymczasowych.
+        Normalizacja szczytowa to śledzenie maksimum przy zapisie albo tani
+        drugi odczyt bloków. Wynik jest taki sam jak z denoise_note; jedynie
+        pliki R o innej częstotliwości próbkowania (krótkie wybrzmienia) są
+        przepróbkowywane w całości.
+        """
+        info = sf.info(a0_path)
+        sr = info.samplerate
+        a0 = (a0_path, 0, info.frames)
+        a0_scale = 1 / (_peak(_scaled_blocks(a0, 1, 0, block_size)) or 1)
+        fade_len = int(0.05 * sr)
+        samples = info.frames
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            r_parts = []
+            for k, r_path in enumerate(r_paths):
+                if os.path.exists(r_path):
+                    samples += sf.info(r_path).frames
+                    part, peak = self._remove_reverb_to_file(
+                        self._read_resampled(r_path, sr, block_size), self.settings['strength'], sr,
+                        os.path.join(tmp_dir, f"r{k}.wav"), block_size)
+                    # normalize -> apply_fade -> normalize, jak w denoise_note
+                    scale = 1 / (peak or 1)
+                    scale /= _peak(_scaled_blocks(part, scale, fade_len, block_size)) or 1
+                    r_parts.append((part, scale))
+            
+            if self.settings.get('synthetic_r_from_sustain', False):
+                tail_len = min(int(sr * 0.5), a0[2])
+                tail = np.concatenate(list(_scaled_blocks(a0, a0_scale, fade_len, block_size,
+                                                          start=a0[2] - tail_len)))
+                avg_r = self.generate_r_from_sustain(tail, sr, length_sec=0.5)
+                avg, _ = _write_temp(os.path.join(tmp_dir, "avg.wav"), [avg_r], sr)
+                avg_scale = 1.0
+            elif self.settings.get('generate_synthetic_r', False) or not r_parts:
+                avg_r = self.generate_synthetic_r(int(0.5 * sr), sr)
+                avg, _ = _write_temp(os.path.join(tmp_dir, "avg.wav"), [avg_r], sr)
+                avg_scale = 1.0
+            else:
+                max_len = max(part[2] for part, _ in r_parts)
+                mixed, peak = _write_temp(os.path.join(tmp_dir, "mix.wav"),
+                                          _mixed_blocks(r_parts, max_len, fade_len, block_size), sr)
+                extra_strength = min(self.settings['strength'] + self.settings['extra_strength'], 0.95)
+                avg, peak = self._remove_reverb_to_file(
+                    _scaled_blocks(mixed, 1 / (peak or 1), 0, block_size), extra_strength, sr,
+                    os.path.join(tmp_dir, "avg.wav"), block_size)
+                avg_scale = 1 / (peak or 1)
             
-            if len(avg_r) > 0:
-                crossfade = min(int(self.settings['crossfade'] * sr), len(a0_audio)//3, len(avg_r)//3)
+            a0_len, avg_len = a0[2], avg[2]
+            crossfade = min(int(self.settings['crossfade'] * sr), a0_len // 3, avg_len // 3) if avg_len > 0 else 0
+            
+            def combined():
+                yield from _scaled_blocks(a0, a0_scale, fade_len, block_size, stop=a0_len - crossfade)
                 if crossfade > 0:
                     fade_out = np.linspace(1, 0, crossfade)
                     fade_in = np.linspace(0, 1, crossfade)
-                    transition = a0_audio[-crossfade:] * fade_out + avg_r[:crossfade] * fade_in
-                    combined = np.concatenate([
-                        a0_audio[:-crossfade],
-                        transition,
-                        avg_r[crossfade:]
-                    ])
-                else:
-                    combined = np.concatenate([a0_audio, avg_r])
-            else:
-                combined = a0_audio
-
-            combined = self.apply_fade(combined, int(0.1 * sr))
-            sf.write(output_path, combined, sr)
+                    position = 0
+                    for a0_block, r_block in zip(
+                            _scaled_blocks(a0, a0_scale, fade_len, block_size, start=a0_len - crossfade),
+                            _scaled_blocks(avg, avg_scale, 0, block_size, stop=crossfade)):
+                        end = position + len(a0_block)
+                        yield a0_block * fade_out[position:end] + r_block * fade_in[position:end]
+                        position = end
+                yield from _scaled_blocks(avg, avg_scale, 0, block_size, start=crossfade)
+            
+            total = a0_len + avg_len - crossfade
+            with sf.SoundFile(output_path, 'w', sr, 1) as out:
+                position = 0
+                for block in combined():
+                    end = position + len(block)
+                    out.write(block * _fade_gain(position, end, total, int(0.1 * sr)))
+                    position = end
+        return samples
 
-            if progress_queue:
-                progress_queue.put(('success', os.path.basename(output_path)))
-            return True
+    def _remove_reverb_to_file(self, blocks, strength, sr, path, block_size):
+        """remove_reverb bloków do pliku tymczasowego (bez normalizacji); zwraca (część, szczyt)"""
+        clean = StreamingReverbRemover(self, strength).stream(blocks)
+        if self.settings['hp_filter']:
+            b, a = butter(4, 40/(sr/2), 'highpass')
+            return _filtfilt_to_file(b, a, clean, path, sr, block_size)
+        return _write_temp(path, clean, sr)
 
-        except Exception as e:
-            if progress_queue:
-                progress_queue.put(('error', f"{os.path.basename(a0_path)}: {str(e)}"))
-            return False
+    def _read_resampled(self, path, sr, block_size):
+        r_sr = sf.info(path).samplerate
+        if r_sr == sr:
+            return _scaled_blocks((path, 0, sf.info(path).frames), 1, 0, block_size)
+        r_audio, _ = sf.read(path)
+        if r_audio.ndim > 1:
+            r_audio = np.mean(r_audio, axis=1)
+        return [resample(r_audio, r_sr, sr)]
 
 
-class SettingsDialog(tk.simpledialog.Dialog):
-    def __init__(self, parent, settings):
-        self.settings = settings
-        super().__init__(parent, "Zaawansowane ustawienia")
-        
-    def body(self, master):
-        ttk.Label(master, text="Siła redukcji głównej (0.1-0.9):").grid(row=0, sticky=tk.W)
-        self.strength = tk.DoubleVar(value=self.settings['strength'])
-        ttk.Scale(master, from_=0.1, to=0.9, variable=self.strength, 
-                 orient=tk.HORIZONTAL, length=200).grid(row=0, column=1, padx=5, pady=5)
-        ttk.Label(master, textvariable=self.strength).grid(row=0, column=2)
-        
-        ttk.Label(master, text="Dodatkowa siła dla R (0.0-0.3):").grid(row=1, sticky=tk.W)
-        self.extra = tk.DoubleVar(value=self.settings['extra_strength'])
-        ttk.Scale(master, from_=0.0, to=0.3, variable=self.extra, 
-                 orient=tk.HORIZONTAL, length=200).grid(row=1, column=1, padx=5, pady=5)
-        ttk.Label(master, textvariable=self.extra).grid(row=1, column=2)
-        
-        ttk.Label(master, text="Rozmiar okna analizy:").grid(row=2, sticky=tk.W)
-        self.window = tk.IntVar(value=self.settings['window_size'])
-        ttk.Combobox(master, textvariable=self.window, 
-                    values=[1024, 2048, 4096, 8192], width=8).grid(row=2, column=1, sticky=tk.W)
-        
-        ttk.Label(master, text="Crossfade (sekundy):").grid(row=3, sticky=tk.W)
-        self.crossfade = tk.DoubleVar(value=self.settings['crossfade'])
-        ttk.Spinbox(master, from_=0.1, to=3.0, increment=0.1, 
-                   textvariable=self.crossfade, width=5).grid(row=3, column=1, sticky=tk.W)
-        
-        self.hp_var = tk.BooleanVar(value=self.settings['hp_filter'])
-        ttk.Checkbutton(master, text="Filtr wysokoprzepustowy (40 Hz)", 
-                       variable=self.hp_var).grid(row=4, column=0, columnspan=2, sticky=tk.W)
-
-        # Nowa opcja generowania syntetycznego R (szum)
-        self.gen_synthetic_r_var = tk.BooleanVar(value=self.settings.get('generate_synthetic_r', False))
-        ttk.Checkbutton(master, text="Generuj syntetyczne R (szum)", variable=self.gen_synthetic_r_var).grid(row=5, column=0, columnspan=2, sticky=tk.W)
-
-        # Nowa opcja generowania syntetycznego R z fazy Sustain
-        self.gen_sustain_r_var = tk.BooleanVar(value=self.settings.get('synthetic_r_from_sustain', False))
-        ttk.Checkbutton(master, text="Generuj syntetyczne R z fazy Sustain (ogon)", variable=self.gen_sustain_r_var).grid(row=6, column=0, columnspan=2, sticky=tk.W)
-
-        return master
-    
-    def apply(self):
-        self.settings['strength'] = round(self.strength.get(), 2)
-        self.settings['extra_strength'] = round(self.extra.get(), 2)
-        self.settings['window_size'] = self.window.get()
-        self.settings['hp_filter'] = self.hp_var.get()
-        self.settings['crossfade'] = self.crossfade.get()
-        self.settings['generate_synthetic_r'] = self.gen_synthetic_r_var.get()
-        self.settings['synthetic_r_from_sustain'] = self.gen_sustain_r_var.get()
-
-
-class DenoiserGUI:
-    def __init__(self, root):
-        self.root = root
-        root.title("Organ Pipe Denoiser")
-        root.geometry("1200x800")
-        
-        self.denoiser = PipeDenoiser()
-        self.progress_queue = queue.Queue()
-        
-        self.root_dir = tk.StringVar()
-        self.output_dir = tk.StringVar(value=os.path.join(os.getcwd(), "denoised_output"))
-        self.status = tk.StringVar(value="Gotowy")
-        self.files = []
-        self.check_vars = []
-        
-        self.create_widgets()
-        self.check_queue()
-        
-        root.update_idletasks()
-        width = root.winfo_width()
-        height = root.winfo_height()
-        x = (root.winfo_screenwidth() // 2) - (width // 2)
-        y = (root.winfo_screenheight() // 2) - (height // 2)
-        root.geometry(f"{width}x{height}+{x}+{y}")
-
-    def create_widgets(self):
-        main_frame = ttk.Frame(self.root)
-        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        top_frame = ttk.Frame(main_frame)
-        top_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Button(top_frame, text="Ustawienia", command=self.open_settings).pack(side=tk.LEFT, padx=5)
-        ttk.Button(top_frame, text="Zaznacz wszystkie", command=self.select_all).pack(side=tk.LEFT, padx=5)
-        ttk.Button(top_frame, text="Odznacz wszystkie", command=self.deselect_all).pack(side=tk.LEFT, padx=5)
-        
-        dir_frame = ttk.LabelFrame(main_frame, text="Foldery")
-        dir_frame.pack(fill=tk.X, pady=5)
-        
-        row = 0
-        ttk.Label(dir_frame, text="Główny folder:").grid(row=row, column=0, sticky=tk.W, padx=5, pady=5)
-        root_entry = ttk.Entry(dir_frame, textvariable=self.root_dir, width=70)
-        root_entry.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
-        ttk.Button(dir_frame, text="Przeglądaj...", command=self.browse_root).grid(row=row, column=2, padx=5, pady=5)
-        
-        row += 1
-        ttk.Label(dir_frame, text="Folder wyjściowy:").grid(row=row, column=0, sticky=tk.W, padx=5, pady=5)
-        output_entry = ttk.Entry(dir_frame, textvariable=self.output_dir, width=70)
-        output_entry.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
-        ttk.Button(dir_frame, text="Przeglądaj...", command=self.browse_output).grid(row=row, column=2, padx=5, pady=5)
-        
-        row += 1
-        ttk.Button(dir_frame, text="Odśwież listę", command=self.refresh_list).grid(
-            row=row, column=0, columnspan=3, pady=10)
-        
-        dir_frame.columnconfigure(1, weight=1)
-        
-        list_frame = ttk.LabelFrame(main_frame, text="Próbki dźwiękowe")
-        list_frame.pack(fill=tk.BOTH, expand=True, pady=5)
-        list_frame.columnconfigure(0, weight=1)
-        list_frame.rowconfigure(0, weight=1)
-        
-        canvas = tk.Canvas(list_frame)
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=canvas.yview)
-        
-        self.scrollable_frame = ttk.Frame(canvas)
-        def configure_scrollregion(e):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-        self.scrollable_frame.bind("<Configure>", configure_scrollregion)
-        
-        canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
-        def on_mousewheel(event):
-            canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
-        canvas.bind_all("<MouseWheel>", on_mousewheel)
-        
-        canvas.grid(row=0, column=0, sticky="nsew")
-        scrollbar.grid(row=0, column=1, sticky="ns")
-        
-        bottom_frame = ttk.Frame(main_frame)
-        bottom_frame.pack(fill=tk.X, pady=10)
-        
-        self.process_btn = ttk.Button(
-            bottom_frame, text="Przetwórz zaznaczone", 
-            command=self.process_selected, width=20
-        )
-        self.process_btn.pack(side=tk.LEFT, padx=10)
-        
-        self.process_all_btn = ttk.Button(
-            bottom_frame, text="Przetwórz wszystkie", 
-            command=self.process_all, width=20
-        )
-        self.process_all_btn.pack(side=tk.LEFT, padx=10)
-        
-        status_frame = ttk.Frame(main_frame)
-        status_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(status_frame, text="Status:", font=("Arial", 9, "bold")).pack(side=tk.LEFT, padx=(10, 5))
-        self.status_label = ttk.Label(status_frame, textvariable=self.status, foreground="blue")
-        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+class StreamingReverbRemover:
+    """Maskowanie widmowe remove_reverb dla sygnału podawanego blokami.
+    
+    Ramki są te same co w remove_reverb - ramka jest liczona, gdy po jej
+    końcu jest już co najmniej jedna próbka. Próbki przed początkiem następnej
+    ramki są gotowe i zwracane od razu, więc w pamięci jest tylko bieżący
+    blok i ogon nakładania (okno - przesunięcie). Filtr 40 Hz i normalizację
+    wykonuje wywołujący.
+    """
+    def __init__(self, denoiser, strength):
+        self.denoiser = denoiser
+        self.strength = strength
+        self.window_size = denoiser.settings['window_size']
+        self.hop_size = self.window_size // 4
+        self.window = signal.windows.hann(self.window_size)
+        self.buffer = np.zeros(0)
+        self.clean = np.zeros(0)
+        self.weight = np.zeros(0)
+    
+    def process(self, block):
+        """Dodaje blok wejścia; zwraca próbki wyjścia, których nie zmieni już żadna ramka"""
+        self.buffer = np.concatenate((self.buffer, block))
+        num_frames = len(range(0, len(self.buffer) - self.window_size, self.hop_size))
+        if num_frames == 0:
+            return np.zeros(0)
+        
+        frames = np.lib.stride_tricks.sliding_window_view(self.buffer, self.window_size)[::self.hop_size][:num_frames]
+        clean_frames = self.denoiser.denoise_frames(frames, self.window, self.strength)
+        length = (num_frames - 1) * self.hop_size + self.window_size
+        self.clean = self._accumulate(self.clean, self.denoiser.overlap_add(clean_frames, self.hop_size, length))
+        self.weight = self._accumulate(self.weight, self.denoiser.overlap_add(
+            np.broadcast_to(self.window, clean_frames.shape), self.hop_size, length))
+        
+        ready = num_frames * self.hop_size
+        self.buffer = self.buffer[ready:]
+        return self._emit(ready)
+    
+    def flush(self):
+        """Reszta wyjścia po ostatnim bloku"""
+        return self._emit(len(self.buffer))
+    
+    def stream(self, blocks):
+        """Bloki wyjścia; puste (gdy blok wejścia nie domknął ramki) są pomijane"""
+        for block in blocks:
+            clean = self.process(block)
+            if len(clean):
+                yield clean
+        clean = self.flush()
+        if len(clean):
+            yield clean
+    
+    @staticmethod
+    def _accumulate(total, part):
+        if len(total) < len(part):
+            total = np.pad(total, (0, len(part) - len(total)))
+        total[:len(part)] += part
+        return total
+    
+    def _emit(self, count):
+        clean = np.pad(self.clean[:count], (0, max(0, count - len(self.clean))))
+        weight = np.pad(self.weight[:count], (0, max(0, count - len(self.weight))))
+        self.clean = self.clean[count:]
+        self.weight = self.weight[count:]
         
-        main_frame.columnconfigure(0, weight=1)
-        main_frame.rowconfigure(3, weight=1)
+        weight[weight < 1e-10] = 1.0
+        return clean / weight
+
+
+# Część pliku tymczasowego to (ścieżka, pierwsza próbka, długość)
+
+def _scaled_blocks(part, scale, fade_len, block_size, start=0, stop=None):
+    """Bloki części pliku (mono) pomnożone przez scale i obwiednię apply_fade(fade_len) całej części"""
+    path, offset, length = part
+    stop = length if stop is None else stop
+    position = start
+    for block in sf.blocks(path, blocksize=block_size, start=offset + start, stop=offset + stop):
+        if block.ndim > 1:
+            block = np.mean(block, axis=1)
+        end = position + len(block)
+        yield block * scale * _fade_gain(position, end, length, fade_len)
+        position = end
+
+
+def _fade_gain(start, stop, total, fade_len):
+    """Mnożniki apply_fade(fade_len) dla próbek [start, stop) sygnału o długości total"""
+    gain = np.ones(stop - start)
+    if fade_len <= 0 or total < 10:
+        return gain
+    index = np.arange(start, stop)
+    if total > fade_len:
+        head = index < fade_len
+        gain[head] *= np.linspace(0, 1, fade_len)[index[head]]
+        tail = index >= total - fade_len
+        gain[tail] *= np.linspace(1, 0, fade_len)[index[tail] - (total - fade_len)]
+    else:
+        gain *= np.linspace(0, 1, total)[start:stop]
+        gain *= np.linspace(1, 0, total)[start:stop]
+    return gain
+
+
+def _mixed_blocks(parts, length, fade_len, block_size):
+    """Średnia części (część, skala) z apply_fade, dopełnionych zerami do length"""
+    for start in range(0, length, block_size):
+        stop = min(start + block_size, length)
+        total = np.zeros(stop - start)
+        for part, scale in parts:
+            if start < part[2]:
+                for block in _scaled_blocks(part, scale, fade_len, block_size, start, min(stop, part[2])):
+                    total[:len(block)] += block
+        yield total / len(parts)
+
+
+def _peak(blocks):
+    return max((np.max(np.abs(block)) for block in blocks if len(block)), default=0.0)
+
+
+def _write_temp(path, blocks, sr):
+    """Zapisuje bloki do pliku float64; zwraca (część, szczyt)"""
+    length, peak = 0, 0.0
+    with sf.SoundFile(path, 'w', sr, 1, subtype='DOUBLE') as f:
+        for block in blocks:
+            if len(block):
+                f.write(block)
+                length += len(block)
+                peak = max(peak, np.max(np.abs(block)))
+    return (path, 0, length), peak
+
+
+def _filtfilt_to_file(b, a, blocks, path, sr, block_size):
+    """filtfilt(b, a) bloków z wynikiem w pliku; zwraca (część, szczyt).
+    
+    Przebieg w przód zapisuje plik, przebieg wstecz filtruje go od końca
+    i nadpisuje w miejscu. Rozszerzenie nieparzyste i warunki początkowe są
+    takie jak w scipy.signal.filtfilt, więc wynik jest identyczny.
+    """
+    padlen = 3 * max(len(a), len(b))
+    zi = signal.lfilter_zi(b, a)
+    head, state, last, length = np.zeros(0), None, np.zeros(0), 0
+    
+    with sf.SoundFile(path, 'w+', sr, 1, subtype='DOUBLE') as f:
+        for block in blocks:
+            # lfilter dla pustego wejścia zwraca nieokreślony stan końcowy
+            if len(block) == 0:
+                continue
+            if state is None:
+                # Początek rozszerzenia wymaga padlen + 1 pierwszych próbek
+                head = np.concatenate((head, block))
+                if len(head) <= padlen:
+                    continue
+                block, head = head, 2 * head[0] - head[padlen:0:-1]
+                y, state = signal.lfilter(b, a, head, zi=zi * head[0])
+                f.write(y)
+            y, state = signal.lfilter(b, a, block, zi=state)
+            f.write(y)
+            length += len(block)
+            last = np.concatenate((last, block))[-(padlen + 1):]
+        if state is None:
+            raise ValueError(f"The length of the input vector x must be greater than padlen, which is {padlen}.")
+        tail = 2 * last[-1] - last[-2::-1]
+        y, state = signal.lfilter(b, a, tail, zi=state)
+        f.write(y)
+        
+        # Przebieg wstecz w miejscu, od końca pliku
+        position = f.frames
+        state = zi * y[-1]
+        peak = 0.0
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            block = f.read(position - start)
+            y, state = signal.lfilter(b, a, block[::-1], zi=state)
+            f.seek(start)
+            f.write(y[::-1])
+            # Szczyt tylko z części bez rozszerzeń
+            lo, hi = max(start, padlen), min(position, padlen + length)
+            if hi > lo:
+                peak = max(peak, np.max(np.abs(y[::-1][lo - start:hi - start])))
+            position = start
+    return (path, padlen, length), peak
+
+
+def find_notes(root_dir):
+    """Nuty w układzie <root>/A0/*.wav z wybrzmieniami <root>/R0..R3/<ta sama nazwa>"""
+    a0_dir = os.path.join(root_dir, "A0")
+    if not os.path.isdir(a0_dir):
+        raise FileNotFoundError(f"Nie znaleziono folderu A0 w {root_dir}")
+    
+    notes = []
+    for note_file in sorted(f for f in os.listdir(a0_dir) if f.endswith('.wav')):
+        r_files = [os.path.join(root_dir, r_dir, note_file) for r_dir in R_DIRS]
+        notes.append({
+            'name': os.path.splitext(note_file)[0],
+            'a0': os.path.join(a0_dir, note_file),
+            'r': [path for path in r_files if os.path.exists(path)]
+        })
+    return notes
 
-    def open_settings(self):
-        SettingsDialog(self.root, self.denoiser.settings)
-        
-    def browse_root(self):
-        directory = filedialog.askdirectory(title="Wybierz folder główny")
-        if directory:
-            self.root_dir.set(directory)
-            self.refresh_list()
-
-    def browse_output(self):
-        directory = filedialog.askdirectory(title="Wybierz folder wyjściowy")
-        if directory:
-            self.output_dir.set(directory)
-
-    def refresh_list(self):
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        self.files = []
-        self.check_vars = []
-        
-        root_dir = self.root_dir.get()
-        if not root_dir or not os.path.exists(root_dir):
-            self.status.set("Błąd: Nie znaleziono folderu głównego")
-            return
-            
-        a0_dir = os.path.join(root_dir, "A0")
-        if not os.path.exists(a0_dir):
-            self.status.set("Błąd: Nie znaleziono folderu A0")
-            return
-            
-        note_files = [f for f in os.listdir(a0_dir) if f.endswith('.wav')]
-        
-        header_frame = ttk.Frame(self.scrollable_frame)
-        header_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(header_frame, text="Przetwarzaj", width=8).pack(side=tk.LEFT, padx=10)
-        ttk.Label(header_frame, text="Nazwa próbki", width=40).pack(side=tk.LEFT, padx=10)
-        ttk.Label(header_frame, text="Pliki R", width=10).pack(side=tk.LEFT, padx=10)
-        ttk.Label(header_frame, text="Status", width=30).pack(side=tk.LEFT, padx=10)
-        
-        for note_file in sorted(note_files):
-            base_name = os.path.splitext(note_file)[0]
-            
-            r_files = []
-            for r_dir in ["R0", "R1", "R2", "R3"]:
-                r_path = os.path.join(root_dir, r_dir, note_file)
-                if os.path.exists(r_path):
-                    r_files.append(r_path)
-            
-            item_frame = ttk.Frame(self.scrollable_frame)
-            item_frame.pack(fill=tk.X, pady=3)
-            
-            chk_var = tk.BooleanVar(value=True)
-            self.check_vars.append(chk_var)
-            chk = ttk.Checkbutton(item_frame, variable=chk_var)
-            chk.pack(side=tk.LEFT, padx=10)
-            
-            ttk.Label(item_frame, text=base_name, width=45, anchor="w").pack(side=tk.LEFT, padx=10)
-            ttk.Label(item_frame, text=str(len(r_files)), width=10, anchor="center").pack(side=tk.LEFT, padx=10)
-            
-            status_var = tk.StringVar(value="Gotowy")
-            status_label = ttk.Label(item_frame, textvariable=status_var, width=35, anchor="w", foreground="blue")
-            status_label.pack(side=tk.LEFT, padx=10)
-            
-            self.files.append({
-                'a0': os.path.join(a0_dir, note_file),
-                'r': r_files,
-                'status_var': status_var,
-                'label': status_label,
-                'name': base_name
-            })
-            
-        self.status.set(f"Znaleziono {len(self.files)} próbek w folderze A0")
 
-    def select_all(self):
-        for var in self.check_vars:
-            var.set(True)
+def output_path_for(output_dir, name):
+    return os.path.join(output_dir, name + "_denoised.wav")
 
-    def deselect_all(self):
-        for var in self.check_vars:
-            var.set(False)
 
-    def check_queue(self):
+def file_hash(path):
+    """SHA-256 zawartości pliku"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IntermediateCache:
+    """Wyniki pośrednie (odszumione R, uśrednione R) jako .npy pod skrótem wejść.
+    
+    Zapis jest atomowy, więc katalog może być współdzielony przez procesy
+    puli. Tablice zapisywane są jako float32 i zawsze używana jest wersja
+    z cache, więc pierwszy i kolejny przebieg dają ten sam wynik.
+    """
+    def __init__(self, cache_dir, hashes=None):
+        self.cache_dir = cache_dir
+        self.hashes = dict(hashes or {})
+        self.used = []
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        if path not in self.hashes:
+            self.hashes[path] = file_hash(path)
+        return self.hashes[path]
+    
+    def key(self, *parts):
+        encoded = json.dumps([MANIFEST_VERSION, *parts], sort_keys=True, default=float)
+        key = hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+        self.used.append(key)
+        return key
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npy')
+    
+    def get(self, key):
         try:
-            while True:
-                msg = self.progress_queue.get_nowait()
-                if msg[0] == 'update':
-                    idx, status = msg[1], msg[2]
-                    self.files[idx]['status_var'].set(status)
-                    if "Przetwarzanie" in status:
-                        self.files[idx]['label'].configure(foreground="blue")
-                    elif "Gotowy" in status or "Zakończono" in status:
-                        self.files[idx]['label'].configure(foreground="green")
-                    elif "Błąd" in status:
-                        self.files[idx]['label'].configure(foreground="red")
-                elif msg[0] == 'success':
-                    self.status.set(f"Przetworzono: {msg[1]}")
-                elif msg[0] == 'error':
-                    self.status.set(f"Błąd: {msg[1]}")
-                self.progress_queue.task_done()
-        except queue.Empty:
+            return np.load(self._path(key), mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    def put(self, key, audio):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(audio, dtype=np.float32))
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode='r')
+    
+    def prune(self, keep):
+        """Usuwa wpisy spoza keep"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npy') and name[:-4] not in keep:
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+class DenoiseManifest:
+    """Manifest folderu wyjściowego: dla każdego pliku skróty wejść i ustawień.
+    
+    Nuta jest aktualna, gdy plik wyjściowy istnieje, a skróty A0, plików R
+    i ustawień są takie jak przy jej zapisie. Skróty plików są odświeżane
+    tylko przy zmianie rozmiaru lub czasu modyfikacji.
+    """
+    FILENAME = '.denoise_manifest.json'
+    CACHE_DIR = '.denoise_cache'
+    
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, self.FILENAME)
+        self.cache_dir = os.path.join(output_dir, self.CACHE_DIR)
+        self.outputs, self.files = {}, {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.outputs, self.files = data['outputs'], data['files']
+        except (FileNotFoundError, ValueError):
             pass
-        self.root.after(200, self.check_queue)
-
-    def worker(self, idx):
-        file_info = self.files[idx]
-        self.progress_queue.put(('update', idx, "Przetwarzanie..."))
-        output_filename = file_info['name'] + "_denoised.wav"
-        output_path = os.path.join(self.output_dir.get(), output_filename)
-        success = self.denoiser.process_note(
-            file_info['a0'], file_info['r'], output_path, self.progress_queue)
-        if success:
-            self.progress_queue.put(('update', idx, "Gotowy"))
-        else:
-            self.progress_queue.put(('update', idx, "Błąd"))
     
-    def process_selected(self):
-        if not os.path.exists(self.output_dir.get()):
-            os.makedirs(self.output_dir.get())
-        
-        for idx, var in enumerate(self.check_vars):
-            if var.get():
-                Thread(target=self.worker, args=(idx,), daemon=True).start()
-        
-    def process_all(self):
-        if not os.path.exists(self.output_dir.get()):
-            os.makedirs(self.output_dir.get())
-        
-        for idx in range(len(self.files)):
-            Thread(target=self.worker, args=(idx,), daemon=True).start()
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known is None or known['size'] != stat.st_size or known['mtime_ns'] != stat.st_mtime_ns:
+            known = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash(path)}
+            self.files[path] = known
+        return known['sha256']
+    
+    def entry(self, note, settings):
+        """Opis wejść nuty do porównania z zapisanym"""
+        encoded = json.dumps(settings, sort_keys=True, default=float)
+        return {
+            'inputs': {os.path.abspath(path): self.file_hash(path) for path in [note['a0'], *note['r']]},
+            'settings': hashlib.sha256(encoded.encode('utf-8')).hexdigest(),
+        }
+    
+    def is_current(self, output_path, entry):
+        stored = self.outputs.get(os.path.basename(output_path))
+        return (stored is not None and os.path.exists(output_path)
+                and stored['inputs'] == entry['inputs'] and stored['settings'] == entry['settings'])
+    
+    def record(self, output_path, entry, intermediates):
+        self.outputs[os.path.basename(output_path)] = dict(entry, intermediates=intermediates)
+    
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'outputs': self.outputs, 'files': self.files}, f, indent=1)
+        os.replace(tmp_path, self.path)
+    
+    def prune_cache(self):
+        """Usuwa wyniki pośrednie, do których nie odwołuje się żaden plik wyjściowy"""
+        keep = {key for stored in self.outputs.values() for key in stored.get('intermediates', [])}
+        if os.path.isdir(self.cache_dir):
+            IntermediateCache(self.cache_dir).prune(keep)
+
+
+def _denoise_task(a0_path, r_paths, output_path, settings, stream=False, cache_dir=None, hashes=None):
+    """Zadanie procesu roboczego - osobny denoiser z migawką ustawień.
+    
+    Zwraca (czas, liczba próbek, klucze użytych wyników pośrednich).
+    """
+    start = time.perf_counter()
+    denoiser = PipeDenoiser(settings)
+    cache = IntermediateCache(cache_dir, hashes) if cache_dir else None
+    if stream:
+        samples = denoiser.stream_note(a0_path, r_paths, output_path)
+    else:
+        samples = denoiser.denoise_note(a0_path, r_paths, output_path, cache)
+    return time.perf_counter() - start, samples, cache.used if cache is not None else []
+
+
+class BatchDenoiser:
+    """Ograniczona pula procesów odszumiających nuty (wspólna dla GUI i trybu wsadowego).
+    
+    Każde zadanie dostaje kopię ustawień z chwili zlecenia, więc zmiana
+    ustawień w trakcie nie wpływa na zadania już w kolejce.
+    """
+    def __init__(self, jobs=None, stream=False):
+        self.executor = ProcessPoolExecutor(max_workers=jobs)
+        self.stream = stream
+        self.pending = set()
+        
+    def submit(self, note, output_dir, settings, hashes=None):
+        cache_dir = os.path.join(output_dir, DenoiseManifest.CACHE_DIR)
+        future = self.executor.submit(_denoise_task, note['a0'], note['r'],
+                                      output_path_for(output_dir, note['name']), dict(settings), self.stream,
+                                      cache_dir, hashes)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+    
+    def run(self, notes, output_dir, settings, log=print, force=False):
+        """Przetwarza nuty i raportuje postęp; zwraca listę (nazwa, błąd) dla nieudanych.
+        
+        Nuty, których wejścia i ustawienia nie zmieniły się od ostatniego
+        zapisu (DenoiseManifest), są pomijane, chyba że force=True.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = DenoiseManifest(output_dir)
+        start = time.perf_counter()
+        total_samples = 0
+        failures = []
+        
+        futures = {}
+        for note in notes:
+            output_path = output_path_for(output_dir, note['name'])
+            entry = manifest.entry(note, settings)
+            if not force and manifest.is_current(output_path, entry):
+                log(f"Bez zmian: {note['name']}")
+                continue
+            futures[self.submit(note, output_dir, settings, entry['inputs'])] = (note, output_path, entry)
+        
+        for done, future in enumerate(as_completed(futures), 1):
+            note, output_path, entry = futures[future]
+            name = note['name']
+            try:
+                elapsed, samples, intermediates = future.result()
+                total_samples += samples
+                manifest.record(output_path, entry, intermediates)
+                manifest.save()
+                log(f"[{done}/{len(futures)}] {name} ({elapsed:.1f} s, {samples / elapsed / 1e6:.2f} Mpr/s)")
+            except Exception as e:
+                failures.append((name, e))
+                log(f"[{done}/{len(futures)}] Błąd {name}: {e}")
+        
+        manifest.save()
+        manifest.prune_cache()
+        elapsed = time.perf_counter() - start
+        if futures:
+            log(f"Przetworzono {len(futures) - len(failures)}/{len(futures)} nut w {elapsed:.1f} s "
+                f"({len(futures) / elapsed:.2f} nut/s, {total_samples / elapsed / 1e6:.2f} Mpr/s)")
+        return failures
+    
+    def shutdown(self, wait=True):
+        """Przy wait=False zadania jeszcze nierozpoczęte są anulowane"""
+        if not wait:
+            for future in list(self.pending):
+                future.cancel()
+        self.executor.shutdown(wait=wait)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wsadowe odszumianie próbek w układzie A0/R0..R3 (bez GUI)")
+    parser.add_argument('root', help="folder główny zawierający A0 i R0..R3")
+    parser.add_argument('--output', default='denoised_output', help="folder wyjściowy")
+    parser.add_argument('--jobs', type=int, default=None, help="liczba procesów (domyślnie liczba rdzeni)")
+    parser.add_argument('--settings', help="plik JSON z ustawieniami nadpisującymi domyślne")
+    parser.add_argument('--stream', action='store_true',
+                        help="przetwarzanie strumieniowe (stała pamięć, dla długich nagrań)")
+    parser.add_argument('--force', action='store_true',
+                        help="przetwórz wszystkie nuty, także niezmienione od ostatniego przebiegu")
+    args = parser.parse_args(argv)
+    
+    settings = PipeDenoiser().settings
+    if args.settings:
+        with open(args.settings, encoding='utf-8') as f:
+            settings.update(json.load(f))
+    
+    try:
+        notes = find_notes(args.root)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    
+    batch = BatchDenoiser(args.jobs, args.stream)
+    try:
+        failures = batch.run(notes, args.output, settings, force=args.force)
+    finally:
+        batch.shutdown()
+    return 1 if failures else 0
+
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = DenoiserGUI(root)
-    root.mainloop()
+    # Z argumentami - tryb wsadowy bez GUI (np. na serwerze bez ekranu)
+    if len(sys.argv) > 1:
+        sys.exit(main())
+    # GUI (tkinter) importowane dopiero tutaj - tryb wsadowy i procesy puli działają bez niego
+    try:
+        from tools.denoising_gui import run_gui
+    except ImportError:
+        from denoising_gui import run_gui
+    run_gui()
@@ -0,0 +1,353 @@
+"""Okno (tkinter) do odszumiania wybranych nut; przetwarzanie jest w denoising.py.
+
+Oddzielny moduł, żeby tryb wsadowy i procesy puli importowały denoising bez tkinter.
+"""
+import os
+import queue
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import filedialog, ttk, simpledialog
+
+try:
+    from tools.denoising import PipeDenoiser, BatchDenoiser, DenoiseManifest, find_notes, output_path_for
+except ImportError:  # uruchomienie jako skrypt: python tools/denoising.py
+    from denoising import PipeDenoiser, BatchDenoiser, DenoiseManifest, find_notes, output_path_for
+
+
+class SettingsDialog(tk.simpledialog.Dialog):
+    def __init__(self, parent, settings):
+        self.settings = settings
+        super().__init__(parent, "Zaawansowane ustawienia")
+        
+    def body(self, master):
+        ttk.Label(master, text="Siła redukcji głównej (0.1-0.9):").grid(row=0, sticky=tk.W)
+        self.strength = tk.DoubleVar(value=self.settings['strength'])
+        ttk.Scale(master, from_=0.1, to=0.9, variable=self.strength, 
+                 orient=tk.HORIZONTAL, length=200).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Label(master, textvariable=self.strength).grid(row=0, column=2)
+        
+        ttk.Label(master, text="Dodatkowa siła dla R (0.0-0.3):").grid(row=1, sticky=tk.W)
+        self.extra = tk.DoubleVar(value=self.settings['extra_strength'])
+        ttk.Scale(master, from_=0.0, to=0.3, variable=self.extra, 
+                 orient=tk.HORIZONTAL, length=200).grid(row=1, column=1, padx=5, pady=5)
+        ttk.Label(master, textvariable=self.extra).grid(row=1, column=2)
+        
+        ttk.Label(master, text="Rozmiar okna analizy:").grid(row=2, sticky=tk.W)
+        self.window = tk.IntVar(value=self.settings['window_size'])
+        ttk.Combobox(master, textvariable=self.window, 
+                    values=[1024, 2048, 4096, 8192], width=8).grid(row=2, column=1, sticky=tk.W)
+        
+        ttk.Label(master, text="Crossfade (sekundy):").grid(row=3, sticky=tk.W)
+        self.crossfade = tk.DoubleVar(value=self.settings['crossfade'])
+        ttk.Spinbox(master, from_=0.1, to=3.0, increment=0.1, 
+                   textvariable=self.crossfade, width=5).grid(row=3, column=1, sticky=tk.W)
+        
+        self.hp_var = tk.BooleanVar(value=self.settings['hp_filter'])
+        ttk.Checkbutton(master, text="Filtr wysokoprzepustowy (40 Hz)", 
+                       variable=self.hp_var).grid(row=4, column=0, columnspan=2, sticky=tk.W)
+
+        # Nowa opcja generowania syntetycznego R (szum)
+        self.gen_synthetic_r_var = tk.BooleanVar(value=self.settings.get('generate_synthetic_r', False))
+        ttk.Checkbutton(master, text="Generuj syntetyczne R (szum)", variable=self.gen_synthetic_r_var).grid(row=5, column=0, columnspan=2, sticky=tk.W)
+
+        # Nowa opcja generowania syntetycznego R z fazy Sustain
+        self.gen_sustain_r_var = tk.BooleanVar(value=self.settings.get('synthetic_r_from_sustain', False))
+        ttk.Checkbutton(master, text="Generuj syntetyczne R z fazy Sustain (ogon)", variable=self.gen_sustain_r_var).grid(row=6, column=0, columnspan=2, sticky=tk.W)
+
+        return master
+    
+    def apply(self):
+        self.settings['strength'] = round(self.strength.get(), 2)
+        self.settings['extra_strength'] = round(self.extra.get(), 2)
+        self.settings['window_size'] = self.window.get()
+        self.settings['hp_filter'] = self.hp_var.get()
+        self.settings['crossfade'] = self.crossfade.get()
+        self.settings['generate_synthetic_r'] = self.gen_synthetic_r_var.get()
+        self.settings['synthetic_r_from_sustain'] = self.gen_sustain_r_var.get()
+
+
+class DenoiserGUI:
+    def __init__(self, root):
+        self.root = root
+        root.title("Organ Pipe Denoiser")
+        root.geometry("1200x800")
+        
+        self.denoiser = PipeDenoiser()
+        self.batch = None
+        self.manifests = {}
+        # Skróty plików wejściowych i zapis manifestów - jeden wątek poza pętlą Tk
+        self.manifest_worker = ThreadPoolExecutor(max_workers=1)
+        self.closing = False
+        self.progress_queue = queue.Queue()
+        
+        self.root_dir = tk.StringVar()
+        self.output_dir = tk.StringVar(value=os.path.join(os.getcwd(), "denoised_output"))
+        self.status = tk.StringVar(value="Gotowy")
+        self.files = []
+        self.check_vars = []
+        
+        self.create_widgets()
+        self.check_queue()
+        root.protocol("WM_DELETE_WINDOW", self.close)
+        
+        root.update_idletasks()
+        width = root.winfo_width()
+        height = root.winfo_height()
+        x = (root.winfo_screenwidth() // 2) - (width // 2)
+        y = (root.winfo_screenheight() // 2) - (height // 2)
+        root.geometry(f"{width}x{height}+{x}+{y}")
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self.root)
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        top_frame = ttk.Frame(main_frame)
+        top_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Button(top_frame, text="Ustawienia", command=self.open_settings).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="Zaznacz wszystkie", command=self.select_all).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="Odznacz wszystkie", command=self.deselect_all).pack(side=tk.LEFT, padx=5)
+        
+        dir_frame = ttk.LabelFrame(main_frame, text="Foldery")
+        dir_frame.pack(fill=tk.X, pady=5)
+        
+        row = 0
+        ttk.Label(dir_frame, text="Główny folder:").grid(row=row, column=0, sticky=tk.W, padx=5, pady=5)
+        root_entry = ttk.Entry(dir_frame, textvariable=self.root_dir, width=70)
+        root_entry.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        ttk.Button(dir_frame, text="Przeglądaj...", command=self.browse_root).grid(row=row, column=2, padx=5, pady=5)
+        
+        row += 1
+        ttk.Label(dir_frame, text="Folder wyjściowy:").grid(row=row, column=0, sticky=tk.W, padx=5, pady=5)
+        output_entry = ttk.Entry(dir_frame, textvariable=self.output_dir, width=70)
+        output_entry.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        ttk.Button(dir_frame, text="Przeglądaj...", command=self.browse_output).grid(row=row, column=2, padx=5, pady=5)
+        
+        row += 1
+        ttk.Button(dir_frame, text="Odśwież listę", command=self.refresh_list).grid(
+            row=row, column=0, columnspan=3, pady=10)
+        
+        dir_frame.columnconfigure(1, weight=1)
+        
+        list_frame = ttk.LabelFrame(main_frame, text="Próbki dźwiękowe")
+        list_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        list_frame.columnconfigure(0, weight=1)
+        list_frame.rowconfigure(0, weight=1)
+        
+        canvas = tk.Canvas(list_frame)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=canvas.yview)
+        
+        self.scrollable_frame = ttk.Frame(canvas)
+        def configure_scrollregion(e):
+            canvas.configure(scrollregion=canvas.bbox("all"))
+        self.scrollable_frame.bind("<Configure>", configure_scrollregion)
+        
+        canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
+        canvas.configure(yscrollcommand=scrollbar.set)
+        
+        def on_mousewheel(event):
+            canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+        canvas.bind_all("<MouseWheel>", on_mousewheel)
+        
+        canvas.grid(row=0, column=0, sticky="nsew")
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        
+        bottom_frame = ttk.Frame(main_frame)
+        bottom_frame.pack(fill=tk.X, pady=10)
+        
+        self.process_btn = ttk.Button(
+            bottom_frame, text="Przetwórz zaznaczone", 
+            command=self.process_selected, width=20
+        )
+        self.process_btn.pack(side=tk.LEFT, padx=10)
+        
+        self.process_all_btn = ttk.Button(
+            bottom_frame, text="Przetwórz wszystkie", 
+            command=self.process_all, width=20
+        )
+        self.process_all_btn.pack(side=tk.LEFT, padx=10)
+        
+        status_frame = ttk.Frame(main_frame)
+        status_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(status_frame, text="Status:", font=("Arial", 9, "bold")).pack(side=tk.LEFT, padx=(10, 5))
+        self.status_label = ttk.Label(status_frame, textvariable=self.status, foreground="blue")
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        main_frame.columnconfigure(0, weight=1)
+        main_frame.rowconfigure(3, weight=1)
+
+    def open_settings(self):
+        SettingsDialog(self.root, self.denoiser.settings)
+        
+    def browse_root(self):
+        directory = filedialog.askdirectory(title="Wybierz folder główny")
+        if directory:
+            self.root_dir.set(directory)
+            self.refresh_list()
+
+    def browse_output(self):
+        directory = filedialog.askdirectory(title="Wybierz folder wyjściowy")
+        if directory:
+            self.output_dir.set(directory)
+
+    def refresh_list(self):
+        for widget in self.scrollable_frame.winfo_children():
+            widget.destroy()
+        
+        self.files = []
+        self.check_vars = []
+        
+        root_dir = self.root_dir.get()
+        if not root_dir or not os.path.exists(root_dir):
+            self.status.set("Błąd: Nie znaleziono folderu głównego")
+            return
+            
+        try:
+            notes = find_notes(root_dir)
+        except FileNotFoundError:
+            self.status.set("Błąd: Nie znaleziono folderu A0")
+            return
+        
+        header_frame = ttk.Frame(self.scrollable_frame)
+        header_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(header_frame, text="Przetwarzaj", width=8).pack(side=tk.LEFT, padx=10)
+        ttk.Label(header_frame, text="Nazwa próbki", width=40).pack(side=tk.LEFT, padx=10)
+        ttk.Label(header_frame, text="Pliki R", width=10).pack(side=tk.LEFT, padx=10)
+        ttk.Label(header_frame, text="Status", width=30).pack(side=tk.LEFT, padx=10)
+        
+        for note in notes:
+            item_frame = ttk.Frame(self.scrollable_frame)
+            item_frame.pack(fill=tk.X, pady=3)
+            
+            chk_var = tk.BooleanVar(value=True)
+            self.check_vars.append(chk_var)
+            chk = ttk.Checkbutton(item_frame, variable=chk_var)
+            chk.pack(side=tk.LEFT, padx=10)
+            
+            ttk.Label(item_frame, text=note['name'], width=45, anchor="w").pack(side=tk.LEFT, padx=10)
+            ttk.Label(item_frame, text=str(len(note['r'])), width=10, anchor="center").pack(side=tk.LEFT, padx=10)
+            
+            status_var = tk.StringVar(value="Gotowy")
+            status_label = ttk.Label(item_frame, textvariable=status_var, width=35, anchor="w", foreground="blue")
+            status_label.pack(side=tk.LEFT, padx=10)
+            
+            self.files.append(dict(note, status_var=status_var, label=status_label))
+            
+        self.status.set(f"Znaleziono {len(self.files)} próbek w folderze A0")
+
+    def select_all(self):
+        for var in self.check_vars:
+            var.set(True)
+
+    def deselect_all(self):
+        for var in self.check_vars:
+            var.set(False)
+
+    def check_queue(self):
+        try:
+            while True:
+                msg = self.progress_queue.get_nowait()
+                if msg[0] == 'update':
+                    idx, status = msg[1], msg[2]
+                    self.files[idx]['status_var'].set(status)
+                    if "Przetwarzanie" in status:
+                        self.files[idx]['label'].configure(foreground="blue")
+                    elif "Gotowy" in status or "Zakończono" in status:
+                        self.files[idx]['label'].configure(foreground="green")
+                    elif "Błąd" in status:
+                        self.files[idx]['label'].configure(foreground="red")
+                elif msg[0] == 'success':
+                    self.status.set(f"Przetworzono: {msg[1]}")
+                elif msg[0] == 'error':
+                    self.status.set(f"Błąd: {msg[1]}")
+                self.progress_queue.task_done()
+        except queue.Empty:
+            pass
+        self.root.after(200, self.check_queue)
+
+    def submit(self, indices):
+        """Zleca nuty wspólnej puli procesów; wynik wraca przez progress_queue.
+        
+        Skróty wejść (czytanie całych plików) liczy wątek manifestu, który
+        dopiero potem przekazuje nutę puli - okno nie czeka na dysk.
+        """
+        if self.batch is None:
+            self.batch = BatchDenoiser()
+        output_dir = self.output_dir.get()
+        if output_dir not in self.manifests:
+            self.manifests[output_dir] = DenoiseManifest(output_dir)
+        manifest = self.manifests[output_dir]
+        settings = dict(self.denoiser.settings)
+        for idx in indices:
+            self.progress_queue.put(('update', idx, "Przetwarzanie..."))
+            self.manifest_worker.submit(self.submit_note, idx, self.files[idx], manifest, output_dir, settings)
+    
+    def submit_note(self, idx, note, manifest, output_dir, settings):
+        # Wątek manifestu - tylko kolejka, bez dostępu do widżetów
+        if self.closing:
+            return
+        try:
+            entry = manifest.entry(note, settings)
+        except OSError as e:
+            self.progress_queue.put(('error', f"{note['name']}: {str(e)}"))
+            self.progress_queue.put(('update', idx, "Błąd"))
+            return
+        future = self.batch.submit(note, output_dir, settings, entry['inputs'])
+        future.add_done_callback(lambda f: self.task_done(idx, note, f, manifest, output_dir, entry))
+    
+    def task_done(self, idx, note, future, manifest, output_dir, entry):
+        # Wywoływane z wątku puli - tylko kolejka i wątek manifestu, bez dostępu do widżetów
+        output_path = output_path_for(output_dir, note['name'])
+        try:
+            intermediates = future.result()[2]
+        except Exception as e:
+            self.progress_queue.put(('error', f"{note['name']}: {str(e)}"))
+            self.progress_queue.put(('update', idx, "Błąd"))
+        else:
+            if not self.closing:
+                self.manifest_worker.submit(self.record, manifest, output_path, entry, intermediates)
+            self.progress_queue.put(('success', os.path.basename(output_path)))
+            self.progress_queue.put(('update', idx, "Gotowy"))
+    
+    @staticmethod
+    def record(manifest, output_path, entry, intermediates):
+        # Zapis w manifeście folderu wyjściowego, jak w trybie wsadowym -
+        # prune_cache przy zamknięciu zachowa tylko używane wyniki pośrednie
+        manifest.record(output_path, entry, intermediates)
+        manifest.save()
+    
+    def process_selected(self):
+        if not os.path.exists(self.output_dir.get()):
+            os.makedirs(self.output_dir.get())
+        
+        self.submit([idx for idx, var in enumerate(self.check_vars) if var.get()])
+        
+    def process_all(self):
+        if not os.path.exists(self.output_dir.get()):
+            os.makedirs(self.output_dir.get())
+        
+        self.submit(range(len(self.files)))
+    
+    def close(self):
+        # Nuty czekające na skróty nie trafią już do puli
+        self.closing = True
+        if self.batch is not None:
+            self.batch.shutdown(wait=False)
+        # Wyniki pośrednie nieużywane przez żaden zapisany plik wyjściowy -
+        # po zapisach już zleconych wątkowi manifestu
+        for manifest in self.manifests.values():
+            self.manifest_worker.submit(manifest.prune_cache)
+        self.manifest_worker.shutdown(wait=True)
+        self.root.destroy()
+
+
+def run_gui():
+    root = tk.Tk()
+    app = DenoiserGUI(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    run_gui()
@@ -0,0 +1,43 @@
+"""Zmiana częstotliwości próbkowania filtrem polifazowym (wspólna dla narzędzi).
+
+Dla par częstotliwości o małym wspólnym stosunku (44.1k <-> 48k <-> 96k,
+np. 160/147) używane jest signal.resample_poly, którego koszt jest liniowy
+względem długości i nie wymaga zespolonych buforów długości całego pliku,
+jak FFT w signal.resample. Projekt filtru FIR jest liczony raz na stosunek.
+"""
+import functools
+import math
+
+import numpy as np
+from scipy import signal
+
+# Powyżej tego czynnika filtr polifazowy byłby dłuższy niż opłacalne - wtedy FFT
+MAX_FACTOR = 1000
+
+
+def ratio(from_rate, to_rate):
+    """Skrócony stosunek (up, down) dla from_rate -> to_rate"""
+    from_rate, to_rate = int(round(from_rate)), int(round(to_rate))
+    divisor = math.gcd(from_rate, to_rate)
+    return to_rate // divisor, from_rate // divisor
+
+
+@functools.lru_cache(maxsize=None)
+def design(up, down):
+    """Filtr antyaliasingowy dla (up, down), taki sam jak domyślny w resample_poly"""
+    max_rate = max(up, down)
+    taps = signal.firwin(2 * 10 * max_rate + 1, 1 / max_rate, window=('kaiser', 5.0))
+    taps.setflags(write=False)
+    return taps
+
+
+def resample(audio, from_rate, to_rate, axis=-1):
+    """Zwraca audio w to_rate; długość to floor(len * to_rate / from_rate) jak przy signal.resample"""
+    if from_rate == to_rate:
+        return audio
+    length = int(audio.shape[axis] * to_rate / from_rate)
+    up, down = ratio(from_rate, to_rate)
+    if max(up, down) > MAX_FACTOR:
+        return signal.resample(audio, length, axis=axis)
+    output = signal.resample_poly(audio, up, down, axis=axis, window=np.array(design(up, down)))
+    return np.take(output, np.arange(length), axis=axis)